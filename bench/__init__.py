@@ -0,0 +1,17 @@
+"""Offline benchmark harness: corpus, replay server and scenarios."""
+
+from .corpus import Corpus, CorpusRecorder, record_corpus, synthetic_corpus
+from .scenarios import SCENARIOS, crawl_scenario, parse_scenario
+from .server import ReplayConditions, ReplayServer
+
+__all__ = [
+    "Corpus",
+    "CorpusRecorder",
+    "record_corpus",
+    "synthetic_corpus",
+    "ReplayConditions",
+    "ReplayServer",
+    "SCENARIOS",
+    "crawl_scenario",
+    "parse_scenario",
+]
@@ -0,0 +1,194 @@
+import argparse
+import json
+import logging
+from pathlib import Path
+
+from tuoitre_crawler.cli import configure_logging
+
+from .corpus import record_corpus, synthetic_corpus
+from .redis_standin import RespStandIn
+from .scenarios import SCENARIOS, environment, serve_forever
+from .server import ReplayConditions
+
+
+def add_condition_args(parser):
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added per response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Uniform +/- seconds on --latency")
+    parser.add_argument(
+        "--throttle-rate", type=float, default=0.0, help="Probability of answering 429"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="Probability of answering a 5xx"
+    )
+    parser.add_argument(
+        "--retry-after", type=int, default=1, help="Retry-After seconds sent with a 429"
+    )
+    parser.add_argument(
+        "--bandwidth", type=int, default=0, help="Per-response cap in bytes per second (0 disables)"
+    )
+    parser.add_argument(
+        "--server-rate",
+        type=float,
+        default=0.0,
+        help="Answer 429 above this many requests per second, like the site's limiter",
+    )
+    parser.add_argument(
+        "--no-total",
+        dest="report_total",
+        action="store_false",
+        help="Omit TotalCount from comment API pages",
+    )
+    parser.add_argument("--seed", type=int, default=None, help="Seed for jitter and faults")
+
+
+def conditions_from_args(args):
+    return ReplayConditions(
+        latency=args.latency,
+        jitter=args.jitter,
+        throttle_rate=args.throttle_rate,
+        error_rate=args.error_rate,
+        retry_after=args.retry_after,
+        bandwidth=args.bandwidth,
+        report_total=args.report_total,
+        server_rate=args.server_rate,
+        seed=args.seed,
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        prog="python -m bench", description="Offline benchmarks for the tuoitre crawler"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    synth = commands.add_parser("synth", help="Generate a synthetic corpus")
+    synth.add_argument("corpus", type=Path)
+    synth.add_argument("--categories", type=int, default=3)
+    synth.add_argument("--pages-per-category", type=int, default=4)
+    synth.add_argument("--posts-per-page", type=int, default=20)
+    synth.add_argument("--max-comments", type=int, default=400)
+    synth.add_argument("--media-kb", type=int, default=64)
+
+    record = commands.add_parser("record", help="Record a corpus from the live site")
+    record.add_argument("corpus", type=Path)
+    record.add_argument("--category", dest="categories", action="append", required=True)
+    record.add_argument("--posts-per-category", type=int, default=10)
+    record.add_argument("--delay", type=float, default=0.6)
+
+    serve = commands.add_parser("serve", help="Replay a corpus over HTTP")
+    serve.add_argument("corpus", type=Path)
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    add_condition_args(serve)
+
+    redis = commands.add_parser(
+        "redis", help="Serve an in-memory Redis stand-in for the distributed work queue"
+    )
+    redis.add_argument("--host", default="127.0.0.1")
+    redis.add_argument("--port", type=int, default=6379)
+
+    run = commands.add_parser("run", help="Run benchmark scenarios against a corpus")
+    run.add_argument("corpus", type=Path)
+    run.add_argument(
+        "--scenario",
+        dest="scenarios",
+        action="append",
+        choices=sorted(SCENARIOS),
+        help="Scenario to run (repeatable; defaults to all)",
+    )
+    run.add_argument(
+        "--crawler-arg",
+        dest="crawler_args",
+        action="append",
+        default=[],
+        metavar="NAME=JSON",
+        help="TuoiTreCrawler keyword for the crawl scenario, e.g. max_workers=8",
+    )
+    run.add_argument("--posts-per-category", type=int, default=None)
+    run.add_argument(
+        "--source",
+        choices=("listing", "sitemap", "feed"),
+        default="listing",
+        help="Where the crawl scenario discovers articles",
+    )
+    run.add_argument("--repeat", type=int, default=3, help="Passes over the corpus for parse")
+    run.add_argument(
+        "--output",
+        type=Path,
+        default=Path("bench_output.txt"),
+        help="File the JSON results are appended to, one line per scenario",
+    )
+    add_condition_args(run)
+    return parser.parse_args()
+
+
+def parse_crawler_arg(value):
+    name, sep, raw = value.partition("=")
+    if not sep:
+        raise SystemExit(f"Expected NAME=JSON, got {value!r}")
+    try:
+        return name, json.loads(raw)
+    except ValueError:
+        return name, raw
+
+
+def main():
+    configure_logging()
+    logging.getLogger("tuoitre_crawler").setLevel(logging.WARNING)
+    args = parse_args()
+    if args.command == "synth":
+        corpus = synthetic_corpus(
+            args.corpus,
+            categories=args.categories,
+            pages_per_category=args.pages_per_category,
+            posts_per_page=args.posts_per_page,
+            max_comments=args.max_comments,
+            media_bytes=args.media_kb * 1024,
+        )
+        print(f"{len(corpus.pages)} pages, {len(corpus.comments)} comment threads")
+    elif args.command == "record":
+        logging.getLogger("tuoitre_crawler").setLevel(logging.INFO)
+        corpus = record_corpus(
+            args.corpus, args.categories, args.posts_per_category, delay=args.delay
+        )
+        print(f"{len(corpus.pages)} pages, {len(corpus.comments)} comment threads")
+    elif args.command == "serve":
+        serve_forever(args.corpus, conditions_from_args(args), host=args.host, port=args.port)
+    elif args.command == "redis":
+        server = RespStandIn(args.host, args.port)
+        print(server.url, flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    else:
+        crawler_kwargs = dict(parse_crawler_arg(value) for value in args.crawler_args)
+        env = environment()
+        for name in args.scenarios or sorted(SCENARIOS):
+            if name == "crawl":
+                result = SCENARIOS[name](
+                    args.corpus,
+                    posts_per_category=args.posts_per_category,
+                    conditions=conditions_from_args(args),
+                    source=args.source,
+                    **crawler_kwargs,
+                )
+                result["crawler_args"] = crawler_kwargs
+            elif name == "discover":
+                result = SCENARIOS[name](
+                    args.corpus, conditions=conditions_from_args(args), **crawler_kwargs
+                )
+                result["crawler_args"] = crawler_kwargs
+            else:
+                result = SCENARIOS[name](args.corpus, repeat=args.repeat)
+            result["environment"] = env
+            line = json.dumps(result, ensure_ascii=False)
+            print(line)
+            with args.output.open("a", encoding="utf-8") as fp:
+                fp.write(line + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+"""Recorded (or synthesized) tuoitre.vn responses replayed by the bench server."""
+
+import datetime
+import email.utils
+import hashlib
+import json
+import random
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+from tuoitre_crawler.comments import merge_comment_pages, parse_comment_payload
+from tuoitre_crawler.constants import BASE_DOMAIN, COMMENT_API
+
+INDEX_FILENAME = "pages.jsonl"
+META_FILENAME = "meta.json"
+
+
+class Corpus:
+    """Pages keyed by absolute URL plus full comment threads keyed by post id.
+
+    Bodies live in ``bodies/`` under their SHA-256 so identical responses (a
+    shared logo, an unchanged listing page) are stored once. Comment threads
+    are kept whole rather than as recorded pages, which lets the server answer
+    any ``pageindex``/``pagesize`` combination the crawler asks for.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.pages = {}
+        self.comments = {}
+        self.meta = {
+            "site": BASE_DOMAIN,
+            "comment_api": COMMENT_API,
+            "categories": [],
+            "sitemaps": [],
+            "feeds": [],
+        }
+
+    @classmethod
+    def load(cls, directory):
+        corpus = cls(directory)
+        meta_path = corpus.directory / META_FILENAME
+        if meta_path.exists():
+            corpus.meta.update(json.loads(meta_path.read_text(encoding="utf-8")))
+        index = corpus.directory / INDEX_FILENAME
+        if index.exists():
+            with index.open("r", encoding="utf-8") as fp:
+                for line in fp:
+                    if line.strip():
+                        entry = json.loads(line)
+                        corpus.pages[entry["url"]] = entry
+        for path in sorted((corpus.directory / "comments").glob("*.json")):
+            corpus.comments[path.stem] = json.loads(path.read_text(encoding="utf-8"))
+        return corpus
+
+    @property
+    def categories(self):
+        return list(self.meta["categories"])
+
+    @property
+    def sitemaps(self):
+        return list(self.meta.get("sitemaps", []))
+
+    @property
+    def feeds(self):
+        return list(self.meta.get("feeds", []))
+
+    def hosts(self):
+        hosts = {urlparse(url).hostname for url in self.pages}
+        hosts.add(urlparse(self.meta["site"]).hostname)
+        hosts.add(urlparse(self.meta["comment_api"]).hostname)
+        return sorted(host for host in hosts if host)
+
+    def add_page(self, url, status, content_type, body):
+        digest = hashlib.sha256(body).hexdigest()
+        path = self.directory / "bodies" / digest[:2] / digest
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(body)
+        self.pages[_strip_fragment(url)] = {
+            "url": _strip_fragment(url),
+            "status": status,
+            "content_type": content_type,
+            "body": digest,
+            "size": len(body),
+        }
+
+    def add_comments(self, post_id, comments, total=None):
+        thread = self.comments.setdefault(str(post_id), {"comments": [], "total": None})
+        thread["comments"] = merge_comment_pages([thread["comments"], comments])
+        if total is not None:
+            thread["total"] = total
+
+    def lookup(self, url):
+        return self.pages.get(_strip_fragment(url))
+
+    def body(self, entry):
+        return (self.directory / "bodies" / entry["body"][:2] / entry["body"]).read_bytes()
+
+    def save(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        (self.directory / META_FILENAME).write_text(
+            json.dumps(self.meta, ensure_ascii=False, indent=2), encoding="utf-8"
+        )
+        with (self.directory / INDEX_FILENAME).open("w", encoding="utf-8") as fp:
+            for url in sorted(self.pages):
+                fp.write(json.dumps(self.pages[url], ensure_ascii=False) + "\n")
+        comment_dir = self.directory / "comments"
+        comment_dir.mkdir(parents=True, exist_ok=True)
+        for post_id, thread in self.comments.items():
+            (comment_dir / f"{post_id}.json").write_text(
+                json.dumps(thread, ensure_ascii=False), encoding="utf-8"
+            )
+
+
+class CorpusRecorder:
+    """``requests`` response hook that copies every response into a corpus.
+
+    Install it on a crawler's session with ``session.hooks["response"]``.
+    Comment API pages are folded into whole threads; everything else is stored
+    by URL. Streamed media is read in full here, which ``iter_content`` then
+    serves from memory.
+    """
+
+    def __init__(self, corpus):
+        self.corpus = corpus
+
+    def __call__(self, response, *args, **kwargs):
+        if response.status_code != 200:
+            return response
+        url = response.url
+        if urlparse(url).path.endswith("/getlist-comment.api"):
+            post_id = parse_qs(urlparse(url).query).get("objId", [None])[0]
+            if post_id:
+                try:
+                    batch, total = parse_comment_payload(response.json())
+                except ValueError:
+                    return response
+                self.corpus.add_comments(post_id, batch, total)
+            return response
+        self.corpus.add_page(
+            url,
+            response.status_code,
+            response.headers.get("Content-Type", "application/octet-stream"),
+            response.content,
+        )
+        return response
+
+
+def record_corpus(directory, categories, posts_per_category=10, **crawler_kwargs):
+    """Crawl the live site once and keep every response under ``directory``."""
+    import tempfile
+
+    from tuoitre_crawler import TuoiTreCrawler
+
+    corpus = Corpus(directory)
+    corpus.meta["categories"] = list(categories)
+    with tempfile.TemporaryDirectory(prefix="tuoitre-record-") as scratch:
+        scratch = Path(scratch)
+        crawler = TuoiTreCrawler(
+            output_dir=scratch / "data",
+            audio_dir=scratch / "audio",
+            image_dir=scratch / "images",
+            media_workers=0,
+            **crawler_kwargs,
+        )
+        crawler.session.hooks["response"].append(CorpusRecorder(corpus))
+        try:
+            crawler.run(list(categories), posts_per_category)
+        finally:
+            crawler.close()
+    corpus.save()
+    return corpus
+
+
+def synthetic_corpus(
+    directory,
+    categories=3,
+    pages_per_category=4,
+    posts_per_page=20,
+    images_per_post=3,
+    max_comments=400,
+    media_bytes=64 * 1024,
+    seed=6900,
+):
+    """Generate a deterministic corpus shaped like tuoitre.vn.
+
+    Listing pages link to articles with relative URLs and show each one's
+    publish time and comment count, articles embed CDN images and podcast
+    audio, and comment threads range from empty to ``max_comments`` with
+    nested replies. Roughly a tenth of the posts appear in two categories, as
+    on the real site. A sitemap index with one child sitemap per category and
+    an RSS feed per category list the same posts, newest first, for the
+    discovery sources.
+    """
+    rng = random.Random(seed)
+    corpus = Corpus(directory)
+    site = corpus.meta["site"]
+    cdn = "https://cdn.tuoitre.vn"
+    shared_image = f"{cdn}/static/logo-share.jpg"
+    corpus.add_page(shared_image, 200, "image/jpeg", _media_body(shared_image, media_bytes))
+    posts = []
+    child_sitemaps = []
+    for category in range(1, categories + 1):
+        slug = f"chuyen-muc-{category}"
+        category_url = f"{site}/{slug}.htm"
+        corpus.meta["categories"].append(category_url)
+        own_posts = []
+        for page in range(1, pages_per_category + 1):
+            entries = []
+            for slot in range(posts_per_page):
+                if posts and rng.random() < 0.1:
+                    entries.append(rng.choice(posts))
+                    continue
+                post_id = f"2024{category:02d}{page:03d}{slot:03d}{rng.randrange(10**6):06d}"
+                path = f"/bai-viet-{category}-{page}-{slot}-{post_id}.htm"
+                audio = f"{cdn}/audio/{post_id}.mp3" if rng.random() < 0.2 else None
+                own_posts.append((f"{site}{path}", _listed_day(page)))
+                images = [shared_image] + [
+                    f"{cdn}/{post_id[:6]}/{post_id}-{index}.jpg"
+                    for index in range(1, images_per_post)
+                ]
+                html = _article_html(post_id, slug, images, audio, rng)
+                corpus.add_page(f"{site}{path}", 200, "text/html; charset=utf-8", html)
+                for media_url in images[1:] + ([audio] if audio else []):
+                    content_type = "audio/mpeg" if media_url.endswith(".mp3") else "image/jpeg"
+                    corpus.add_page(
+                        media_url, 200, content_type, _media_body(media_url, media_bytes)
+                    )
+                count = int(max_comments * rng.random() ** 3)
+                corpus.add_comments(post_id, _comments(post_id, count, rng), count)
+                entries.append((path, post_id, audio, count, _listed_day(page)))
+                posts.append(entries[-1])
+            listing_url = category_url if page == 1 else f"{site}/{slug}/trang-{page}.htm"
+            corpus.add_page(
+                listing_url, 200, "text/html; charset=utf-8", _listing_html(entries)
+            )
+        sitemap_url = f"{site}/sitemaps/{slug}.xml"
+        corpus.add_page(sitemap_url, 200, "application/xml", _sitemap_xml(own_posts))
+        child_sitemaps.append((sitemap_url, own_posts[0][1] if own_posts else _listed_day(1)))
+        feed_url = f"{site}/rss/{slug}.rss"
+        corpus.add_page(feed_url, 200, "application/rss+xml", _feed_xml(slug, own_posts[:50]))
+        corpus.meta["feeds"].append(feed_url)
+    index_url = f"{site}/sitemap.xml"
+    corpus.add_page(index_url, 200, "application/xml", _sitemap_index_xml(child_sitemaps))
+    corpus.meta["sitemaps"].append(index_url)
+    corpus.save()
+    return corpus
+
+
+def _listed_day(page):
+    """Listing page N holds posts from N-1 days before 2024-05-28."""
+    return f"2024-05-{max(1, 29 - page):02d}"
+
+
+def _sitemap_xml(posts):
+    urls = "".join(
+        f"<url><loc>{url}</loc><lastmod>{day}T08:00:00+07:00</lastmod></url>"
+        for url, day in posts
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{urls}</urlset>'
+    ).encode("utf-8")
+
+
+def _sitemap_index_xml(sitemaps):
+    entries = "".join(
+        f"<sitemap><loc>{url}</loc><lastmod>{day}T08:00:00+07:00</lastmod></sitemap>"
+        for url, day in sitemaps
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        f'<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}'
+        "</sitemapindex>"
+    ).encode("utf-8")
+
+
+def _feed_xml(slug, posts):
+    items = "".join(
+        f"<item><title>Tin {index}</title><link>{url}</link>"
+        f"<pubDate>{_rfc822(day)}</pubDate></item>"
+        for index, (url, day) in enumerate(posts)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel>'
+        f"<title>{slug}</title>{items}</channel></rss>"
+    ).encode("utf-8")
+
+
+def _rfc822(day):
+    moment = datetime.datetime.fromisoformat(f"{day}T08:00:00+07:00")
+    return email.utils.format_datetime(moment)
+
+
+def _listing_html(entries):
+    items = []
+    for path, post_id, audio, comments, day in entries:
+        audio_attr = f' data-file="{audio}"' if audio else ""
+        items.append(
+            f'<div class="box-category-item" data-id="{post_id}">'
+            f'<a class="box-category-link-title" data-linktype="newsdetail" href="{path}"'
+            f'{audio_attr}>Tin {post_id}</a>'
+            f'<span class="time-ago" title="{day}T08:00:00">{day}</span>'
+            f'<span class="box-category-comment">{comments}</span>'
+            f'<p class="box-category-sapo">Tom tat {post_id}</p></div>'
+        )
+    return (
+        "<!DOCTYPE html><html><head><title>Chuyen muc</title></head><body>"
+        f'<div class="list__listing-main">{"".join(items)}</div></body></html>'
+    ).encode("utf-8")
+
+
+def _article_html(post_id, slug, images, audio, rng):
+    paragraphs = "".join(
+        f"<p>Doan {index} cua bai {post_id}: " + "noi dung " * rng.randrange(20, 80) + "</p>"
+        for index in range(rng.randrange(4, 12))
+    )
+    figures = "".join(
+        f'<figure class="VCSortableInPreviewMode"><img data-src="{src}" src="{src}">'
+        f"<figcaption>Anh {index}</figcaption></figure>"
+        for index, src in enumerate(images)
+    )
+    player = f'<div class="audio-player"><audio src="{audio}"></audio></div>' if audio else ""
+    reactions = "".join(
+        f'<span data-viewreactid="{react}">{rng.randrange(0, 2000)}</span>'
+        for react in ("1", "2", "3")
+    )
+    scripts = "".join(
+        f"<script>var tracking{index} = {{'zone': {rng.randrange(10**6)}}};</script>"
+        for index in range(8)
+    )
+    return (
+        '<!DOCTYPE html><html lang="vi"><head>'
+        f"<title>Bai {post_id}</title>"
+        f'<meta property="og:title" content="Tieu de {post_id}">'
+        f'<meta property="dable:item_id" content="{post_id}">'
+        '<meta property="article:published_time" content="2024-05-01T08:00:00+07:00">'
+        f'<meta property="article:section" content="{slug}">'
+        f"{scripts}</head><body>"
+        '<div class="detail-author"><span class="name">Phong vien</span></div>'
+        f'<div class="detail-cmain" data-role="content">{paragraphs}{figures}{player}</div>'
+        f'<div class="formreactdetail"><div class="reactinfo">{reactions}</div></div>'
+        f"<script>var articleInfo = {{articleId: '{post_id}'}};</script>"
+        "</body></html>"
+    ).encode("utf-8")
+
+
+def _comments(post_id, count, rng):
+    base = int(post_id[-6:]) * 100000
+    comments = []
+    for index in range(count):
+        replies = [
+            {
+                "id": base + 50000 + index * 10 + reply,
+                "content": f"Tra loi {reply}",
+                "sender_fullname": f"Doc gia {rng.randrange(500)}",
+                "created_date": "2024-05-01T09:00:00",
+                "reactions": {},
+                "child_comments": [],
+            }
+            for reply in range(rng.choice((0, 0, 0, 1, 2)))
+        ]
+        comments.append(
+            {
+                "id": base + index,
+                "content": "Binh luan " * rng.randrange(3, 30),
+                "sender_fullname": f"Doc gia {rng.randrange(500)}",
+                "created_date": "2024-05-01T08:30:00",
+                "reactions": {"1": rng.randrange(0, 50), "3": rng.randrange(0, 5)},
+                "child_comments": replies,
+            }
+        )
+    return comments
+
+
+def _media_body(url, size):
+    seed = hashlib.sha256(url.encode("utf-8")).digest()
+    return (seed * (size // len(seed) + 1))[:size]
+
+
+def _strip_fragment(url):
+    return url.split("#", 1)[0]
+
+
+__all__ = ["Corpus", "CorpusRecorder", "record_corpus", "synthetic_corpus"]
@@ -0,0 +1,413 @@
+"""In-memory server for the subset of the Redis protocol the work queue uses.
+
+It lets the distributed mode (``tuoitre_crawler.distributed``) run across
+processes on a machine without a Redis install, and keeps benchmark runs
+free of an external service. Data lives only as long as the process.
+``MULTI``/``EXEC`` and ``WATCH`` are supported; a watched key counts as
+changed after any write command names it, even one that left it as it was.
+"""
+
+import fnmatch
+import threading
+import time
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+
+
+class CommandError(Exception):
+    pass
+
+
+class Store:
+    """Strings, lists, sets, hashes and sorted sets with millisecond expiry."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data = {}
+        self.expires = {}
+        self.versions = {}
+
+    def get(self, key, kind, create=False):
+        expires = self.expires.get(key)
+        if expires is not None and expires <= time.time():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        value = self.data.get(key)
+        if value is None:
+            if not create:
+                return None
+            value = self.data[key] = kind()
+        elif not isinstance(value, kind):
+            raise CommandError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def delete(self, key):
+        self.expires.pop(key, None)
+        return self.data.pop(key, None) is not None
+
+    def touch(self, keys):
+        for key in keys:
+            self.versions[key] = self.versions.get(key, 0) + 1
+
+
+class RespStandIn(ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=6379):
+        super().__init__((host, port), RespHandler)
+        self.store = Store()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name="resp-standin", daemon=True)
+        thread.start()
+        return self
+
+
+class RespHandler(StreamRequestHandler):
+    def handle(self):
+        self.watched = {}
+        self.queued = None
+        while True:
+            try:
+                args = self._read_command()
+            except (ConnectionError, ValueError):
+                return
+            if args is None:
+                return
+            try:
+                reply = self._dispatch(args)
+            except CommandError as exc:
+                reply = exc
+            except (IndexError, ValueError):
+                reply = CommandError("ERR syntax error")
+            self.wfile.write(encode(reply))
+
+    def _dispatch(self, args):
+        store = self.server.store
+        name = args[0].upper()
+        if name == "MULTI":
+            if self.queued is not None:
+                raise CommandError("ERR MULTI calls can not be nested")
+            self.queued = []
+            return Status("OK")
+        if name in ("EXEC", "DISCARD"):
+            if self.queued is None:
+                raise CommandError(f"ERR {name} without MULTI")
+            queued, self.queued = self.queued, None
+            watched, self.watched = self.watched, {}
+            if name == "DISCARD":
+                return Status("OK")
+            with store.lock:
+                if any(store.versions.get(key, 0) != seen for key, seen in watched.items()):
+                    return ABORTED
+                return [_reply_or_error(store, command) for command in queued]
+        if self.queued is not None:
+            if name == "WATCH":
+                raise CommandError("ERR WATCH inside MULTI is not allowed")
+            self.queued.append(args)
+            return Status("QUEUED")
+        if name == "WATCH":
+            with store.lock:
+                for key in args[1:]:
+                    self.watched.setdefault(key, store.versions.get(key, 0))
+            return Status("OK")
+        if name == "UNWATCH":
+            self.watched = {}
+            return Status("OK")
+        with store.lock:
+            return execute(store, args)
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.decode("utf-8").split()
+        args = []
+        for _ in range(int(line[1:])):
+            size = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(size + 2)[:-2].decode("utf-8"))
+        return args
+
+
+class Status(str):
+    pass
+
+
+# EXEC's reply when a watched key changed: a null array.
+ABORTED = object()
+
+
+def _reply_or_error(store, args):
+    try:
+        return execute(store, args)
+    except CommandError as exc:
+        return exc
+    except (IndexError, ValueError):
+        return CommandError("ERR syntax error")
+
+
+def encode(reply):
+    if reply is None:
+        return b"$-1\r\n"
+    if reply is ABORTED:
+        return b"*-1\r\n"
+    if isinstance(reply, CommandError):
+        return b"-" + str(reply).encode("utf-8") + b"\r\n"
+    if isinstance(reply, Status):
+        return b"+" + reply.encode("utf-8") + b"\r\n"
+    if isinstance(reply, bool):
+        return b":%d\r\n" % int(reply)
+    if isinstance(reply, int):
+        return b":%d\r\n" % reply
+    if isinstance(reply, (list, tuple)):
+        return b"*%d\r\n" % len(reply) + b"".join(encode(item) for item in reply)
+    data = str(reply).encode("utf-8")
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+def execute(store, args):
+    name, args = args[0].upper(), args[1:]
+    handler = COMMANDS.get(name)
+    if handler is None:
+        raise CommandError(f"ERR unknown command '{name}'")
+    reply = handler(store, *args)
+    if name == "FLUSHALL":
+        store.touch(list(store.versions))
+    elif name in WRITES:
+        store.touch(args if WRITES[name] is None else args[: WRITES[name]])
+    return reply
+
+
+def ping(store, *args):
+    return Status("PONG") if not args else args[0]
+
+
+def select(store, db):
+    return Status("OK")
+
+
+def get(store, key):
+    return store.get(key, str)
+
+
+def set_(store, key, value, *options):
+    options = [option.upper() for option in options]
+    if "NX" in options and store.get(key, object) is not None:
+        return None
+    store.data[key] = value
+    store.expires.pop(key, None)
+    for unit, scale in (("PX", 1000.0), ("EX", 1.0)):
+        if unit in options:
+            store.expires[key] = time.time() + int(options[options.index(unit) + 1]) / scale
+    return Status("OK")
+
+
+def incr(store, key):
+    value = int(store.get(key, str) or 0) + 1
+    store.data[key] = str(value)
+    return value
+
+
+def delete(store, *keys):
+    return sum(store.delete(key) for key in keys)
+
+
+def pexpire(store, key, ms):
+    if store.get(key, object) is None:
+        return 0
+    store.expires[key] = time.time() + int(ms) / 1000.0
+    return 1
+
+
+def persist(store, key):
+    return int(store.get(key, object) is not None and store.expires.pop(key, None) is not None)
+
+
+def keys(store, pattern):
+    return [key for key in list(store.data) if fnmatch.fnmatchcase(key, pattern)]
+
+
+def flushall(store, *args):
+    store.data.clear()
+    store.expires.clear()
+    return Status("OK")
+
+
+def lpush(store, key, *values):
+    items = store.get(key, list, create=True)
+    for value in values:
+        items.insert(0, value)
+    return len(items)
+
+
+def rpoplpush(store, source, destination):
+    items = store.get(source, list)
+    if not items:
+        return None
+    value = items.pop()
+    if not items:
+        store.delete(source)
+    store.get(destination, list, create=True).insert(0, value)
+    return value
+
+
+def lrem(store, key, count, value):
+    items = store.get(key, list) or []
+    count = int(count)
+    order = range(len(items)) if count >= 0 else reversed(range(len(items)))
+    matches = [index for index in order if items[index] == value]
+    if count:
+        matches = matches[: abs(count)]
+    for index in sorted(matches, reverse=True):
+        del items[index]
+    if not items:
+        store.delete(key)
+    return len(matches)
+
+
+def lrange(store, key, start, stop):
+    items = store.get(key, list) or []
+    start, stop = int(start), int(stop)
+    stop = len(items) if stop == -1 else stop + 1
+    return items[start:stop]
+
+
+def llen(store, key):
+    return len(store.get(key, list) or [])
+
+
+def sadd(store, key, *members):
+    items = store.get(key, set, create=True)
+    before = len(items)
+    items.update(members)
+    return len(items) - before
+
+
+def smembers(store, key):
+    return sorted(store.get(key, set) or ())
+
+
+def scard(store, key):
+    return len(store.get(key, set) or ())
+
+
+def hset(store, key, *pairs):
+    fields = store.get(key, dict, create=True)
+    added = 0
+    for field, value in zip(pairs[::2], pairs[1::2]):
+        added += field not in fields
+        fields[field] = value
+    return added
+
+
+def hget(store, key, field):
+    return (store.get(key, dict) or {}).get(field)
+
+
+def hgetall(store, key):
+    return [item for pair in (store.get(key, dict) or {}).items() for item in pair]
+
+
+def hdel(store, key, *names):
+    fields = store.get(key, dict) or {}
+    return sum(fields.pop(name, None) is not None for name in names)
+
+
+def hincrby(store, key, field, amount):
+    fields = store.get(key, dict, create=True)
+    fields[field] = str(int(fields.get(field, 0)) + int(amount))
+    return int(fields[field])
+
+
+def zadd(store, key, *args):
+    flags = set()
+    while args and args[0].upper() in ("NX", "XX"):
+        flags.add(args[0].upper())
+        args = args[1:]
+    scores = store.get(key, dict, create=True)
+    added = 0
+    for score, member in zip(args[::2], args[1::2]):
+        if ("NX" in flags and member in scores) or ("XX" in flags and member not in scores):
+            continue
+        added += member not in scores
+        scores[member] = float(score)
+    return added
+
+
+def zrem(store, key, *members):
+    scores = store.get(key, dict) or {}
+    return sum(scores.pop(member, None) is not None for member in members)
+
+
+def zscore(store, key, member):
+    score = (store.get(key, dict) or {}).get(member)
+    return None if score is None else repr(score)
+
+
+def zrangebyscore(store, key, low, high):
+    low = float("-inf") if low == "-inf" else float(low)
+    high = float("inf") if high in ("+inf", "inf") else float(high)
+    scores = store.get(key, dict) or {}
+    return [
+        member
+        for member, score in sorted(scores.items(), key=lambda item: item[1])
+        if low <= score <= high
+    ]
+
+
+COMMANDS = {
+    "PING": ping,
+    "SELECT": select,
+    "GET": get,
+    "SET": set_,
+    "INCR": incr,
+    "DEL": delete,
+    "PEXPIRE": pexpire,
+    "PERSIST": persist,
+    "KEYS": keys,
+    "FLUSHALL": flushall,
+    "LPUSH": lpush,
+    "RPOPLPUSH": rpoplpush,
+    "LREM": lrem,
+    "LRANGE": lrange,
+    "LLEN": llen,
+    "SADD": sadd,
+    "SMEMBERS": smembers,
+    "SCARD": scard,
+    "HSET": hset,
+    "HGET": hget,
+    "HGETALL": hgetall,
+    "HDEL": hdel,
+    "HINCRBY": hincrby,
+    "ZADD": zadd,
+    "ZREM": zrem,
+    "ZSCORE": zscore,
+    "ZRANGEBYSCORE": zrangebyscore,
+}
+
+# Write commands and how many leading arguments are keys (None: all of them).
+WRITES = {
+    "SET": 1,
+    "INCR": 1,
+    "DEL": None,
+    "PEXPIRE": 1,
+    "PERSIST": 1,
+    "LPUSH": 1,
+    "RPOPLPUSH": 2,
+    "LREM": 1,
+    "SADD": 1,
+    "HSET": 1,
+    "HDEL": 1,
+    "HINCRBY": 1,
+    "ZADD": 1,
+    "ZREM": 1,
+}
+
+
+__all__ = ["RespStandIn", "Store", "execute", "COMMANDS"]
@@ -0,0 +1,347 @@
+"""Benchmark scenarios that report throughput, CPU time and peak memory."""
+
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from tuoitre_crawler import TuoiTreCrawler
+from tuoitre_crawler.cache import url_class
+from tuoitre_crawler.parsers import (
+    available_backends,
+    check_backends,
+    compare_plan,
+    normalize_comments,
+    parse_article,
+    parse_listing,
+)
+
+from .corpus import Corpus
+from .server import ReplayConditions, ReplayServer
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+
+class Measurement:
+    """Wall time, CPU time and peak RSS of the current process and its children."""
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self.cpu_started = _cpu_seconds()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.wall = time.perf_counter() - self.started
+        self.cpu = _cpu_seconds() - self.cpu_started
+        self.peak_rss_mb = _peak_rss_mb()
+
+    def as_dict(self):
+        return {
+            "wall_seconds": round(self.wall, 3),
+            "cpu_seconds": round(self.cpu, 3),
+            "peak_rss_mb": self.peak_rss_mb,
+        }
+
+
+def crawl_scenario(
+    corpus_dir, posts_per_category=None, conditions=None, source="listing", **crawler_kwargs
+):
+    """Run ``TuoiTreCrawler.run`` end to end against a replay server.
+
+    The server runs in a child process so its CPU time and memory are not
+    counted against the crawler. ``source`` picks the URLs the crawl starts
+    from: category listing pages, the sitemap index, or the category feeds.
+    """
+    corpus = Corpus.load(corpus_dir)
+    if posts_per_category is None:
+        posts_per_category = max(1, len(corpus.comments) // max(1, len(corpus.categories)))
+    crawler_kwargs.setdefault("delay", 0)
+    with ReplayProcess(corpus_dir, conditions) as server, tempfile.TemporaryDirectory(
+        prefix="tuoitre-bench-"
+    ) as scratch:
+        scratch = Path(scratch)
+        crawler = TuoiTreCrawler(
+            output_dir=scratch / "data",
+            audio_dir=scratch / "audio",
+            image_dir=scratch / "images",
+            comment_api=server.comment_api,
+            **crawler_kwargs,
+        )
+        try:
+            with Measurement() as measured:
+                summary = crawler.run(server.sources(source), posts_per_category)
+        finally:
+            crawler.close()
+        report = crawler.metrics.snapshot()
+    posts = summary["total_posts"]
+    return {
+        "scenario": "crawl",
+        "posts": posts,
+        "comments": summary["total_comments"],
+        "comment_rich_posts": summary["comment_rich_posts"],
+        "requests": report["requests"]["total"],
+        "retries": sum(report["retries"].values()),
+        "bytes": sum(report["bytes"].values()),
+        "connections": sum(host["connections"] for host in summary["connections"].values()),
+        "discarded_connections": sum(
+            host["discarded"] for host in summary["connections"].values()
+        ),
+        "posts_per_second": round(posts / measured.wall, 3) if measured.wall else 0.0,
+        "requests_per_second": round(report["requests"]["total"] / measured.wall, 3)
+        if measured.wall
+        else 0.0,
+        "stages_p95": {name: stats["p95"] for name, stats in report["stages"].items()},
+        **measured.as_dict(),
+    }
+
+
+def discover_scenario(corpus_dir, conditions=None, **crawler_kwargs):
+    """Time URL enumeration alone from each discovery source.
+
+    Nothing past discovery is fetched, so this measures how quickly a backfill
+    can find its work: listing pages (at ``listing_prefetch``) against the
+    sitemap index and the per-category feeds.
+    """
+    crawler_kwargs.setdefault("delay", 0)
+    results = {"scenario": "discover"}
+    with ReplayProcess(corpus_dir, conditions) as server, tempfile.TemporaryDirectory(
+        prefix="tuoitre-bench-"
+    ) as scratch:
+        scratch = Path(scratch)
+        for source in ("listing", "sitemap", "feed"):
+            crawler = TuoiTreCrawler(
+                output_dir=scratch / "data",
+                audio_dir=scratch / "audio",
+                image_dir=scratch / "images",
+                comment_api=server.comment_api,
+                **crawler_kwargs,
+            )
+            try:
+                with Measurement() as measured:
+                    urls = {
+                        url
+                        for start in server.sources(source)
+                        for url in crawler.iter_category_posts(start, float("inf"))
+                    }
+            finally:
+                crawler.close()
+            report = crawler.metrics.snapshot()
+            results[source] = {
+                "urls": len(urls),
+                "requests": report["requests"]["total"],
+                "urls_per_second": round(len(urls) / measured.wall, 1) if measured.wall else 0.0,
+                **measured.as_dict(),
+            }
+    return results
+
+
+def parse_scenario(corpus_dir, backends=None, repeat=3):
+    """Time the parser functions alone over every page in the corpus.
+
+    Also runs :func:`check_backends` on every page so a backend change
+    that alters extracted fields shows up next to its speed, and
+    :func:`compare_plan` so does any drift between the compiled extraction plan
+    and the soup extractors.
+    """
+    corpus = Corpus.load(corpus_dir)
+    backends = backends or available_backends()
+    articles, listings = [], []
+    for url, entry in corpus.pages.items():
+        if not entry["content_type"].startswith("text/html"):
+            continue
+        html = corpus.body(entry).decode("utf-8", errors="replace")
+        (articles if url_class(url) == "article" else listings).append((url, html))
+    threads = [thread["comments"] for thread in corpus.comments.values()]
+    results = {"scenario": "parse", "articles": len(articles), "listings": len(listings)}
+    for backend in backends:
+        with Measurement() as measured:
+            for _ in range(repeat):
+                for url, html in articles:
+                    parse_article(html, url, backend)
+                for _, html in listings:
+                    parse_listing(html, backend)
+        pages = (len(articles) + len(listings)) * repeat
+        results[backend] = {
+            "pages_per_second": round(pages / measured.wall, 1) if measured.wall else 0.0,
+            **measured.as_dict(),
+        }
+    with Measurement() as measured:
+        for _ in range(repeat):
+            for thread in threads:
+                normalize_comments(thread)
+    comments = sum(len(thread) for thread in threads) * repeat
+    results["comments"] = {
+        "comments_per_second": round(comments / measured.wall, 1) if measured.wall else 0.0,
+        **measured.as_dict(),
+    }
+    if len(backends) > 1:
+        results["backend_mismatches"] = sorted(check_backends(articles, listings, backends))
+    results["plan_mismatches"] = [
+        url
+        for url, html in articles
+        if any(compare_plan(html, url, backend) for backend in backends)
+    ]
+    return results
+
+
+SCENARIOS = {"crawl": crawl_scenario, "discover": discover_scenario, "parse": parse_scenario}
+
+
+class ReplayProcess:
+    """Run ``python -m bench serve`` in a child process for the duration of a block."""
+
+    def __init__(self, corpus_dir, conditions=None):
+        self.corpus_dir = Path(corpus_dir)
+        self.conditions = conditions or ReplayConditions()
+        self._process = None
+        self.info = None
+
+    def __enter__(self):
+        command = [
+            sys.executable,
+            "-m",
+            "bench",
+            "serve",
+            str(self.corpus_dir),
+            "--port",
+            "0",
+            *conditions_to_args(self.conditions),
+        ]
+        project_root = str(Path(__file__).resolve().parent.parent)
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [project_root, env.get("PYTHONPATH")]))
+        self._process = subprocess.Popen(
+            command, stdout=subprocess.PIPE, text=True, env=env, cwd=project_root
+        )
+        line = self._process.stdout.readline()
+        if not line:
+            self._process.wait()
+            raise RuntimeError("Replay server exited before it started")
+        self.info = json.loads(line)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._process.terminate()
+        self._process.wait()
+
+    @property
+    def comment_api(self):
+        return self.info["comment_api"]
+
+    @property
+    def category_urls(self):
+        return self.info["categories"]
+
+    def sources(self, source="listing"):
+        if source == "listing":
+            return self.category_urls
+        return self.info[f"{source}s"]
+
+
+def conditions_to_args(conditions):
+    args = [
+        "--latency",
+        str(conditions.latency),
+        "--jitter",
+        str(conditions.jitter),
+        "--throttle-rate",
+        str(conditions.throttle_rate),
+        "--error-rate",
+        str(conditions.error_rate),
+        "--retry-after",
+        str(conditions.retry_after),
+        "--bandwidth",
+        str(conditions.bandwidth),
+        "--server-rate",
+        str(conditions.server_rate),
+    ]
+    if not conditions.report_total:
+        args.append("--no-total")
+    if conditions.seed is not None:
+        args.extend(["--seed", str(conditions.seed)])
+    return args
+
+
+def serve_forever(corpus_dir, conditions=None, host="127.0.0.1", port=0):
+    """Start a replay server and print its addresses as one JSON line."""
+    server = ReplayServer(Corpus.load(corpus_dir), conditions, host=host, port=port)
+    print(
+        json.dumps(
+            {
+                "base_url": server.base_url,
+                "comment_api": server.comment_api,
+                "categories": server.category_urls(),
+                "sitemaps": server.sitemap_urls(),
+                "feeds": server.feed_urls(),
+            }
+        ),
+        flush=True,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def _cpu_seconds():
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {
+        "self": round(own / scale, 1),
+        "children": round(children / scale, 1),
+    }
+
+
+def _git_commit():
+    if shutil.which("git") is None:
+        return None
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).resolve().parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+__all__ = [
+    "Measurement",
+    "ReplayProcess",
+    "crawl_scenario",
+    "discover_scenario",
+    "parse_scenario",
+    "serve_forever",
+    "environment",
+    "SCENARIOS",
+]
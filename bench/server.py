@@ -0,0 +1,253 @@
+"""Local stand-in for tuoitre.vn that replays a corpus under injected conditions."""
+
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+HOST_PREFIX = "/_host/"
+TEXT_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "application/rss+xml",
+)
+ROOT_RELATIVE = re.compile(rb"""(\b(?:href|src|data-src|data-file|data-original)=["'])/(?!/)""")
+
+
+class ReplayConditions:
+    """Network conditions applied to every replayed response.
+
+    ``latency`` and ``jitter`` are seconds added before the response starts
+    (jitter is uniform in ``[-jitter, +jitter]``). ``throttle_rate`` and
+    ``error_rate`` are probabilities of answering ``429`` (with
+    ``Retry-After: retry_after``) or a random 5xx instead. ``bandwidth`` caps
+    each response body in bytes per second; 0 disables the cap.
+    ``server_rate`` models the site's own limiter: requests beyond that many
+    per second (with a burst of the same size) are answered with ``429``.
+    """
+
+    def __init__(
+        self,
+        latency=0.0,
+        jitter=0.0,
+        throttle_rate=0.0,
+        error_rate=0.0,
+        retry_after=1,
+        bandwidth=0,
+        report_total=True,
+        server_rate=0.0,
+        seed=None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.bandwidth = bandwidth
+        self.report_total = report_total
+        self.server_rate = server_rate
+        self.seed = seed
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tokens = server_rate
+        self._updated = time.monotonic()
+
+    def delay(self):
+        with self._lock:
+            offset = self._random.uniform(-self.jitter, self.jitter) if self.jitter else 0.0
+        return max(0.0, self.latency + offset)
+
+    def fault(self):
+        with self._lock:
+            if self.server_rate > 0:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.server_rate, self._tokens + (now - self._updated) * self.server_rate
+                )
+                self._updated = now
+                if self._tokens < 1:
+                    return 429
+                self._tokens -= 1
+            roll = self._random.random()
+            if roll < self.throttle_rate:
+                return 429
+            if roll < self.throttle_rate + self.error_rate:
+                return self._random.choice((500, 502, 503, 504))
+        return None
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """Serve a :class:`~bench.corpus.Corpus` over plain HTTP on localhost.
+
+    The corpus site (tuoitre.vn) is mounted at the server root and every other
+    recorded host under ``/_host/<host>/``. Absolute links to recorded hosts
+    and root-relative links in text bodies are rewritten on the way out, so a
+    crawler started on :meth:`category_urls` with ``comment_api`` set to
+    :attr:`comment_api` never leaves localhost.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, corpus, conditions=None, host="127.0.0.1", port=0):
+        super().__init__((host, port), ReplayHandler)
+        self.corpus = corpus
+        self.conditions = conditions or ReplayConditions()
+        self.site_host = urlparse(corpus.meta["site"]).hostname
+        self.hosts = corpus.hosts()
+        self.stats = {"requests": 0, "served": 0, "not_found": 0, "faults": 0, "bytes": 0}
+        self._stats_lock = threading.Lock()
+        self._absolute = re.compile(
+            rb"(?:https?:)?//("
+            + b"|".join(
+                re.escape(host.encode("ascii"))
+                for host in sorted(self.hosts, key=len, reverse=True)
+            )
+            + rb")(?=[/\"'\s?#<]|$)"
+        )
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def comment_api(self):
+        return self.local_url(self.corpus.meta["comment_api"])
+
+    def category_urls(self):
+        return [self.local_url(url) for url in self.corpus.categories]
+
+    def sitemap_urls(self):
+        return [self.local_url(url) for url in self.corpus.sitemaps]
+
+    def feed_urls(self):
+        return [self.local_url(url) for url in self.corpus.feeds]
+
+    def local_url(self, url):
+        parsed = urlparse(url)
+        path = parsed.path or "/"
+        if parsed.query:
+            path = f"{path}?{parsed.query}"
+        if parsed.hostname == self.site_host:
+            return f"{self.base_url}{path}"
+        return f"{self.base_url}{HOST_PREFIX}{parsed.hostname}{path}"
+
+    def original_url(self, path):
+        if path.startswith(HOST_PREFIX):
+            host, _, rest = path[len(HOST_PREFIX):].partition("/")
+            return f"https://{host}/{rest}"
+        return f"https://{self.site_host}{path}"
+
+    def rewrite(self, body):
+        def local(match):
+            host = match.group(1).decode("ascii")
+            if host == self.site_host:
+                return self.base_url.encode("ascii")
+            return f"{self.base_url}{HOST_PREFIX}{host}".encode("ascii")
+
+        body = self._absolute.sub(local, body)
+        return ROOT_RELATIVE.sub(lambda m: m.group(1) + self.base_url.encode("ascii") + b"/", body)
+
+    def count(self, name, amount=1):
+        with self._stats_lock:
+            self.stats[name] += amount
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name="replay", daemon=True)
+        thread.start()
+        return self
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self._serve(head=True)
+
+    def do_GET(self):
+        self._serve(head=False)
+
+    def _serve(self, head):
+        server = self.server
+        server.count("requests")
+        parsed = urlparse(self.path)
+        url = server.original_url(parsed.path)
+        delay = server.conditions.delay()
+        if delay:
+            time.sleep(delay)
+        fault = server.conditions.fault()
+        if fault is not None:
+            server.count("faults")
+            headers = {"Retry-After": str(server.conditions.retry_after)} if fault == 429 else {}
+            return self._respond(fault, "text/plain", b"injected fault", head, headers)
+        if parsed.path.endswith("/getlist-comment.api"):
+            body = self._comment_page(parse_qs(parsed.query))
+            return self._respond(200, "application/json; charset=utf-8", body, head)
+        entry = server.corpus.lookup(url)
+        if entry is None:
+            server.count("not_found")
+            return self._respond(404, "text/plain", b"not in corpus", head)
+        body = server.corpus.body(entry)
+        if entry["content_type"].startswith(TEXT_TYPES):
+            body = server.rewrite(body)
+        return self._respond(entry["status"], entry["content_type"], body, head)
+
+    def _comment_page(self, query):
+        post_id = query.get("objId", [""])[0]
+        page = max(1, int(query.get("pageindex", ["1"])[0]))
+        size = max(1, int(query.get("pagesize", ["10"])[0]))
+        thread = self.server.corpus.comments.get(post_id, {"comments": [], "total": 0})
+        items = thread["comments"][(page - 1) * size : page * size]
+        payload = {"Success": True, "Data": json.dumps(items, ensure_ascii=False)}
+        if self.server.conditions.report_total:
+            payload["TotalCount"] = len(thread["comments"])
+        return json.dumps(payload).encode("utf-8")
+
+    def _respond(self, status, content_type, body, head, headers=None):
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if status == 200 and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if status == 200:
+            self.send_header("ETag", etag)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if head:
+            return
+        self._write_body(body)
+        self.server.count("served")
+        self.server.count("bytes", len(body))
+
+    def _write_body(self, body):
+        bandwidth = self.server.conditions.bandwidth
+        if not bandwidth:
+            self.wfile.write(body)
+            return
+        chunk = max(1024, int(bandwidth / 20))
+        started = time.monotonic()
+        sent = 0
+        for offset in range(0, len(body), chunk):
+            self.wfile.write(body[offset : offset + chunk])
+            sent += len(body[offset : offset + chunk])
+            ahead = sent / bandwidth - (time.monotonic() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+
+
+__all__ = ["ReplayServer", "ReplayConditions", "ReplayHandler"]
@@ -0,0 +1,57 @@
+from pathlib import Path
+
+import pytest
+
+from tuoitre_crawler.parsers import (
+    available_backends,
+    check_backends,
+    compare_plan,
+    parse_article,
+    parse_listing,
+)
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+ARTICLES = {
+    "article-thoi-su.html": (
+        "https://tuoitre.vn/thu-tuong-chu-tri-hop-ban-chi-dao-20240518083012345.htm"
+    ),
+    "article-photo.html": (
+        "https://tuoitre.vn/ha-noi-mua-lon-nhieu-tuyen-pho-ngap-sau-20240518072045678.htm"
+    ),
+    "article-podcast.html": "https://tuoitre.vn/podcast-ban-tin-sang-16-5-20240516060000444.htm",
+}
+LISTINGS = {
+    "listing-thoi-su.html": "https://tuoitre.vn/thoi-su.htm",
+    "listing-podcast.html": "https://tuoitre.vn/podcast.htm",
+}
+
+
+def _read(name):
+    return (FIXTURES / name).read_text(encoding="utf-8")
+
+
+def _pages(fixtures):
+    return [(url, _read(name)) for name, url in fixtures.items()]
+
+
+def test_backends_agree_on_fixtures():
+    assert check_backends(_pages(ARTICLES), _pages(LISTINGS)) == {}
+
+
+@pytest.mark.parametrize("backend", available_backends())
+@pytest.mark.parametrize("name", sorted(ARTICLES.keys() | LISTINGS.keys()))
+def test_plan_matches_soup(name, backend):
+    url = ARTICLES.get(name) or LISTINGS[name]
+    assert compare_plan(_read(name), url, backend) == {}
+
+
+def test_fixtures_exercise_the_extractors():
+    article = parse_article(_read("article-thoi-su.html"), ARTICLES["article-thoi-su.html"])
+    assert article["post_id"] == "20240518083012345"
+    assert article["metadata"]["authors"] == ["Thu Hằng", "Đức Minh"]
+    assert len(article["content"]["images"]) == 1
+    podcast = parse_article(_read("article-podcast.html"), ARTICLES["article-podcast.html"])
+    assert len(podcast["content"]["audio"]) == 4
+    entries = parse_listing(_read("listing-thoi-su.html"))
+    assert entries[0][2] == {"published": "2024-05-18T08:30:12", "comments": 12}
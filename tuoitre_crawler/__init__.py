@@ -1,5 +1,12 @@
 """High-level exports for the TuoiTre crawler package."""
 
-from .crawler import ProcessedPost, TuoiTreCrawler
-
 __all__ = ["TuoiTreCrawler", "ProcessedPost"]
+
+
+def __getattr__(name):
+    # Imported on first use: the CLI only needs the crawler once a mode runs.
+    if name in __all__:
+        from . import crawler
+
+        return getattr(crawler, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
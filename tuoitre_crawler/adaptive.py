@@ -0,0 +1,252 @@
+"""AIMD controller that tunes per-host request rate and concurrency at runtime."""
+
+import logging
+import threading
+import time
+from urllib.parse import urlparse
+
+from .constants import LOGGER_NAME
+
+LOGGER = logging.getLogger(LOGGER_NAME)
+
+THROTTLE_STATUSES = {429, 503}
+
+
+class ConcurrencyGate:
+    """Counting gate whose limit can be raised or lowered while threads wait."""
+
+    def __init__(self, limit):
+        self._cond = threading.Condition()
+        self._limit = max(1, int(limit))
+        self.active = 0
+
+    @property
+    def limit(self):
+        return self._limit
+
+    def set_limit(self, limit):
+        with self._cond:
+            self._limit = max(1, int(limit))
+            self._cond.notify_all()
+
+    def acquire(self):
+        with self._cond:
+            self._cond.wait_for(lambda: self.active < self._limit)
+            self.active += 1
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class HostState:
+    def __init__(self, rate, limit):
+        self.rate = rate
+        self.limit = limit
+        self.baseline = None
+        self.latency = None
+        self.responses = 0
+        self.errors = 0
+        self.last_decrease = float("-inf")
+        self.stats = {"increases": 0, "decreases": 0, "throttled": 0, "errors": 0, "paused": 0.0}
+
+
+class AdaptiveController:
+    """Additive-increase / multiplicative-decrease per host.
+
+    Each host starts at its configured rate (``initial_rate`` when that is
+    unlimited). Every ``window`` responses without trouble raise the rate by
+    ``increase_step`` and the concurrency by one. A ``429``/``503`` or a
+    ``Retry-After`` header cuts both by ``decrease_factor`` straight away, and
+    ``Retry-After`` also pauses the host's token bucket so every worker waits,
+    not only the one that was told to. An error ratio above
+    ``error_threshold``, or smoothed latency above ``latency_tolerance`` times
+    the best smoothed latency seen, cuts them more gently at the end of a
+    window.
+    Decreases are at most one per ``cooldown`` seconds so a burst of
+    responses to requests already in flight counts as one signal.
+
+    Retries made inside urllib3 are reported through :meth:`observe_retry`
+    (see :class:`~tuoitre_crawler.http.ObservedRetry`), so they are visible
+    here as they happen instead of only after the final attempt.
+    """
+
+    def __init__(
+        self,
+        rate_limiter,
+        max_concurrency,
+        initial_rate=None,
+        min_rate=0.2,
+        max_rate=20.0,
+        initial_concurrency=None,
+        window=10,
+        increase_step=1.0,
+        decrease_factor=0.5,
+        error_threshold=0.1,
+        latency_tolerance=2.0,
+        cooldown=2.0,
+        clock=time.monotonic,
+    ):
+        self.rate_limiter = rate_limiter
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        if not initial_rate or initial_rate <= 0:
+            initial_rate = max_rate / 4
+        self.initial_rate = min(max(initial_rate, min_rate), max_rate)
+        self.initial_concurrency = initial_concurrency or max(1, self.max_concurrency // 4)
+        self.window = max(1, window)
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.error_threshold = error_threshold
+        self.latency_tolerance = latency_tolerance
+        self.cooldown = cooldown
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._hosts = {}
+        self._gates = {}
+
+    def gate(self, url):
+        host = _host(url)
+        with self._lock:
+            self._state(host)
+            return self._gates[host]
+
+    def limit(self, url):
+        with self._lock:
+            return self._state(_host(url)).limit
+
+    def observe(self, url, status, latency=None, retry_after=None):
+        self._observe(_host(url), status, latency, retry_after)
+
+    def observe_retry(self, host, status, retry_after=None):
+        self._observe((host or "").lower(), status, None, retry_after)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                host: {
+                    "rate": round(state.rate, 3),
+                    "concurrency": state.limit,
+                    "latency": round(state.latency, 4) if state.latency is not None else None,
+                    **{key: round(value, 3) for key, value in state.stats.items()},
+                }
+                for host, state in sorted(self._hosts.items())
+            }
+
+    def _observe(self, host, status, latency, retry_after):
+        pause = _retry_after_seconds(retry_after)
+        throttled = status in THROTTLE_STATUSES or pause is not None
+        failed = status == "error" or (isinstance(status, int) and status >= 500)
+        with self._lock:
+            state = self._state(host)
+            if pause:
+                state.stats["paused"] += pause
+                self.rate_limiter.bucket(host).pause(pause)
+            if throttled:
+                state.stats["throttled"] += 1
+                self._decrease(host, state, self.decrease_factor, f"HTTP {status}")
+                return
+            state.responses += 1
+            if failed:
+                state.errors += 1
+                state.stats["errors"] += 1
+            elif latency is not None:
+                if state.latency is None:
+                    state.latency = latency
+                else:
+                    state.latency = 0.8 * state.latency + 0.2 * latency
+            if state.responses < self.window:
+                return
+            error_ratio = state.errors / state.responses
+            slow = (
+                state.baseline is not None
+                and state.latency is not None
+                and state.latency > state.baseline * self.latency_tolerance
+            )
+            if state.latency is not None:
+                # Let the baseline drift up slowly so a permanently slower
+                # network does not read as congestion forever.
+                state.baseline = (
+                    state.latency
+                    if state.baseline is None
+                    else min(state.baseline * 1.05, state.latency)
+                )
+            state.responses = state.errors = 0
+            if error_ratio > self.error_threshold:
+                self._decrease(host, state, 0.7, f"{error_ratio:.0%} errors")
+            elif slow:
+                self._decrease(host, state, 0.9, "latency rising")
+            else:
+                self._increase(host, state)
+
+    def _increase(self, host, state):
+        rate = min(self.max_rate, state.rate + self.increase_step)
+        limit = min(self.max_concurrency, state.limit + 1)
+        if (rate, limit) == (state.rate, state.limit):
+            return
+        state.stats["increases"] += 1
+        self._apply(host, state, rate, limit)
+
+    def _decrease(self, host, state, factor, reason):
+        now = self._clock()
+        if now - state.last_decrease < self.cooldown:
+            return
+        state.last_decrease = now
+        state.stats["decreases"] += 1
+        rate = max(self.min_rate, state.rate * factor)
+        limit = max(1, int(state.limit * factor))
+        LOGGER.info(
+            "Backing off %s (%s): %.2f -> %.2f req/s, concurrency %s -> %s",
+            host,
+            reason,
+            state.rate,
+            rate,
+            state.limit,
+            limit,
+        )
+        self._apply(host, state, rate, limit)
+
+    def _apply(self, host, state, rate, limit):
+        state.rate = rate
+        state.limit = limit
+        self.rate_limiter.bucket(host).set_rate(rate)
+        self._gates[host].set_limit(limit)
+
+    def _state(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            bucket = self.rate_limiter.bucket(host)
+            rate = bucket.rate if bucket.rate > 0 else self.initial_rate
+            rate = min(max(rate, self.min_rate), self.max_rate)
+            state = HostState(rate, self.initial_concurrency)
+            self._hosts[host] = state
+            self._gates[host] = ConcurrencyGate(state.limit)
+            bucket.set_rate(rate)
+        return state
+
+
+def _retry_after_seconds(value):
+    if value in (None, ""):
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _host(url):
+    if "://" not in url:
+        return url.lower()
+    return (urlparse(url).hostname or "").lower()
+
+
+__all__ = ["AdaptiveController", "ConcurrencyGate"]
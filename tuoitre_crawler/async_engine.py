@@ -0,0 +1,468 @@
+"""Asyncio crawl engine that shares parsing and output with TuoiTreCrawler."""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from pathlib import Path
+from urllib.parse import urlparse
+
+from .cache import url_class
+from .comments import comment_params, parse_comment_payload, plan_comment_pages
+from .constants import COMMENT_PAGE_SIZE, LOGGER_NAME
+from .discovery import (
+    FEED,
+    LISTING,
+    iter_feed,
+    iter_sitemap,
+    open_xml,
+    plan_listing_pages,
+    source_kind,
+)
+from .helpers import canonicalize_url
+from .media import MEDIA_HEADERS, PART_SUFFIX, PartialDownload
+from .sinks import CommentSpool
+from .state import DONE, FAILED
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover - optional dependency
+    aiohttp = None
+
+LOGGER = logging.getLogger(LOGGER_NAME)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class AsyncCrawlEngine:
+    """Run listing, article, comment and media requests as coroutines.
+
+    The engine borrows configuration, directories and record building from a
+    ``TuoiTreCrawler`` so both engines write identical ``<postId>.json`` files.
+    ``concurrency`` caps the number of requests in flight across all stages.
+    """
+
+    def __init__(self, crawler, concurrency=64, retries=5, backoff_factor=0.6, timeout=30):
+        if aiohttp is None:
+            raise RuntimeError("The async engine requires aiohttp (pip install aiohttp)")
+        self.crawler = crawler
+        self.concurrency = max(1, concurrency)
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self._session = None
+        self._semaphore = None
+        self._slots_changed = None
+        self._active = defaultdict(int)
+
+    def run(self, categories, posts_per_category):
+        return asyncio.run(self._run(categories, posts_per_category))
+
+    async def _run(self, categories, posts_per_category):
+        summary = {
+            "total_posts": 0,
+            "total_comments": 0,
+            "categories": {},
+            "comment_rich_posts": 0,
+        }
+        self.crawler.listing_audio_map.clear()
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._slots_changed = asyncio.Condition()
+        timeout = aiohttp.ClientTimeout(sock_connect=self.timeout, sock_read=self.timeout)
+        headers = dict(self.crawler.session.headers)
+        # One pooled connection per request slot; the per-host split is left to
+        # the semaphore and the adaptive host slots.
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=0)
+        async with aiohttp.ClientSession(
+            headers=headers,
+            timeout=timeout,
+            connector=connector,
+            trace_configs=[self._trace_config()],
+        ) as session:
+            self._session = session
+            retries = []
+            if self.crawler.resume:
+                await asyncio.to_thread(self.crawler._retry_pending_media)
+                failed = self.crawler.state.failed_urls()
+                summary["retried"] = len(failed)
+                retries = [self._process_guarded(url, slug or "unknown") for url, slug in failed]
+            per_category, retried = await asyncio.gather(
+                asyncio.gather(
+                    *(self._crawl_category(url, posts_per_category) for url in categories)
+                ),
+                asyncio.gather(*retries),
+            )
+        self._session = None
+        await asyncio.to_thread(self.crawler._finish_run, summary)
+        for category_url, (count, results) in zip(categories, per_category):
+            summary["categories"][category_url] = count
+            for result in results:
+                self.crawler._tally(summary, result)
+        for result in retried:
+            if result:
+                self.crawler._tally(summary, result)
+        return summary
+
+    def _trace_config(self):
+        """Report requests and new connections to the crawler's ConnectionStats."""
+        stats = self.crawler.connection_stats
+        trace = aiohttp.TraceConfig()
+
+        async def request_start(session, context, params):
+            context.host = params.url.host
+            stats.request(context.host)
+
+        async def connect_start(session, context, params):
+            context.connect_started = time.monotonic()
+
+        async def connect_end(session, context, params):
+            stats.connected(context.host, time.monotonic() - context.connect_started)
+
+        trace.on_request_start.append(request_start)
+        trace.on_connection_create_start.append(connect_start)
+        trace.on_connection_create_end.append(connect_end)
+        return trace
+
+    async def _crawl_category(self, category_url, posts_per_category):
+        LOGGER.info("Collecting targets for %s", category_url)
+        category_slug = self.crawler._category_slug(category_url)
+        tasks = []
+        async for url in self.iter_category_posts(category_url, posts_per_category):
+            tasks.append(asyncio.create_task(self._process_guarded(url, category_slug)))
+        LOGGER.info("Queued %s posts for %s", len(tasks), category_url)
+        outcomes = await asyncio.gather(*tasks)
+        return len(tasks), [item for item in outcomes if item]
+
+    async def collect_category_posts(self, category_url, target_count):
+        return [url async for url in self.iter_category_posts(category_url, target_count)]
+
+    async def iter_category_posts(self, category_url, target_count):
+        kind = source_kind(category_url)
+        if kind == LISTING:
+            source = self._iter_listing_posts(category_url, target_count)
+        else:
+            source = self._iter_xml_posts(category_url, kind)
+        collected = set()
+        async for location in source:
+            full = canonicalize_url(location)
+            if full not in collected:
+                collected.add(full)
+                yield full
+                if len(collected) >= target_count:
+                    break
+
+    async def _iter_listing_posts(self, category_url, target_count):
+        accepted = []
+        planner = plan_listing_pages(
+            accepted.append, target_count, self.crawler.listing_prefetch
+        )
+        pages = next(planner)
+        while pages is not None:
+            results = await asyncio.gather(
+                *(self._fetch_listing_page(category_url, page) for page in pages)
+            )
+            try:
+                pages = planner.send(list(results))
+            except StopIteration:
+                pages = None
+            for url in accepted:
+                yield url
+            accepted.clear()
+
+    async def _fetch_listing_page(self, category_url, page):
+        page_url = self.crawler._page_url(category_url, page)
+        html = await self.fetch_html(page_url)
+        if not html:
+            LOGGER.warning("Empty response for %s", page_url)
+            return None
+        anchors = await asyncio.to_thread(self.crawler._listing_links, html)
+        if not anchors:
+            LOGGER.info("No more posts on %s", page_url)
+        return [canonicalize_url(href) for href in anchors]
+
+    async def _iter_xml_posts(self, url, kind):
+        """Article URLs from a feed, or from a sitemap and its child sitemaps."""
+        dates = self.crawler.discovery_dates
+        sitemaps = [url]
+        while sitemaps:
+            url = sitemaps.pop(0)
+            body = await self._get(url)
+            if body is None:
+                LOGGER.warning("Empty response for %s", url)
+                continue
+            entries = await asyncio.to_thread(_xml_entries, body, url, kind, dates)
+            for entry_kind, location in entries:
+                if entry_kind == "sitemap":
+                    sitemaps.append(location)
+                else:
+                    yield location
+
+    async def _process_guarded(self, url, category_slug):
+        try:
+            return await self.process_single_post(url, category_slug)
+        except Exception as exc:  # pragma: no cover - logging path
+            LOGGER.error("Failed to process %s: %s", url, exc)
+            self.crawler.state.mark_url(url, FAILED, category_slug, error=str(exc))
+            return None
+
+    async def process_single_post(self, url, fallback_category):
+        if not self.crawler.claims.claim_url(url):
+            LOGGER.debug("Skipping duplicate URL %s", url)
+            return None
+        try:
+            return await self._process_claimed_post(url, fallback_category)
+        except Exception:
+            self.crawler.claims.release(url=url)
+            raise
+
+    async def _process_claimed_post(self, url, fallback_category):
+        if self.crawler.resume:
+            finished = self.crawler._resumed_post(url=url)
+            if finished:
+                return finished
+        html = await self.fetch_html(url)
+        finished, meta = await asyncio.to_thread(
+            self.crawler._prepare_post, url, html, fallback_category
+        )
+        if meta is None:
+            return finished
+        post_id = meta["postId"]
+
+        html = None
+        comment_payload = await self.fetch_comments(post_id)
+        meta["comments"] = comment_payload["items"]
+        meta["comment_count"] = comment_payload["count"]
+
+        image_targets = self.crawler._image_targets(post_id, meta["images"])
+        audio_targets = self.crawler._audio_targets(post_id, meta["audio"])
+        if self.crawler.media is not None:
+            local_images = self.crawler._queue_media(post_id, image_targets)
+            local_audio = self.crawler._queue_media(post_id, audio_targets)
+        else:
+            local_images, local_audio = await asyncio.gather(
+                self._download_all(post_id, image_targets),
+                self._download_all(post_id, audio_targets),
+            )
+
+        record = self.crawler._build_record(post_id, url, meta, local_audio, local_images)
+        self.crawler._finish_claim(post_id, meta, comment_payload)
+        return await asyncio.to_thread(
+            self.crawler._save_record, record, meta.get("content_hash")
+        )
+
+    async def fetch_comments(self, post_id, page_size=None):
+        crawler = self.crawler
+        size = page_size or crawler.comment_page_size or COMMENT_PAGE_SIZE
+        spool = CommentSpool(crawler.comment_memory_budget)
+        accepted = []
+        planner = plan_comment_pages(
+            accepted.append,
+            page_size=size,
+            auto=not (page_size or crawler.comment_page_size),
+            prefetch=crawler.comment_prefetch,
+        )
+        started = time.monotonic()
+        request = next(planner)
+        while request is not None:
+            pages = await asyncio.gather(
+                *(self._fetch_comment_page(post_id, page, size) for page, size in request)
+            )
+            try:
+                request = planner.send(list(pages))
+            except StopIteration as done:
+                request, total_pages = None, done.value
+            # Normalize off the event loop, one window of pages at a time.
+            for batch in accepted:
+                await asyncio.to_thread(self._spool_batch, spool, batch)
+            accepted.clear()
+        crawler.metrics.observe("comments", time.monotonic() - started)
+        crawler._count_spill(spool)
+        return {"items": spool, "count": len(spool), "pages": total_pages}
+
+    def _spool_batch(self, spool, batch):
+        spool.extend(self.crawler._normalize_comments(batch))
+
+    async def _fetch_comment_page(self, post_id, page, page_size):
+        body = await self._get(
+            self.crawler.comment_api, params=comment_params(post_id, page, page_size)
+        )
+        if body is None:
+            return None, None
+        try:
+            payload = _loads(body)
+        except ValueError:
+            return None, None
+        return parse_comment_payload(payload)
+
+    async def _download_all(self, post_id, targets):
+        outcomes = await asyncio.gather(
+            *(self.write_binary(url, dest) for url, dest, _ in targets)
+        )
+        for (url, dest, _), ok in zip(targets, outcomes):
+            self.crawler.state.mark_media(url, dest, post_id, DONE if ok else FAILED)
+        return [relative for (_, _, relative), ok in zip(targets, outcomes) if ok]
+
+    async def write_binary(self, url, dest):
+        dest = Path(dest)
+        metrics = self.crawler.metrics
+        if dest.exists():
+            head = await self._request(
+                url, _content_length, method="HEAD", headers=MEDIA_HEADERS
+            )
+            if head is not None and head == dest.stat().st_size:
+                metrics.increment("media_verified")
+                return True
+        partial = PartialDownload(url, dest.with_name(dest.name + PART_SUFFIX))
+
+        async def consume(response):
+            chunk_size = await asyncio.to_thread(partial.start, response.status, response.headers)
+            try:
+                async for chunk in response.content.iter_chunked(chunk_size):
+                    partial.write(chunk)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+                # Not retried here: the next attempt resumes from what reached the part.
+                LOGGER.warning(
+                    "Media transfer for %s broke off after %s bytes: %s", url, partial.size, exc
+                )
+                partial.abort()
+                return False
+            except BaseException:
+                partial.abort()
+                raise
+            return await asyncio.to_thread(partial.finish)
+
+        if partial.complete:
+            finished = await asyncio.to_thread(partial.finish)
+        else:
+            try:
+                finished = await self._request(url, consume, headers=partial.request_headers())
+            except (BlockingIOError, ValueError) as exc:
+                LOGGER.warning("Dropping partial media for %s: %s", url, exc)
+                partial.discard()
+                return False
+        if not finished:
+            return False
+        os.replace(partial.part, dest)
+        if partial.resumed:
+            metrics.increment("media_resumed")
+        metrics.add_bytes("media", partial.fetched)
+        return True
+
+    async def fetch_html(self, url):
+        async def decode(response):
+            body = await response.read()
+            self.crawler.metrics.add_bytes(url_class(url), len(body))
+            return body.decode(response.charset or "utf-8", errors="replace")
+
+        return await self._request(url, decode) or ""
+
+    async def _get(self, url, params=None):
+        async def read(response):
+            body = await response.read()
+            self.crawler.metrics.add_bytes(url_class(url), len(body))
+            return body
+
+        return await self._request(url, read, params=params)
+
+    async def _request(self, url, consume, params=None, method="GET", headers=None):
+        metrics = self.crawler.metrics
+        stage = f"fetch.{url_class(url)}"
+        adaptive = self.crawler.adaptive
+        for attempt in range(self.retries + 1):
+            retry_after = None
+            try:
+                async with self._host_slot(url):
+                    await self._throttle(url)
+                    async with self._semaphore:
+                        started = time.monotonic()
+                        async with self._session.request(
+                            method, url, params=params, headers=headers
+                        ) as response:
+                            elapsed = time.monotonic() - started
+                            metrics.observe(stage, elapsed)
+                            if adaptive is not None:
+                                adaptive.observe(
+                                    url,
+                                    response.status,
+                                    elapsed,
+                                    response.headers.get("Retry-After"),
+                                )
+                            if response.status in RETRY_STATUSES and attempt < self.retries:
+                                retry_after = _retry_after(response.headers.get("Retry-After"))
+                            else:
+                                metrics.count_request(url, response.status, attempt)
+                                response.raise_for_status()
+                                return await consume(response)
+            except aiohttp.ClientResponseError as exc:
+                # Already counted; retryable statuses only get here once retries ran out.
+                LOGGER.warning("Request failed for %s: %s", url, exc)
+                return None
+            except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+                if adaptive is not None:
+                    adaptive.observe(url, "error")
+                if attempt >= self.retries:
+                    metrics.count_request(url, "error", attempt)
+                    LOGGER.warning("Request failed for %s: %s", url, exc)
+                    return None
+            await asyncio.sleep(self._backoff(attempt, retry_after))
+        return None
+
+    def _backoff(self, attempt, retry_after):
+        if retry_after is not None:
+            # The adaptive controller has already paused the host's bucket.
+            return 0.0 if self.crawler.adaptive is not None else retry_after
+        return self.backoff_factor * (2**attempt)
+
+    @asynccontextmanager
+    async def _host_slot(self, url):
+        adaptive = self.crawler.adaptive
+        if adaptive is None:
+            yield
+            return
+        host = urlparse(url).hostname
+        async with self._slots_changed:
+            await self._slots_changed.wait_for(lambda: self._active[host] < adaptive.limit(url))
+            self._active[host] += 1
+        try:
+            yield
+        finally:
+            async with self._slots_changed:
+                self._active[host] -= 1
+                self._slots_changed.notify_all()
+
+    async def _throttle(self, url):
+        wait = self.crawler.rate_limiter.reserve(url)
+        self.crawler.metrics.observe("throttle", wait)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+def _xml_entries(body, url, kind, dates):
+    stream = open_xml(body, url)
+    if kind == FEED:
+        return [("url", location) for location, _ in iter_feed(stream, dates)]
+    return [entry[:2] for entry in iter_sitemap(stream, dates)]
+
+
+async def _content_length(response):
+    value = response.headers.get("Content-Length", "")
+    return int(value) if value.isdigit() else None
+
+
+def _loads(body):
+    return json.loads(body.decode("utf-8", errors="replace"))
+
+
+def _retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+__all__ = ["AsyncCrawlEngine"]
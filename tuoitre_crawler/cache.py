@@ -0,0 +1,396 @@
+"""Disk-backed HTTP cache with conditional revalidation and LRU eviction."""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlparse
+
+from requests import Response
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+DEFAULT_TTLS = {
+    "listing": 300,
+    "article": 7 * 24 * 3600,
+    "media": 365 * 24 * 3600,
+    "api": 0,
+    "other": 3600,
+}
+
+MEDIA_SUFFIXES = {
+    ".jpg",
+    ".jpeg",
+    ".png",
+    ".gif",
+    ".webp",
+    ".avif",
+    ".svg",
+    ".mp3",
+    ".m4a",
+    ".aac",
+    ".ogg",
+    ".mp4",
+}
+
+ARTICLE_PATTERN = re.compile(r"-\d{8,}\.htm$")
+COMMENT_API_PATH = "/getlist-comment.api"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    stored_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_access ON entries (last_access);
+"""
+
+
+def url_class(url):
+    parsed = urlparse(url)
+    path = parsed.path.lower()
+    if path.endswith(COMMENT_API_PATH):
+        return "api"
+    if Path(path).suffix in MEDIA_SUFFIXES:
+        return "media"
+    if path.endswith(".htm"):
+        return "article" if ARTICLE_PATTERN.search(path) else "listing"
+    return "other"
+
+
+class HttpCache:
+    """Response bodies on disk, indexed by URL in SQLite.
+
+    ``ttls`` maps a URL class from :func:`url_class` to seconds a stored
+    response is served without contacting the server; a TTL of 0 disables
+    caching for that class. Once an entry expires it is revalidated with
+    ``If-None-Match``/``If-Modified-Since``. The least recently used entries
+    are evicted when the bodies exceed ``max_bytes``; the running total is
+    read from the index once and kept up to date by this instance.
+    """
+
+    def __init__(
+        self, directory, max_bytes=2 * 1024**3, ttls=None, max_entry_bytes=32 * 1024**2
+    ):
+        self.directory = Path(directory)
+        self.bodies = self.directory / "bodies"
+        self.bodies.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.ttls = dict(DEFAULT_TTLS)
+        self.ttls.update(ttls or {})
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            str(self.directory / "index.sqlite3"), check_same_thread=False
+        )
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            self._total = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()[0]
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0, "stored": 0, "evicted": 0}
+
+    def ttl_for(self, url):
+        return self.ttls.get(url_class(url), 0)
+
+    def lookup(self, url):
+        key = _key(url)
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        path = self._body_path(key)
+        if not path.exists():
+            self._delete(key)
+            return None
+        entry = dict(row)
+        entry["headers"] = json.loads(entry["headers"])
+        entry["path"] = path
+        return entry
+
+    def fresh(self, entry):
+        return entry["expires_at"] > time.time()
+
+    def read_body(self, entry):
+        self._touch(entry["key"], None)
+        return entry["path"].read_bytes()
+
+    def open_body(self, entry):
+        self._touch(entry["key"], None)
+        return open(entry["path"], "rb")
+
+    def store(self, url, status, headers, body):
+        writer = self.writer(url, status, headers)
+        if writer is not None:
+            writer.write(body)
+            writer.close(commit=True)
+
+    def writer(self, url, status, headers):
+        """Return a :class:`BodyWriter` for a body read in chunks, or None if not cached."""
+        if self.ttl_for(url) <= 0:
+            return None
+        return BodyWriter(self, url, status, headers)
+
+    def _commit(self, url, status, headers, tmp_name, size):
+        ttl = self.ttl_for(url)
+        key = _key(url)
+        os.replace(tmp_name, self._body_path(key))
+        now = time.time()
+        stored_headers = {
+            name: value
+            for name, value in headers.items()
+            if name.lower() not in {"content-encoding", "transfer-encoding", "content-length"}
+        }
+        with self._lock, self._conn:
+            previous = self._conn.execute(
+                "SELECT size FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO entries
+                    (key, url, status, headers, etag, last_modified,
+                     stored_at, expires_at, size, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    key,
+                    url,
+                    status,
+                    json.dumps(stored_headers),
+                    headers.get("ETag"),
+                    headers.get("Last-Modified"),
+                    now,
+                    now + ttl,
+                    size,
+                    now,
+                ),
+            )
+            self._total += size - (previous["size"] if previous else 0)
+            self.stats["stored"] += 1
+        self._evict()
+
+    def count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def refresh(self, entry, headers):
+        expires_at = time.time() + self.ttl_for(entry["url"])
+        self._touch(entry["key"], expires_at, headers.get("ETag"), headers.get("Last-Modified"))
+
+    def _touch(self, key, expires_at, etag=None, last_modified=None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                UPDATE entries SET
+                    last_access = ?,
+                    expires_at = COALESCE(?, expires_at),
+                    etag = COALESCE(?, etag),
+                    last_modified = COALESCE(?, last_modified)
+                WHERE key = ?
+                """,
+                (time.time(), expires_at, etag, last_modified, key),
+            )
+
+    def _evict(self):
+        with self._lock:
+            if self._total <= self.max_bytes:
+                return
+            target = int(self.max_bytes * 0.9)
+            victims = []
+            for row in self._conn.execute("SELECT key, size FROM entries ORDER BY last_access"):
+                if self._total <= target:
+                    break
+                victims.append(row["key"])
+                self._total -= row["size"]
+            with self._conn:
+                self._conn.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k in victims])
+            self.stats["evicted"] += len(victims)
+        for key in victims:
+            self._body_path(key).unlink(missing_ok=True)
+
+    def _delete(self, key):
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._total -= row["size"]
+
+    def _body_path(self, key):
+        return self.bodies / key[:2] / key
+
+
+class BodyWriter:
+    """Write a response body to a temporary file and add it to the cache on commit.
+
+    Bodies larger than the cache's ``max_entry_bytes`` are dropped as soon as
+    they pass the limit.
+    """
+
+    def __init__(self, cache, url, status, headers):
+        self.cache = cache
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.size = 0
+        directory = cache._body_path(_key(url)).parent
+        directory.mkdir(parents=True, exist_ok=True)
+        fd, self._tmp_name = tempfile.mkstemp(dir=directory)
+        self._file = os.fdopen(fd, "wb")
+
+    def write(self, chunk):
+        if self._file is None:
+            return
+        self.size += len(chunk)
+        if self.size > self.cache.max_entry_bytes:
+            self.close(commit=False)
+            return
+        self._file.write(chunk)
+
+    def close(self, commit):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        if commit:
+            self.cache._commit(self.url, self.status, self.headers, self._tmp_name, self.size)
+        else:
+            os.unlink(self._tmp_name)
+
+
+class CachingAdapter(HTTPAdapter):
+    """``HTTPAdapter`` that answers GETs from an :class:`HttpCache`.
+
+    Fresh entries are returned without touching the network; stale ones, and
+    any entry requested with ``Cache-Control: no-cache``, are revalidated and a
+    ``304`` is turned back into the stored ``200``. Served
+    responses carry ``from_cache = True``. Range requests bypass the cache.
+    A streamed body is copied to the cache while the caller reads it and is
+    stored once it has been read to the end. Misses go out through
+    ``transport`` when one is given (e.g. an HTTP/2 adapter) and through
+    this adapter's own urllib3 pools otherwise.
+    """
+
+    def __init__(self, cache, transport=None, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache
+        self.transport = transport
+
+    def send(self, request, **kwargs):
+        if (
+            request.method != "GET"
+            or "Range" in request.headers
+            or "If-Range" in request.headers
+            or self.cache.ttl_for(request.url) <= 0
+        ):
+            return self._network(request, **kwargs)
+        entry = self.cache.lookup(request.url)
+        revalidate = "no-cache" in request.headers.get("Cache-Control", "")
+        if entry is not None and not revalidate and self.cache.fresh(entry):
+            self.cache.count("hits")
+            return self._from_entry(request, entry, kwargs.get("stream"))
+        if entry is not None:
+            if entry["etag"]:
+                request.headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                request.headers["If-Modified-Since"] = entry["last_modified"]
+        response = self._network(request, **kwargs)
+        if response.status_code == 304 and entry is not None:
+            response.close()
+            self.cache.refresh(entry, response.headers)
+            self.cache.count("revalidated")
+            return self._from_entry(request, entry, kwargs.get("stream"))
+        self.cache.count("misses")
+        if response.status_code == 200 and self._storable(response):
+            if kwargs.get("stream"):
+                writer = self.cache.writer(request.url, response.status_code, response.headers)
+                response.raw = _CachingRaw(response.raw, writer)
+            else:
+                self.cache.store(
+                    request.url, response.status_code, response.headers, response.content
+                )
+        response.from_cache = False
+        return response
+
+    def close(self):
+        super().close()
+        if self.transport is not None:
+            self.transport.close()
+
+    def _network(self, request, **kwargs):
+        if self.transport is not None:
+            return self.transport.send(request, **kwargs)
+        return super().send(request, **kwargs)
+
+    def _storable(self, response):
+        if "no-store" in response.headers.get("Cache-Control", ""):
+            return False
+        length = response.headers.get("Content-Length")
+        return not (length and length.isdigit()) or int(length) <= self.cache.max_entry_bytes
+
+    def _from_entry(self, request, entry, stream=False):
+        response = Response()
+        response.status_code = entry["status"]
+        response.reason = "OK"
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        if stream:
+            # ``iter_content`` reads a file object in chunks like a socket.
+            response.raw = self.cache.open_body(entry)
+        else:
+            response._content = self.cache.read_body(entry)
+            response._content_consumed = True
+        response.from_cache = True
+        return response
+
+
+class _CachingRaw:
+    """Wrap a streamed response's ``raw`` so ``iter_content`` also feeds a :class:`BodyWriter`."""
+
+    def __init__(self, raw, writer):
+        self._raw = raw
+        self._writer = writer
+
+    def stream(self, chunk_size=8192, decode_content=True):
+        complete = False
+        try:
+            for chunk in self._raw.stream(chunk_size, decode_content=decode_content):
+                self._writer.write(chunk)
+                yield chunk
+            complete = True
+        finally:
+            self._writer.close(commit=complete)
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+
+def parse_cache_ttl(value):
+    """Parse a ``class=seconds`` CLI override."""
+    name, sep, seconds = value.partition("=")
+    if not sep or name not in DEFAULT_TTLS:
+        raise ValueError(f"Expected one of {sorted(DEFAULT_TTLS)}=seconds, got {value!r}")
+    return name, float(seconds)
+
+
+def _key(url):
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+
+__all__ = ["HttpCache", "CachingAdapter", "url_class", "parse_cache_ttl", "DEFAULT_TTLS"]
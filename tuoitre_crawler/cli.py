@@ -3,8 +3,31 @@ import json
 import logging
 from pathlib import Path
 
-from .constants import LOGGER_NAME
-from .crawler import TuoiTreCrawler
+from .constants import LOGGER_NAME, PARSER_BACKENDS
+from .daemon import (
+    CONTROL_COMMANDS,
+    DEFAULT_INTERVAL,
+    CrawlDaemon,
+    Job,
+    check_control_address,
+    load_jobs,
+    send_command,
+)
+from .discovery import parse_day
+from .export import EXPORT_FORMATS, export_records
+from .distributed import default_worker_id, open_queue, seed_categories, wait_until_drained
+from .frontier import FRONTIER_MODES, PRIORITY
+from .ratelimit import parse_host_rate
+from .sinks import OUTPUT_FORMATS
+
+# The crawler and the HTTP cache pull in requests; they are imported when a mode
+# needs them so that --help, --control and argument errors return at once.
+
+
+def parse_cache_ttl(value):
+    from .cache import parse_cache_ttl
+
+    return parse_cache_ttl(value)
 
 
 def parse_args():
@@ -13,14 +36,29 @@ def parse_args():
         "--category",
         dest="categories",
         action="append",
-        required=True,
-        help="Category URL to crawl (repeat for multiple categories)",
+        default=[],
+        help="Category URL, sitemap (*.xml[.gz]) or RSS feed to crawl (repeatable)",
+    )
+    parser.add_argument(
+        "--since",
+        type=parse_day,
+        default=None,
+        metavar="YYYY-MM-DD",
+        help="Skip sitemap and feed entries dated before this day",
+    )
+    parser.add_argument(
+        "--until",
+        type=parse_day,
+        default=None,
+        metavar="YYYY-MM-DD",
+        help="Skip sitemap and feed entries dated after this day",
     )
     parser.add_argument(
         "--posts-per-category",
         type=int,
         default=40,
-        help="Target number of posts per category (>=34 to reach 100 total)",
+        help="Target number of posts per category (>=34 to reach 100 total; "
+        "0 with --queue crawls the whole history)",
     )
     parser.add_argument(
         "--output-dir",
@@ -28,6 +66,24 @@ def parse_args():
         default=Path("data"),
         help="Directory for JSON/YAML output",
     )
+    parser.add_argument(
+        "--output-format",
+        choices=OUTPUT_FORMATS,
+        default="json",
+        help="Record sink: one JSON file per post (default), size-rotated JSONL shards, or SQLite",
+    )
+    parser.add_argument(
+        "--output-compression",
+        choices=("gzip", "zstd"),
+        default=None,
+        help="Compress JSONL shards (zstd requires zstandard)",
+    )
+    parser.add_argument(
+        "--output-shard-size",
+        type=int,
+        default=256,
+        help="Uncompressed MB written to a JSONL shard before rotating to the next",
+    )
     parser.add_argument(
         "--audio-dir",
         type=Path,
@@ -44,7 +100,50 @@ def parse_args():
         "--delay",
         type=float,
         default=0.6,
-        help="Base delay between HTTP requests (seconds)",
+        help="Minimum interval between requests to one host (seconds); sets --rate when omitted",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=None,
+        help="Requests per second allowed per host, shared by all workers (0 disables)",
+    )
+    parser.add_argument(
+        "--burst",
+        type=float,
+        default=2,
+        help="Requests a host bucket may issue back to back before --rate applies",
+    )
+    parser.add_argument(
+        "--host-rate",
+        dest="host_rates",
+        action="append",
+        type=parse_host_rate,
+        default=[],
+        metavar="HOST=RATE[:BURST]",
+        help="Per-host rate override (repeatable), e.g. id.tuoitre.vn=4:8",
+    )
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="Tune each host's rate and concurrency from 429s, Retry-After, errors and latency",
+    )
+    parser.add_argument(
+        "--min-rate",
+        type=float,
+        default=0.2,
+        help="Lowest per-host rate --adaptive backs off to (requests per second)",
+    )
+    parser.add_argument(
+        "--max-rate",
+        type=float,
+        default=20.0,
+        help="Highest per-host rate --adaptive climbs to (requests per second)",
+    )
+    parser.add_argument(
+        "--http2",
+        action="store_true",
+        help="Send thread-engine and media requests over HTTP/2 via httpx (extra: http2)",
     )
     parser.add_argument(
         "--max-workers",
@@ -52,6 +151,251 @@ def parse_args():
         default=4,
         help="Maximum concurrent article fetchers",
     )
+    parser.add_argument(
+        "--listing-workers",
+        type=int,
+        default=3,
+        help="Categories paginated concurrently while articles are being fetched",
+    )
+    parser.add_argument(
+        "--listing-prefetch",
+        type=int,
+        default=4,
+        help="Listing pages of one category fetched at once once more than one is needed",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=None,
+        help="Bound on queued article URLs (defaults to 4x --max-workers)",
+    )
+    parser.add_argument(
+        "--frontier",
+        choices=FRONTIER_MODES,
+        default="fifo",
+        help="Article order: listing order (fifo) or scored by quota, recency, rank and comments",
+    )
+    parser.add_argument(
+        "--frontier-fair",
+        action="store_true",
+        help="With --frontier priority, always serve the category furthest from its target",
+    )
+    parser.add_argument(
+        "--frontier-oversample",
+        type=float,
+        default=2.0,
+        help="With --frontier priority, candidates listed per category as a multiple of its target",
+    )
+    parser.add_argument(
+        "--budget-requests",
+        type=int,
+        default=0,
+        help="Stop starting new articles after this many requests (0 disables)",
+    )
+    parser.add_argument(
+        "--budget-seconds",
+        type=float,
+        default=0,
+        help="Stop starting new articles after this many seconds (0 disables)",
+    )
+    parser.add_argument(
+        "--comment-page-size",
+        type=int,
+        default=50,
+        help="Comments requested per API page (0 sizes pages from the reported total)",
+    )
+    parser.add_argument(
+        "--comment-workers",
+        type=int,
+        default=4,
+        help="Comment pages fetched concurrently per article",
+    )
+    parser.add_argument(
+        "--comment-prefetch",
+        type=int,
+        default=4,
+        help="Pages requested ahead when the API does not report a total",
+    )
+    parser.add_argument(
+        "--comment-memory-budget",
+        type=float,
+        default=4,
+        help="MB of comments a post keeps in memory before the rest spills to a temp file",
+    )
+    parser.add_argument(
+        "--media-workers",
+        type=int,
+        default=4,
+        help=(
+            "Background media downloader threads, for both engines "
+            "(0 downloads inline before saving each post)"
+        ),
+    )
+    parser.add_argument(
+        "--media-rate",
+        type=float,
+        default=0,
+        help="Media download cap in bytes per second (0 disables)",
+    )
+    parser.add_argument(
+        "--media-store",
+        type=Path,
+        default=None,
+        help="Content-addressed media store (defaults to .media-store next to --images-dir)",
+    )
+    parser.add_argument(
+        "--state-db",
+        type=Path,
+        default=None,
+        help="Crawl state database (defaults to crawl_state.sqlite3 in --output-dir)",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip posts and media finished by earlier runs and retry their failures",
+    )
+    parser.add_argument(
+        "--http-cache",
+        type=Path,
+        default=None,
+        help="Directory for the on-disk HTTP cache (disabled when omitted)",
+    )
+    parser.add_argument(
+        "--http-cache-size",
+        type=int,
+        default=2048,
+        help="HTTP cache size limit in MB before least recently used entries are evicted",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        dest="cache_ttls",
+        action="append",
+        type=parse_cache_ttl,
+        default=[],
+        metavar="CLASS=SECONDS",
+        help="Override a cache TTL for listing, article, media, api or other URLs",
+    )
+    parser.add_argument(
+        "--parser",
+        dest="parser_backend",
+        choices=("auto", *PARSER_BACKENDS),
+        default="auto",
+        help="HTML parser backend; auto is html.parser (lxml repairs bad markup differently)",
+    )
+    parser.add_argument(
+        "--parse-workers",
+        type=int,
+        default=0,
+        help="Worker processes for HTML parsing and comment normalization (0 parses in-thread)",
+    )
+    parser.add_argument(
+        "--metrics-report",
+        type=Path,
+        default=None,
+        help="Write a JSON report of stage latencies, request counts and bytes after the run",
+    )
+    parser.add_argument(
+        "--progress-interval",
+        type=float,
+        default=0,
+        help="Log a progress line every N seconds (0 disables)",
+    )
+    parser.add_argument(
+        "--prometheus-file",
+        type=Path,
+        default=None,
+        help="Prometheus text file refreshed every --progress-interval and at the end of the run",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=("thread", "async"),
+        default="thread",
+        help="Crawl engine: thread pool (default) or asyncio (requires aiohttp)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=64,
+        help=(
+            "Maximum in-flight page and comment requests for the async engine "
+            "(media too with --media-workers 0)"
+        ),
+    )
+    parser.add_argument(
+        "--queue",
+        default=None,
+        metavar="PATH|redis://HOST:PORT/DB",
+        help="Shared work queue for a distributed crawl: a SQLite file or a Redis URL",
+    )
+    parser.add_argument(
+        "--role",
+        choices=("coordinator", "worker"),
+        default="worker",
+        help="With --queue: seed the categories and wait (coordinator) or process tasks (worker)",
+    )
+    parser.add_argument(
+        "--worker-id",
+        default=None,
+        help="Name this worker reports in the queue (defaults to host-pid-random)",
+    )
+    parser.add_argument(
+        "--lease-timeout",
+        type=float,
+        default=300,
+        help="Seconds a leased task stays invisible before another worker may take it",
+    )
+    parser.add_argument(
+        "--refresh-comments",
+        action="store_true",
+        help="Instead of crawling, add new comments and reactions to the posts in --output-dir",
+    )
+    parser.add_argument(
+        "--export",
+        type=Path,
+        default=None,
+        metavar="DIR",
+        help="Instead of crawling, export posts and flattened comments in --output-dir to DIR",
+    )
+    parser.add_argument(
+        "--export-format",
+        choices=EXPORT_FORMATS,
+        default="auto",
+        help="Parquet (needs pyarrow) or gzipped CSV; auto uses Parquet when pyarrow is installed",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Stay running: re-crawl every --interval seconds and on --control-socket triggers",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=DEFAULT_INTERVAL,
+        help="Seconds between scheduled --daemon runs (0 runs only when triggered)",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=Path,
+        default=None,
+        help="JSON file of named --daemon jobs: {name: {categories, posts_per_category, interval}}",
+    )
+    parser.add_argument(
+        "--control-socket",
+        default=None,
+        metavar="PATH|HOST:PORT",
+        help="Control socket of a --daemon: a Unix socket path or a loopback TCP address",
+    )
+    parser.add_argument(
+        "--control",
+        choices=CONTROL_COMMANDS,
+        default=None,
+        help="Send a command to the daemon at --control-socket and print its reply",
+    )
+    parser.add_argument(
+        "--job",
+        default=None,
+        help="With --control run, the job to run (all jobs when omitted)",
+    )
     parser.add_argument(
         "--min-comments-target",
         type=int,
@@ -62,6 +406,46 @@ def parse_args():
 
 
 def validate_args(args):
+    if args.control:
+        if not args.control_socket:
+            raise SystemExit("--control needs --control-socket")
+        return
+    if args.daemon and (args.export or args.refresh_comments or args.queue):
+        raise SystemExit("--daemon runs on its own; drop --queue, --refresh-comments and --export")
+    if args.export:
+        if args.queue or args.refresh_comments:
+            raise SystemExit("--export runs on its own; drop --queue and --refresh-comments")
+        return
+    if args.refresh_comments:
+        if args.queue:
+            raise SystemExit("--refresh-comments runs on one machine; drop --queue")
+        return
+    if args.queue:
+        if args.role == "coordinator" and not args.categories:
+            raise SystemExit("The coordinator needs at least one --category")
+        if args.role == "worker" and args.engine != "thread":
+            raise SystemExit("Distributed workers run on the thread engine")
+        return
+    if args.engine == "async" and (
+        args.frontier == PRIORITY or args.budget_requests or args.budget_seconds
+    ):
+        raise SystemExit("--frontier priority and crawl budgets run on the thread engine")
+    if args.engine == "async" and args.http_cache:
+        raise SystemExit("--http-cache runs on the thread engine")
+    if args.daemon:
+        if not args.categories and not args.jobs:
+            raise SystemExit("--daemon needs --category or --jobs")
+        if args.interval < 0:
+            raise SystemExit("--interval cannot be negative")
+        if not args.interval and not args.jobs and not args.control_socket:
+            raise SystemExit("--daemon --interval 0 only runs on triggers; add --control-socket")
+        if args.control_socket:
+            try:
+                check_control_address(args.control_socket)
+            except ValueError as exc:
+                raise SystemExit(str(exc))
+        # Scheduled recrawls pick up what is new; the one-off minimums do not apply.
+        return
     if len(args.categories) < 3:
         raise SystemExit("Provide at least three category URLs")
     total_target = args.posts_per_category * len(args.categories)
@@ -81,6 +465,55 @@ def main():
     configure_logging()
     args = parse_args()
     validate_args(args)
+    logger = logging.getLogger(LOGGER_NAME)
+    if args.control:
+        try:
+            reply = send_command(args.control_socket, args.control, job=args.job)
+        except OSError as exc:
+            raise SystemExit(f"Cannot reach the daemon at {args.control_socket}: {exc}")
+        print(json.dumps(reply, ensure_ascii=False, indent=2))
+        return
+    if args.export:
+        summary = export_records(args.output_dir, args.export, export_format=args.export_format)
+        logger.info("Export summary: %s", json.dumps(summary))
+        return
+    queue = None
+    if args.queue:
+        queue = open_queue(args.queue, visibility_timeout=args.lease_timeout)
+        if args.role == "coordinator":
+            try:
+                added = seed_categories(queue, args.categories, args.posts_per_category)
+                logger.info("Seeded %s new categories into %s", added, args.queue)
+                counts = wait_until_drained(queue, interval=args.progress_interval or 10)
+            finally:
+                queue.close()
+            logger.info("Queue drained: %s", json.dumps(counts))
+            return
+        args.worker_id = args.worker_id or default_worker_id()
+        if args.output_format != "json":
+            # JSONL shards and SQLite files are single-writer; give each worker its own.
+            args.output_dir = args.output_dir / args.worker_id
+    jobs = None
+    if args.daemon:
+        if args.jobs:
+            try:
+                jobs = load_jobs(args.jobs, args.posts_per_category, args.interval)
+            except (OSError, ValueError) as exc:
+                raise SystemExit(f"Cannot read --jobs: {exc}")
+        else:
+            jobs = [Job("default", args.categories, args.posts_per_category, args.interval)]
+        if not args.control_socket and not any(job.interval for job in jobs):
+            raise SystemExit("No --jobs entry has an interval; add --control-socket")
+    from .cache import HttpCache
+    from .crawler import TuoiTreCrawler
+
+    http_cache = None
+    if args.http_cache:
+        http_cache = HttpCache(
+            args.http_cache,
+            max_bytes=args.http_cache_size * 1024**2,
+            ttls=dict(args.cache_ttls),
+        )
     crawler = TuoiTreCrawler(
         output_dir=args.output_dir,
         audio_dir=args.audio_dir,
@@ -88,9 +521,57 @@ def main():
         delay=args.delay,
         max_workers=args.max_workers,
         min_comments_target=args.min_comments_target,
+        engine=args.engine,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        burst=args.burst,
+        host_rates=dict(args.host_rates),
+        listing_workers=args.listing_workers,
+        listing_prefetch=args.listing_prefetch,
+        since=args.since,
+        until=args.until,
+        queue_size=args.queue_size,
+        comment_page_size=args.comment_page_size,
+        comment_workers=args.comment_workers,
+        comment_prefetch=args.comment_prefetch,
+        comment_memory_budget=int(args.comment_memory_budget * 1024**2),
+        media_workers=args.media_workers,
+        media_rate=args.media_rate,
+        media_store=args.media_store,
+        state_path=args.state_db,
+        resume=args.resume,
+        http_cache=http_cache,
+        parser_backend=args.parser_backend,
+        parse_workers=args.parse_workers,
+        output_format=args.output_format,
+        output_compression=args.output_compression,
+        output_shard_size=args.output_shard_size * 1024**2,
+        metrics_report=args.metrics_report,
+        progress_interval=args.progress_interval,
+        prometheus_path=args.prometheus_file,
+        adaptive=args.adaptive,
+        min_rate=args.min_rate,
+        max_rate=args.max_rate,
+        http2=args.http2,
+        frontier=args.frontier,
+        frontier_fair=args.frontier_fair,
+        frontier_oversample=args.frontier_oversample,
+        budget_requests=args.budget_requests,
+        budget_seconds=args.budget_seconds,
     )
-    summary = crawler.run(args.categories, args.posts_per_category)
-    logger = logging.getLogger(LOGGER_NAME)
+    try:
+        if args.refresh_comments:
+            summary = crawler.refresh_comments()
+        elif queue is not None:
+            summary = crawler.run_worker(queue, args.worker_id)
+        elif jobs is not None:
+            summary = CrawlDaemon(crawler, jobs, control=args.control_socket).serve_forever()
+        else:
+            summary = crawler.run(args.categories, args.posts_per_category)
+    finally:
+        crawler.close()
+        if queue is not None:
+            queue.close()
     logger.info("Crawl summary: %s", json.dumps(summary, ensure_ascii=False, indent=2))
 
 
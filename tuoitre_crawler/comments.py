@@ -0,0 +1,220 @@
+"""Comment API pagination shared by the thread and async engines.
+
+``plan_comment_pages`` is a generator that decides which pages to request
+next without doing any I/O itself: it yields a list of ``(page, page_size)``
+pairs and expects the caller to send back one ``(batch, total)`` tuple per
+pair, in the same order. The caller is free to fetch each list concurrently.
+Every page that belongs to the thread is handed to ``accept`` as soon as it
+is received, less any comment whose ``id`` was already handed over (an auto
+page size fetches page 1 again at the larger size), and the generator returns
+the number of pages received. Once a
+total is known the remaining pages are requested ``max_window`` at a time, so
+no more than one window of raw pages is held however long the thread is.
+``plan_comment_refresh`` follows the same protocol for posts that are already
+stored and only need the comments added since.
+"""
+
+import json
+
+from .constants import (
+    COMMENT_APP_KEY,
+    COMMENT_MAX_PAGE_SIZE,
+    COMMENT_MAX_WINDOW,
+    COMMENT_PAGE_SIZE,
+    COMMENT_PREFETCH,
+)
+
+TOTAL_KEYS = ("TotalCount", "totalCount", "Total", "total", "TotalComment")
+
+
+def comment_params(post_id, page, page_size):
+    return {
+        "appKey": COMMENT_APP_KEY,
+        "objId": post_id,
+        "objType": 1,
+        "pageindex": page,
+        "pagesize": page_size,
+    }
+
+
+def parse_comment_payload(payload):
+    raw = payload.get("Data") or "[]"
+    try:
+        batch = json.loads(raw)
+    except ValueError:
+        batch = []
+    return batch, _total_from_payload(payload)
+
+
+def auto_page_size(total, base=COMMENT_PAGE_SIZE, maximum=COMMENT_MAX_PAGE_SIZE):
+    pages = -(-total // base)
+    return max(base, min(maximum, pages * base))
+
+
+def plan_comment_pages(
+    accept,
+    page_size=COMMENT_PAGE_SIZE,
+    auto=False,
+    max_page_size=COMMENT_MAX_PAGE_SIZE,
+    prefetch=COMMENT_PREFETCH,
+    max_window=COMMENT_MAX_WINDOW,
+):
+    seen = set()
+    pages = collected = 0
+
+    def take(batch):
+        nonlocal pages, collected
+        pages += 1
+        fresh = []
+        for comment in batch:
+            comment_id = comment.get("id")
+            if comment_id is not None:
+                if str(comment_id) in seen:
+                    continue
+                seen.add(str(comment_id))
+            fresh.append(comment)
+        collected += len(fresh)
+        if fresh:
+            accept(fresh)
+
+    ((first, total),) = yield [(1, page_size)]
+    if not first:
+        return pages
+    take(first)
+    if len(first) < page_size:
+        return pages
+
+    size, start = page_size, 2
+    if total is not None:
+        if total <= len(first):
+            return pages
+        if auto and max_page_size > page_size:
+            size = auto_page_size(total, page_size, max_page_size)
+            start = 1
+        last = -(-total // size)
+        received = []
+        for low in range(start, last + 1, max_window):
+            high = min(last, low + max_window - 1)
+            planned = yield [(page, size) for page in range(low, high + 1)]
+            for batch, _ in planned:
+                received.append(len(batch or ()))
+                if batch:
+                    take(batch)
+        served = max(received, default=0)
+        if 0 < served < size and collected < total:
+            # The server capped our page size; continue at the size it serves.
+            size = served
+            start = collected // size + 1
+        elif received and received[-1] == size:
+            # More comments arrived since the total was reported.
+            start = last + 1
+        else:
+            return pages
+
+    prefetch = max(1, prefetch)
+    while True:
+        window = yield [(page, size) for page in range(start, start + prefetch)]
+        for batch, _ in window:
+            if not batch:
+                return pages
+            take(batch)
+            if len(batch) < size:
+                return pages
+        start += prefetch
+
+
+def plan_comment_refresh(accept, known_ids, since=None, page_size=COMMENT_PAGE_SIZE):
+    """Request pages one at a time until one reaches comments already stored.
+
+    The API lists top-level comments newest first, so the first page holding a
+    known ``id``, or a ``created_date`` older than ``since``, is the last one
+    that can contain anything new. That page is still returned so replies and
+    reactions on the stored comments it holds are refreshed as well.
+    """
+    page = 1
+    while True:
+        ((batch, _),) = yield [(page, page_size)]
+        if not batch:
+            return page - 1
+        accept(batch)
+        if len(batch) < page_size or any(
+            _is_stored(comment, known_ids, since) for comment in batch
+        ):
+            return page
+        page += 1
+
+
+def merge_comment_pages(batches):
+    seen = set()
+    merged = []
+    for batch in batches:
+        for comment in batch:
+            comment_id = str(comment.get("id"))
+            if comment_id in seen:
+                continue
+            seen.add(comment_id)
+            merged.append(comment)
+    return merged
+
+
+def merge_comment_threads(stored, fresh, newest_first=True):
+    """Fold freshly normalized comments into the ``stored`` ones.
+
+    Comments present in both take the fresh fields, so edits and
+    ``vote_reactions`` are updated, and their replies are merged the same way.
+    New top-level comments go in front, new replies at the end, matching the
+    order the API serves them in. Stored comments missing from ``fresh`` are
+    kept because a refresh only reads the newest pages. Returns
+    ``(merged, added)`` where ``added`` counts new comments and replies.
+    """
+    fresh_by_id = {comment["commentId"]: comment for comment in fresh}
+    stored_ids = {comment["commentId"] for comment in stored}
+    merged, added = [], 0
+    for comment in stored:
+        update = fresh_by_id.get(comment["commentId"])
+        if update is None:
+            merged.append(comment)
+            continue
+        replies, new_replies = merge_comment_threads(
+            comment.get("replies") or [], update.get("replies") or [], newest_first=False
+        )
+        merged.append(dict(update, replies=replies))
+        added += new_replies
+    new = [comment for comment in fresh if comment["commentId"] not in stored_ids]
+    added += sum(1 + _count_replies(comment) for comment in new)
+    merged = new + merged if newest_first else merged + new
+    return merged, added
+
+
+def _count_replies(comment):
+    return sum(1 + _count_replies(reply) for reply in comment.get("replies") or [])
+
+
+def _is_stored(raw, known_ids, since):
+    if str(raw.get("id")) in known_ids:
+        return True
+    created = raw.get("created_date")
+    return bool(since and created and created < since)
+
+
+def _total_from_payload(payload):
+    for key in TOTAL_KEYS:
+        value = payload.get(key)
+        if value is None:
+            continue
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+__all__ = [
+    "comment_params",
+    "parse_comment_payload",
+    "auto_page_size",
+    "plan_comment_pages",
+    "plan_comment_refresh",
+    "merge_comment_pages",
+    "merge_comment_threads",
+]
@@ -0,0 +1,311 @@
+"""Connection reuse statistics and the optional HTTP/2 transport."""
+
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+# Optional, and only needed for --http2: imported by the first Http2Adapter
+# rather than on every start.
+httpx = None
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class ConnectionStats:
+    """Per-host request, connection and connect-time counters.
+
+    ``requests - connections`` is the number of requests that went out on a
+    kept-alive connection. ``discarded`` counts connections thrown away
+    because the host's pool was already full, which is the symptom of a pool
+    smaller than the number of workers using it. ``mark`` starts a new window:
+    ``snapshot(since=mark())`` reports only what happened after it, and
+    ``connect_max`` is the slowest connect since the last mark.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def request(self, host, version=None):
+        with self._lock:
+            entry = self._entry(host)
+            entry["requests"] += 1
+            if version:
+                entry["versions"][version] = entry["versions"].get(version, 0) + 1
+
+    def connected(self, host, seconds):
+        with self._lock:
+            entry = self._entry(host)
+            entry["connections"] += 1
+            entry["connect_seconds"] += seconds
+            entry["connect_max"] = max(entry["connect_max"], seconds)
+
+    def discarded(self, host):
+        with self._lock:
+            self._entry(host)["discarded"] += 1
+
+    def mark(self):
+        with self._lock:
+            baseline = {}
+            for host, entry in self._hosts.items():
+                baseline[host] = dict(entry, versions=dict(entry["versions"]))
+                entry["connect_max"] = 0.0
+            return baseline
+
+    def snapshot(self, since=None):
+        with self._lock:
+            report = {}
+            for host, entry in sorted(self._hosts.items()):
+                before = (since or {}).get(host)
+                if before is not None:
+                    entry = dict(
+                        entry,
+                        requests=entry["requests"] - before["requests"],
+                        connections=entry["connections"] - before["connections"],
+                        discarded=entry["discarded"] - before["discarded"],
+                        connect_seconds=entry["connect_seconds"] - before["connect_seconds"],
+                        versions={
+                            version: count - before["versions"].get(version, 0)
+                            for version, count in entry["versions"].items()
+                            if count > before["versions"].get(version, 0)
+                        },
+                    )
+                    if not entry["requests"] and not entry["connections"]:
+                        continue
+                connections = entry["connections"]
+                reused = max(0, entry["requests"] - connections)
+                report[host] = {
+                    "requests": entry["requests"],
+                    "connections": connections,
+                    "reused": reused,
+                    "reuse_ratio": round(reused / entry["requests"], 3)
+                    if entry["requests"]
+                    else 0.0,
+                    "discarded": entry["discarded"],
+                    "connect_avg": round(entry["connect_seconds"] / connections, 4)
+                    if connections
+                    else 0.0,
+                    "connect_max": round(entry["connect_max"], 4),
+                }
+                if entry["versions"]:
+                    report[host]["versions"] = dict(entry["versions"])
+            return report
+
+    def _entry(self, host):
+        entry = self._hosts.get(host)
+        if entry is None:
+            entry = {
+                "requests": 0,
+                "connections": 0,
+                "discarded": 0,
+                "connect_seconds": 0.0,
+                "connect_max": 0.0,
+                "versions": {},
+            }
+            self._hosts[host] = entry
+        return entry
+
+
+def instrument_adapter(adapter, stats):
+    """Make the urllib3 pools behind ``adapter`` report to ``stats``."""
+    manager = adapter.poolmanager
+    manager.pool_classes_by_scheme = {
+        scheme: _instrumented_pool(pool_cls, stats)
+        for scheme, pool_cls in manager.pool_classes_by_scheme.items()
+    }
+    return adapter
+
+
+def _instrumented_pool(pool_cls, stats):
+    connection_cls = pool_cls.ConnectionCls
+
+    class TimedConnection(connection_cls):
+        def connect(self):
+            started = time.monotonic()
+            super().connect()
+            stats.connected(self.host, time.monotonic() - started)
+
+    class InstrumentedPool(pool_cls):
+        ConnectionCls = TimedConnection
+
+        def _get_conn(self, timeout=None):
+            stats.request(self.host)
+            return super()._get_conn(timeout)
+
+        def _put_conn(self, conn):
+            if conn is not None and self.pool is not None and self.pool.full():
+                stats.discarded(self.host)
+            return super()._put_conn(conn)
+
+    InstrumentedPool.__name__ = f"Instrumented{pool_cls.__name__}"
+    return InstrumentedPool
+
+
+class Http2Adapter(BaseAdapter):
+    """``requests`` transport backed by an ``httpx`` client with HTTP/2 enabled.
+
+    Requests to one host are multiplexed over a single connection when the
+    server negotiates ``h2`` and fall back to HTTP/1.1 otherwise. Retries
+    mirror the urllib3 ``Retry`` used for HTTP/1.1, including ``Retry-After``
+    and the ``observer`` callback.
+    """
+
+    def __init__(
+        self,
+        max_connections=100,
+        retries=5,
+        backoff_factor=0.6,
+        observer=None,
+        stats=None,
+    ):
+        if _import_httpx() is None:
+            raise RuntimeError("HTTP/2 requires httpx (pip install 'httpx[http2]')")
+        super().__init__()
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.observer = observer
+        self.stats = stats
+        self.client = httpx.Client(
+            http2=True,
+            follow_redirects=False,
+            limits=httpx.Limits(
+                max_connections=max_connections, max_keepalive_connections=max_connections
+            ),
+        )
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        parsed = urlparse(request.url)
+        host = parsed.hostname
+        for attempt in range(self.retries + 1):
+            try:
+                outgoing = self.client.build_request(
+                    request.method,
+                    request.url,
+                    headers=dict(request.headers),
+                    content=request.body,
+                    timeout=_httpx_timeout(timeout),
+                    extensions={"trace": self._tracer(host, parsed.scheme)},
+                )
+                response = self.client.send(outgoing, stream=True)
+            except httpx.TransportError as exc:
+                self._notify(host, "error", None)
+                if attempt >= self.retries:
+                    raise requests.ConnectionError(exc, request=request)
+                time.sleep(self.backoff_factor * (2**attempt))
+                continue
+            if self.stats is not None:
+                self.stats.request(host, response.http_version)
+            if response.status_code in RETRY_STATUSES and attempt < self.retries:
+                retry_after = response.headers.get("Retry-After")
+                self._notify(host, response.status_code, retry_after)
+                response.close()
+                time.sleep(_backoff(attempt, self.backoff_factor, retry_after))
+                continue
+            return self._build_response(request, response, stream)
+        raise requests.RetryError(f"Max retries exceeded for {request.url}", request=request)
+
+    def close(self):
+        self.client.close()
+
+    def _tracer(self, host, scheme):
+        """httpcore trace hook timing TCP connect plus any TLS handshake."""
+        done = (
+            "connection.start_tls.complete"
+            if scheme == "https"
+            else "connection.connect_tcp.complete"
+        )
+        started = []
+
+        def trace(event, info):
+            if event == "connection.connect_tcp.started":
+                started.append(time.monotonic())
+            elif event == done and started and self.stats is not None:
+                self.stats.connected(host, time.monotonic() - started.pop())
+
+        return trace
+
+    def _notify(self, host, status, retry_after):
+        if self.observer is not None:
+            self.observer(host, status, retry_after)
+
+    @staticmethod
+    def _build_response(request, source, stream):
+        response = requests.Response()
+        response.status_code = source.status_code
+        response.reason = source.reason_phrase
+        response.headers = CaseInsensitiveDict(
+            (name, value) for name, value in source.headers.multi_items()
+        )
+        # httpx hands back the decoded body, so the wire length no longer applies.
+        encoding = response.headers.pop("Content-Encoding", "identity")
+        if encoding.lower() != "identity":
+            response.headers.pop("Content-Length", None)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.http_version = source.http_version
+        if stream:
+            response.raw = _HttpxRaw(source)
+        else:
+            try:
+                response._content = source.read()
+            finally:
+                source.close()
+            response._content_consumed = True
+            if encoding.lower() != "identity":
+                response.headers["Content-Length"] = str(len(response._content))
+        return response
+
+
+class _HttpxRaw:
+    """Just enough of urllib3's ``HTTPResponse`` for ``iter_content``."""
+
+    def __init__(self, response):
+        self._response = response
+
+    def stream(self, chunk_size=8192, decode_content=True):
+        try:
+            yield from self._response.iter_bytes(chunk_size)
+        finally:
+            self._response.close()
+
+    def read(self, amt=None):
+        return self._response.read()
+
+    def close(self):
+        self._response.close()
+
+    def release_conn(self):
+        self._response.close()
+
+
+def _import_httpx():
+    global httpx
+    if httpx is None:
+        try:  # pragma: no cover - optional dependency
+            import httpx
+        except ImportError:  # pragma: no cover - optional dependency
+            return None
+    return httpx
+
+
+def _httpx_timeout(timeout):
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+        return httpx.Timeout(read, connect=connect)
+    return httpx.Timeout(timeout)
+
+
+def _backoff(attempt, factor, retry_after):
+    try:
+        return max(0.0, float(retry_after))
+    except (TypeError, ValueError):
+        return factor * (2**attempt)
+
+
+__all__ = ["ConnectionStats", "Http2Adapter", "instrument_adapter"]
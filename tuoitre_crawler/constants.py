@@ -4,6 +4,12 @@ COMMENT_API = "https://id.tuoitre.vn/api/getlist-comment.api"
 COMMENT_APP_KEY = (
     "lHLShlUMAshjvNkHmBzNqERFZammKUXB1DjEuXKfWAwkunzW6fFbfrhP/IG0Xwp7aPwhwIuucLW1TVC9lzmUoA=="
 )
+COMMENT_PAGE_SIZE = 50
+COMMENT_MAX_PAGE_SIZE = 200
+COMMENT_PREFETCH = 4
+COMMENT_MAX_WINDOW = 16
+# Bytes of normalized comments a post keeps in memory before spilling to disk.
+COMMENT_MEMORY_BUDGET = 4 * 1024**2
 
 ARTICLE_REACTION_LABELS = {
     "1": "star",
@@ -24,6 +30,12 @@ COMMENT_REACTION_LABELS = {
     "13": "star",
 }
 
+# Tree builders BeautifulSoup can use, fastest first, with the module each needs.
+PARSER_BACKENDS = {
+    "lxml": "lxml",
+    "html.parser": None,
+}
+
 USER_AGENTS = [
     "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0 Safari/537.36",
     "Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Safari/605.1.15",
@@ -35,7 +47,13 @@ __all__ = [
     "BASE_DOMAIN",
     "COMMENT_API",
     "COMMENT_APP_KEY",
+    "COMMENT_PAGE_SIZE",
+    "COMMENT_MAX_PAGE_SIZE",
+    "COMMENT_PREFETCH",
+    "COMMENT_MAX_WINDOW",
+    "COMMENT_MEMORY_BUDGET",
     "ARTICLE_REACTION_LABELS",
     "COMMENT_REACTION_LABELS",
+    "PARSER_BACKENDS",
     "USER_AGENTS",
 ]
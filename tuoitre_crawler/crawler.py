@@ -1,36 +1,94 @@
-import json
+import hashlib
 import logging
+import math
+import os
+import queue
 import random
+import threading
 import time
 from collections import defaultdict
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
 from pathlib import Path
 from urllib.parse import urlparse
 
 import requests
-from bs4 import BeautifulSoup
 
-from .constants import COMMENT_API, COMMENT_APP_KEY, LOGGER_NAME
-from .helpers import absolutize, filename_from_url
+from .adaptive import AdaptiveController
+from .cache import url_class
+from .comments import (
+    comment_params,
+    merge_comment_pages,
+    merge_comment_threads,
+    parse_comment_payload,
+    plan_comment_pages,
+    plan_comment_refresh,
+)
+from .connections import ConnectionStats
+from .constants import (
+    BASE_DOMAIN,
+    COMMENT_API,
+    COMMENT_MEMORY_BUDGET,
+    COMMENT_PAGE_SIZE,
+    COMMENT_PREFETCH,
+    LOGGER_NAME,
+)
+from .dedup import ClaimRegistry
+from .discovery import (
+    FEED,
+    SITEMAP,
+    ChunkReader,
+    DateRange,
+    iter_feed,
+    iter_sitemap,
+    open_xml,
+    plan_listing_pages,
+    source_kind,
+)
+from .frontier import PRIORITY, CrawlBudget, Frontier
+from .helpers import canonicalize_url, filename_from_url
 from .http import build_session
+from .media import PART_SUFFIX, MediaDownloader, download, is_current
+from .metrics import CrawlMetrics, MetricsReporter, response_retries
 from .parsers import (
-    extract_article_content,
-    extract_article_reactions,
-    extract_metadata,
-    extract_post_id,
-    normalize_comment,
+    extract_listing_entries,
+    extract_post_id_from_html,
+    normalize_comments,
+    parse_article,
+    parse_listing,
+    resolve_backend,
 )
+from .ratelimit import HostRateLimiter
+from .sinks import CommentSpool, SinkWriter, iter_stored_records, open_sink
+from .state import DONE, DUPLICATE, FAILED, PENDING, STATE_FILENAME, CrawlState
 
 LOGGER = logging.getLogger(LOGGER_NAME)
 
+# Comment threads at least this long are normalized in a parse worker process.
+PARSE_OFFLOAD_COMMENTS = 200
+
 
 class ProcessedPost:
-    def __init__(self, post_id, url, data_path, category, comment_count):
+    def __init__(self, post_id, url, data_path, category, comment_count, resumed=False):
         self.post_id = post_id
         self.url = url
-        self.data_path = data_path
+        self._data_path = data_path
         self.category = category
         self.comment_count = comment_count
+        self.resumed = resumed
+
+    @property
+    def data_path(self):
+        """Where the record was written, waiting for the sink if it is still queued."""
+        if isinstance(self._data_path, Future):
+            return self._data_path.result()
+        return self._data_path
 
 
 class TuoiTreCrawler:
@@ -42,70 +100,596 @@ class TuoiTreCrawler:
         delay=0.6,
         max_workers=4,
         min_comments_target=20,
+        engine="thread",
+        concurrency=64,
+        rate=None,
+        burst=2,
+        host_rates=None,
+        listing_workers=3,
+        listing_prefetch=4,
+        since=None,
+        until=None,
+        queue_size=None,
+        comment_page_size=COMMENT_PAGE_SIZE,
+        comment_workers=4,
+        comment_prefetch=COMMENT_PREFETCH,
+        comment_memory_budget=COMMENT_MEMORY_BUDGET,
+        media_workers=4,
+        media_rate=0,
+        media_store=None,
+        state_path=None,
+        resume=False,
+        http_cache=None,
+        parser_backend="auto",
+        parse_workers=0,
+        output_format="json",
+        output_compression=None,
+        output_shard_size=None,
+        metrics_report=None,
+        progress_interval=0,
+        prometheus_path=None,
+        comment_api=COMMENT_API,
+        adaptive=False,
+        min_rate=0.2,
+        max_rate=20.0,
+        http2=False,
+        claim_post=None,
+        frontier="fifo",
+        frontier_fair=False,
+        frontier_oversample=2.0,
+        budget_requests=0,
+        budget_seconds=0,
     ):
-        self.session = build_session()
+        self.comment_api = comment_api
+        self.claim_post = claim_post
+        self.metrics = CrawlMetrics()
+        self.metrics_report = metrics_report
+        self.progress_interval = progress_interval
+        self.prometheus_path = prometheus_path
+        self.http_cache = http_cache
+        self.parser_backend = resolve_backend(parser_backend)
+        self.parse_workers = parse_workers
+        self._parse_pool = None
+        self._parse_pool_lock = threading.Lock()
         self.output_dir = output_dir
         self.audio_dir = audio_dir
         self.image_dir = image_dir
         self.delay = delay
         self.max_workers = max_workers
         self.min_comments_target = min_comments_target
+        self.engine = engine
+        self.concurrency = concurrency
+        self.listing_workers = listing_workers
+        self.queue_size = queue_size or max_workers * 4
+        self.comment_page_size = comment_page_size
+        self.comment_workers = comment_workers
+        self.comment_prefetch = comment_prefetch
+        self.comment_memory_budget = comment_memory_budget
+        self._comment_pool = None
+        self._comment_pool_lock = threading.Lock()
+        self.listing_prefetch = max(1, listing_prefetch)
+        self.discovery_dates = DateRange(since, until)
+        self._listing_pool = None
+        self._listing_pool_lock = threading.Lock()
         self.random = random.Random()
-        self.processed_ids = set()
+        if rate is None:
+            rate = 1.0 / delay if delay > 0 else 0
+        self.rate_limiter = HostRateLimiter(rate, burst, host_rates)
+        self.adaptive = None
+        if adaptive:
+            ceiling = concurrency if engine == "async" else max_workers * max(1, comment_workers)
+            self.adaptive = AdaptiveController(
+                self.rate_limiter, ceiling, min_rate=min_rate, max_rate=max_rate
+            )
+        self.media_workers = media_workers
+        self.connection_stats = ConnectionStats()
+        self.session = build_session(
+            cache=http_cache,
+            retry_observer=self.adaptive.observe_retry if self.adaptive else None,
+            pool_sizes=self._pool_sizes(),
+            default_pool_size=max(media_workers, max_workers),
+            stats=self.connection_stats,
+            http2=http2,
+        )
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.sink = SinkWriter(
+            open_sink(
+                output_format,
+                self.output_dir,
+                compression=output_compression,
+                shard_bytes=output_shard_size,
+            ),
+            metrics=self.metrics,
+        )
+        self.metrics.gauge("output", self.sink.pending)
+        self.state = CrawlState(state_path or self.output_dir / STATE_FILENAME)
+        self.resume = resume
+        self.media = None
+        if media_workers > 0:
+            self.media = MediaDownloader(
+                self.safe_get,
+                media_store or Path(image_dir).parent / ".media-store",
+                workers=media_workers,
+                byte_rate=media_rate,
+                lookup=self._known_blob,
+                metrics=self.metrics,
+                head=self.safe_head,
+            )
+            self.metrics.gauge("media", self.media.pending)
+        self.claims = ClaimRegistry()
+        self._baseline = None
         self.listing_audio_map = defaultdict(list)
+        self.frontier = frontier
+        self.frontier_fair = frontier_fair
+        self.frontier_oversample = max(1.0, frontier_oversample)
+        self.listing_signals = {}
+        self.budget = CrawlBudget(
+            budget_requests, budget_seconds, requests=self.metrics.requests_total
+        )
 
-        self.output_dir.mkdir(parents=True, exist_ok=True)
         self.audio_dir.mkdir(parents=True, exist_ok=True)
         self.image_dir.mkdir(parents=True, exist_ok=True)
 
+    def _pool_sizes(self):
+        """Connections to keep per host: one per thread that can use that host."""
+        site = urlparse(BASE_DOMAIN).netloc
+        api = urlparse(self.comment_api).netloc
+        sizes = {site: self.max_workers + self.listing_workers * self.listing_prefetch}
+        comment_threads = self.max_workers * max(1, self.comment_workers)
+        if api == site:
+            sizes[site] += comment_threads
+        else:
+            sizes[api] = comment_threads
+        return sizes
+
     def run(self, categories, posts_per_category):
+        if self.engine == "async":
+            from .async_engine import AsyncCrawlEngine
+
+            engine = AsyncCrawlEngine(self, concurrency=self.concurrency)
+            return self._reporting(engine.run, categories, posts_per_category)
+        return self._reporting(self._run_pipeline, categories, posts_per_category)
+
+    def run_worker(self, queue, worker_id=None):
+        """Process tasks from a shared work queue until no work is left.
+
+        See :mod:`tuoitre_crawler.distributed`; only the thread engine is used.
+        """
+        from .distributed import DistributedWorker
+
+        return self._reporting(DistributedWorker(self, queue, worker_id).run)
+
+    def refresh_comments(self, records=None):
+        """Bring saved posts up to date with comments posted since they were saved.
+
+        ``records`` defaults to everything stored under ``output_dir``. Only
+        the article page (for ``vote_reactions``) and the newest comment pages
+        are fetched; media is never downloaded.
+        """
+        return self._reporting(self._run_refresh, records)
+
+    def _reporting(self, crawl, *args):
+        # Claims, the sink, the media downloader, the cache and the connection
+        # pools outlive a run (the daemon reuses them); the summary counts one run.
+        self.claims.reset_stats()
+        self._baseline = {
+            "output": dict(self.sink.stats),
+            "media": dict(self.media.stats) if self.media is not None else {},
+            "http_cache": dict(self.http_cache.stats) if self.http_cache is not None else {},
+            "connections": self.connection_stats.mark(),
+        }
+        reporter = None
+        if self.progress_interval > 0:
+            reporter = MetricsReporter(
+                self.metrics,
+                interval=self.progress_interval,
+                prometheus_path=self.prometheus_path,
+            ).start()
+        try:
+            return crawl(*args)
+        finally:
+            if reporter is not None:
+                reporter.stop()
+            self._write_metrics()
+
+    def _write_metrics(self):
+        try:
+            if self.metrics_report:
+                self.metrics.write_report(self.metrics_report)
+            if self.prometheus_path:
+                self.metrics.write_prometheus(self.prometheus_path)
+        except OSError as exc:  # pragma: no cover - logging path
+            LOGGER.warning("Failed to write metrics: %s", exc)
+
+    def _run_pipeline(self, categories, posts_per_category):
         summary = {
             "total_posts": 0,
             "total_comments": 0,
-            "categories": {},
+            "categories": {category_url: 0 for category_url in categories},
             "comment_rich_posts": 0,
         }
         self.listing_audio_map.clear()
-        for category_url in categories:
+        self.listing_signals.clear()
+        self.budget.start()
+        if self.frontier == PRIORITY:
+            return self._run_frontier(categories, posts_per_category, summary)
+        work = queue.Queue(maxsize=max(1, self.queue_size))
+        self.metrics.gauge("articles", work.qsize)
+        lock = threading.Lock()
+
+        def produce(category_url):
             LOGGER.info("Collecting targets for %s", category_url)
-            article_urls = self.collect_category_posts(category_url, posts_per_category)
-            summary["categories"][category_url] = len(article_urls)
+            category_slug = self._category_slug(category_url)
+            for url in self.iter_category_posts(category_url, posts_per_category):
+                if self.budget and self.budget.exhausted():
+                    break
+                with lock:
+                    summary["categories"][category_url] += 1
+                work.put((url, category_slug))
             LOGGER.info(
-                "Processing %s posts for %s", len(article_urls), category_url
+                "Queued %s posts for %s", summary["categories"][category_url], category_url
             )
-            results = self.process_posts(category_url, article_urls)
-            for result in results:
+
+        def retry_failures():
+            failed = self.state.failed_urls()
+            if failed:
+                LOGGER.info("Retrying %s URLs that failed previously", len(failed))
+            for url, category_slug in failed:
+                work.put((url, category_slug or "unknown"))
+            with lock:
+                summary["retried"] = len(failed)
+
+        def consume():
+            while True:
+                item = work.get()
+                if item is None:
+                    break
+                url, category_slug = item
+                if self.budget and self.budget.exhausted():
+                    continue
+                try:
+                    processed = self.process_single_post(url, category_slug)
+                except Exception as exc:  # pragma: no cover - logging path
+                    LOGGER.error("Failed to process %s: %s", url, exc)
+                    self.state.mark_url(url, FAILED, category_slug, error=str(exc))
+                    continue
+                if processed:
+                    with lock:
+                        self._tally(summary, processed)
+
+        consumers = [
+            threading.Thread(target=consume, name=f"post-worker-{idx}", daemon=True)
+            for idx in range(max(1, self.max_workers))
+        ]
+        for thread in consumers:
+            thread.start()
+        listing_workers = max(1, min(self.listing_workers, len(categories)))
+        try:
+            if self.resume:
+                self._retry_pending_media()
+            with ThreadPoolExecutor(max_workers=listing_workers) as executor:
+                futures = {executor.submit(produce, url): url for url in categories}
+                if self.resume:
+                    futures[executor.submit(retry_failures)] = "previous failures"
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except Exception as exc:  # pragma: no cover - logging path
+                        LOGGER.error("Failed to list %s: %s", futures[future], exc)
+        finally:
+            for _ in consumers:
+                work.put(None)
+            for thread in consumers:
+                thread.join()
+            self._finish_run(summary)
+        return summary
+
+    def _run_frontier(self, categories, posts_per_category, summary):
+        """``_run_pipeline`` with a :class:`Frontier` choosing the next article.
+
+        Each category is paged for up to ``frontier_oversample`` times its
+        target, and paging stops early once the target is saved.
+        """
+        frontier = Frontier(
+            posts_per_category,
+            fair=self.frontier_fair,
+            budget=self.budget,
+            comment_target=self.min_comments_target,
+        )
+        for category_url in categories:
+            frontier.add_category(category_url, self._category_slug(category_url))
+        failed = self.state.failed_urls() if self.resume else []
+        if failed:
+            LOGGER.info("Retrying %s URLs that failed previously", len(failed))
+            frontier.add_category(FAILED, "unknown", target=len(failed))
+            for url, category_slug in failed:
+                frontier.add(FAILED, url, slug=category_slug)
+            frontier.close(FAILED)
+            summary["retried"] = len(failed)
+        self.metrics.gauge("articles", frontier.queued)
+        limit = max(posts_per_category, math.ceil(posts_per_category * self.frontier_oversample))
+        lock = threading.Lock()
+
+        def produce(category_url):
+            LOGGER.info("Collecting candidates for %s", category_url)
+            try:
+                for url in self.iter_category_posts(category_url, limit):
+                    signals = self.listing_signals.get(url, {})
+                    frontier.add(category_url, url, **signals)
+                    if not frontier.wants(category_url):
+                        break
+            finally:
+                frontier.close(category_url)
+
+        def consume():
+            while True:
+                candidate = frontier.take()
+                if candidate is None:
+                    break
+                processed = None
+                try:
+                    processed = self.process_single_post(candidate.url, candidate.slug)
+                except Exception as exc:  # pragma: no cover - logging path
+                    LOGGER.error("Failed to process %s: %s", candidate.url, exc)
+                    self.state.mark_url(candidate.url, FAILED, candidate.slug, error=str(exc))
+                finally:
+                    frontier.done(candidate, processed is not None)
+                if processed:
+                    with lock:
+                        self._tally(summary, processed)
+
+        consumers = [
+            threading.Thread(target=consume, name=f"post-worker-{idx}", daemon=True)
+            for idx in range(max(1, self.max_workers))
+        ]
+        for thread in consumers:
+            thread.start()
+        listing_workers = max(1, min(self.listing_workers, len(categories)))
+        try:
+            if self.resume:
+                self._retry_pending_media()
+            with ThreadPoolExecutor(max_workers=listing_workers) as executor:
+                futures = {executor.submit(produce, url): url for url in categories}
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except Exception as exc:  # pragma: no cover - logging path
+                        LOGGER.error("Failed to list %s: %s", futures[future], exc)
+            for thread in consumers:
+                thread.join()
+        finally:
+            frontier.stop()
+            for thread in consumers:
+                thread.join()
+            report = frontier.snapshot()
+            for category_url in categories:
+                summary["categories"][category_url] = report["categories"][category_url][
+                    "dispatched"
+                ]
+            summary["frontier"] = report
+            self._finish_run(summary)
+        return summary
+
+    def _run_refresh(self, records):
+        summary = {
+            "total_posts": 0,
+            "total_comments": 0,
+            "updated_posts": 0,
+            "new_comments": 0,
+            "comment_pages": 0,
+            "failed": 0,
+        }
+        if records is None:
+            records = iter_stored_records(self.output_dir, latest=True)
+        seen = set()
+        pending = {}
+
+        def tally(done):
+            for future in done:
+                post_id = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as exc:  # pragma: no cover - logging path
+                    LOGGER.error("Failed to refresh %s: %s", post_id, exc)
+                    summary["failed"] += 1
+                    continue
                 summary["total_posts"] += 1
-                summary["total_comments"] += result.comment_count
-                if result.comment_count >= self.min_comments_target:
-                    summary["comment_rich_posts"] += 1
+                summary["total_comments"] += result["comments"]
+                summary["updated_posts"] += result["updated"]
+                summary["new_comments"] += result["new_comments"]
+                summary["comment_pages"] += result["pages"]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            try:
+                for record in records:
+                    post_id = record.get("postId")
+                    # JSONL output keeps superseded copies of a refreshed record.
+                    if not post_id or post_id in seen:
+                        continue
+                    seen.add(post_id)
+                    pending[executor.submit(self.refresh_post, record)] = post_id
+                    if len(pending) >= self.queue_size:
+                        tally(wait(pending, return_when=FIRST_COMPLETED).done)
+                tally(as_completed(list(pending)))
+            finally:
+                self._finish_run(summary)
         return summary
 
+    def refresh_post(self, record):
+        post_id = record["postId"]
+        url = record["source_url"]
+        stored = record.get("comments") or []
+        updated = dict(record)
+        content_hash = None
+        # Reactions change under a cached copy; make the HTTP cache revalidate.
+        html = self.fetch_html(url, headers={"Cache-Control": "no-cache"})
+        if html:
+            updated["vote_reactions"] = self._parse_article(html, url)["reactions"]
+            content_hash = self._content_hash(html)
+        else:
+            LOGGER.warning("Keeping stored reactions for %s: empty response", url)
+        if stored:
+            fresh, pages = self.fetch_new_comments(post_id, stored)
+            updated["comments"], added = merge_comment_threads(stored, fresh)
+            # Existing comments may have new reactions, so compare them whole.
+            changed = updated["comments"] != stored
+        else:
+            payload = self.fetch_comments(post_id)
+            added, pages = payload["count"], payload["pages"]
+            if added:
+                updated["comments"] = payload["items"]
+            else:
+                payload["items"].close()
+                updated["comments"] = []
+            changed = bool(added)
+        changed = changed or updated.get("vote_reactions") != record.get("vote_reactions")
+        if changed:
+            self._save_record(updated, content_hash)
+        return {
+            "comments": len(updated["comments"]),
+            "new_comments": added,
+            "pages": pages,
+            "updated": int(changed),
+        }
+
+    def _finish_run(self, summary):
+        baseline = self._baseline or {}
+        if self.media is not None:
+            self.media.drain()
+            summary["media"] = _since(self.media.stats, baseline.get("media"))
+        self.sink.flush()
+        summary["output"] = _since(self.sink.stats, baseline.get("output"))
+        if self.http_cache is not None:
+            summary["http_cache"] = _since(self.http_cache.stats, baseline.get("http_cache"))
+        if self.adaptive is not None:
+            summary["adaptive"] = self.adaptive.snapshot()
+        summary["connections"] = self.connection_stats.snapshot(baseline.get("connections"))
+        summary["dedup"] = self.claims.stats()
+        if self.budget:
+            summary["budget"] = self.budget.snapshot()
+
+    def _tally(self, summary, result):
+        if result.resumed:
+            summary["resumed"] = summary.get("resumed", 0) + 1
+        summary["total_posts"] += 1
+        summary["total_comments"] += result.comment_count
+        if result.comment_count >= self.min_comments_target:
+            summary["comment_rich_posts"] += 1
+
+    @property
+    def processed_ids(self):
+        return self.claims.post_ids()
+
     def collect_category_posts(self, category_url, target_count):
-        collected = {}
-        page = 1
-        while len(collected) < target_count:
-            page_url = self._page_url(category_url, page)
-            html = self.fetch_html(page_url)
-            if not html:
-                LOGGER.warning("Empty response for %s", page_url)
-                break
-            soup = BeautifulSoup(html, "html.parser")
-            anchors = self._extract_category_links(soup)
-            LOGGER.debug(
-                "Found %s candidates on page %s of %s", len(anchors), page, category_url
-            )
-            for href in anchors:
-                full = absolutize(href)
+        return list(self.iter_category_posts(category_url, target_count))
+
+    def iter_category_posts(self, category_url, target_count):
+        """Yield up to ``target_count`` canonical article URLs from a discovery source.
+
+        See :mod:`tuoitre_crawler.discovery` for how the source is chosen.
+        """
+        kind = source_kind(category_url)
+        if kind == SITEMAP:
+            yield from self._iter_sitemap_posts(category_url, target_count)
+        elif kind == FEED:
+            yield from self._iter_feed_posts(category_url, target_count)
+        else:
+            yield from self._iter_listing_posts(category_url, target_count)
+
+    def _iter_listing_posts(self, category_url, target_count):
+        accepted = []
+        planner = plan_listing_pages(accepted.append, target_count, self.listing_prefetch)
+        pages = next(planner)
+        while True:
+            results = self._fetch_listing_pages(category_url, pages)
+            try:
+                pages = planner.send(results)
+            except StopIteration:
+                yield from accepted
+                return
+            yield from accepted
+            accepted.clear()
+
+    def _fetch_listing_pages(self, category_url, pages):
+        if len(pages) == 1:
+            return [self._fetch_listing_page(category_url, pages[0])]
+        pool = self._listing_executor()
+        futures = [pool.submit(self._fetch_listing_page, category_url, page) for page in pages]
+        return [future.result() for future in futures]
+
+    def _fetch_listing_page(self, category_url, page):
+        page_url = self._page_url(category_url, page)
+        html = self.fetch_html(page_url)
+        if not html:
+            LOGGER.warning("Empty response for %s", page_url)
+            return None
+        anchors = self._listing_links(html)
+        LOGGER.debug("Found %s candidates on page %s of %s", len(anchors), page, category_url)
+        if not anchors:
+            LOGGER.info("No more posts on %s", page_url)
+        return [canonicalize_url(href) for href in anchors]
+
+    def _listing_executor(self):
+        with self._listing_pool_lock:
+            if self._listing_pool is None:
+                self._listing_pool = ThreadPoolExecutor(
+                    max_workers=max(1, self.listing_workers * self.listing_prefetch),
+                    thread_name_prefix="listing-page",
+                )
+            return self._listing_pool
+
+    def _iter_sitemap_posts(self, sitemap_url, target_count):
+        collected = set()
+        sitemaps = [sitemap_url]
+        while sitemaps and len(collected) < target_count:
+            url = sitemaps.pop(0)
+            for kind, location, modified in self._read_xml(url, iter_sitemap):
+                if kind == "sitemap":
+                    sitemaps.append(location)
+                    continue
+                full = canonicalize_url(location)
                 if full not in collected:
-                    collected[full] = None
+                    collected.add(full)
+                    self._remember_signals(full, published=modified)
+                    yield full
+                    if len(collected) >= target_count:
+                        return
+
+    def _iter_feed_posts(self, feed_url, target_count):
+        collected = set()
+        for location, published in self._read_xml(feed_url, iter_feed):
+            full = canonicalize_url(location)
+            if full not in collected:
+                collected.add(full)
+                self._remember_signals(full, published=published)
+                yield full
                 if len(collected) >= target_count:
-                    break
-            if not anchors:
-                LOGGER.info("No more posts on %s", page_url)
-                break
-            page += 1
-        return list(collected.keys())
+                    return
+
+    def _read_xml(self, url, parse):
+        """Stream ``url`` through ``parse`` without holding the document."""
+        response = self.safe_get(url, stream=True)
+        if not response:
+            LOGGER.warning("Empty response for %s", url)
+            return
+        reader = ChunkReader(response.iter_content(chunk_size=65536))
+        entries = parse(open_xml(reader, url), self.discovery_dates, url)
+        # Only the parser's own time counts: not the download it pulls chunks
+        # from, nor the caller's work between entries.
+        parsing = 0.0
+        try:
+            while True:
+                started, waited = time.monotonic(), reader.waited
+                try:
+                    entry = next(entries)
+                except StopIteration:
+                    return
+                finally:
+                    parsing += time.monotonic() - started - (reader.waited - waited)
+                yield entry
+        finally:
+            self.metrics.observe("parse.discovery", parsing)
+            response.close()
 
     def process_posts(self, category_url, urls):
         results = []
@@ -127,41 +711,147 @@ class TuoiTreCrawler:
         return results
 
     def process_single_post(self, url, fallback_category):
+        if not self.claims.claim_url(url):
+            LOGGER.debug("Skipping duplicate URL %s", url)
+            return None
+        try:
+            return self._process_claimed_post(url, fallback_category)
+        except Exception:
+            self.claims.release(url=url)
+            raise
+
+    def _process_claimed_post(self, url, fallback_category):
+        if self.resume:
+            finished = self._resumed_post(url=url)
+            if finished:
+                return finished
         html = self.fetch_html(url)
+        finished, meta = self._prepare_post(url, html, fallback_category)
+        if meta is None:
+            return finished
+        post_id = meta["postId"]
+
+        # The page is fully extracted; do not hold it while comments stream in.
+        html = None
+        comment_payload = self.fetch_comments(post_id)
+        meta["comments"] = comment_payload["items"]
+        meta["comment_count"] = comment_payload["count"]
+
+        if self.media is not None:
+            local_images = self._queue_media(
+                post_id, self._image_targets(post_id, meta["images"])
+            )
+            local_audio = self._queue_media(
+                post_id, self._audio_targets(post_id, meta["audio"])
+            )
+        else:
+            local_images = self.download_images(post_id, meta["images"])
+            local_audio = self.download_audio(post_id, meta["audio"])
+
+        record = self._build_record(post_id, url, meta, local_audio, local_images)
+        self._finish_claim(post_id, meta, comment_payload)
+        return self._save_record(record, meta.get("content_hash"))
+
+    def _finish_claim(self, post_id, meta, comment_payload):
+        """Record what the post cost so dropped duplicates count as saved fetches."""
+        requests_made = 1 + comment_payload["pages"] + len(meta["images"]) + len(meta["audio"])
+        self.claims.finish(post_id, requests_made)
+
+    def _prepare_post(self, url, html, fallback_category):
+        """Parse an article page into ``(finished, meta)``.
+
+        ``meta`` is ``None`` when the page should not be processed further, in
+        which case ``finished`` holds the already-saved post, if any.
+        """
         if not html:
-            return None
-        soup = BeautifulSoup(html, "html.parser")
-        post_id = extract_post_id(soup, url)
+            self.state.mark_url(url, FAILED, fallback_category, error="empty response")
+            self.claims.release(url=url)
+            return None, None
+        post_id = extract_post_id_from_html(html)
+        if post_id:
+            finished, proceed = self._check_seen(url, post_id, fallback_category)
+            if not proceed:
+                return finished, None
+        parsed = self._parse_article(html, url)
         if not post_id:
-            LOGGER.warning("Could not determine post id for %s", url)
-            return None
-        if post_id in self.processed_ids:
+            post_id = parsed["post_id"]
+            if not post_id:
+                LOGGER.warning("Could not determine post id for %s", url)
+                self.state.mark_url(url, FAILED, fallback_category, error="missing post id")
+                self.claims.release(url=url)
+                return None, None
+            finished, proceed = self._check_seen(url, post_id, fallback_category)
+            if not proceed:
+                return finished, None
+
+        meta = self._extract_meta(parsed, url, post_id, fallback_category)
+        meta["content_hash"] = self._content_hash(html)
+        return None, meta
+
+    def _check_seen(self, url, post_id, fallback_category):
+        if self.resume:
+            finished = self._resumed_post(post_id=post_id)
+            if finished:
+                self.state.mark_url(url, DONE, fallback_category, post_id)
+                return finished, False
+        if not self.claims.claim_post(post_id, url):
             LOGGER.debug("Skipping duplicate post %s", post_id)
+            self.state.mark_url(url, DUPLICATE, fallback_category, post_id)
+            return None, False
+        if self.claim_post is not None and not self.claim_post(post_id):
+            LOGGER.debug("Post %s is claimed by another worker", post_id)
+            self.state.mark_url(url, DUPLICATE, fallback_category, post_id)
+            return None, False
+        return None, True
+
+    def _resumed_post(self, url=None, post_id=None):
+        row = self.state.finished_post(url=url, post_id=post_id)
+        if row is None:
             return None
+        LOGGER.debug("Resuming: %s already saved as %s", url or post_id, row["data_path"])
+        self.claims.remember(row["post_id"])
+        self.metrics.increment("resumed")
+        return ProcessedPost(
+            post_id=row["post_id"],
+            url=row["url"],
+            data_path=Path(row["data_path"]),
+            category=row["category"],
+            comment_count=row["comment_count"] or 0,
+            resumed=True,
+        )
+
+    @staticmethod
+    def _content_hash(html):
+        return hashlib.sha256(html.encode("utf-8", errors="replace")).hexdigest()
+
+    def _parse_article(self, html, url):
+        with self.metrics.stage("parse.article"):
+            if self._parse_pool_enabled():
+                return self._parse_executor().submit(
+                    parse_article, html, url, self.parser_backend
+                ).result()
+            return parse_article(html, url, self.parser_backend)
 
-        meta = extract_metadata(soup)
+    def _extract_meta(self, parsed, url, post_id, fallback_category):
+        meta = dict(parsed["metadata"])
         if not meta.get("title"):
-            meta["title"] = soup.title.string.strip() if soup.title else ""
+            meta["title"] = parsed["page_title"]
         meta.setdefault("category", fallback_category)
         meta["postId"] = post_id
         meta["url"] = url
 
-        content = extract_article_content(soup)
+        content = parsed["content"]
         meta["content"] = content["text"]
         meta["images"] = content["images"]
-        listing_audio = self.listing_audio_map.get(url, [])
+        listing_audio = self.listing_audio_map.get(canonicalize_url(url), [])
         merged_audio = list(dict.fromkeys(content["audio"] + listing_audio))
         meta["audio"] = merged_audio
-        meta["vote_reactions"] = extract_article_reactions(soup)
-
-        comment_payload = self.fetch_comments(post_id)
-        meta["comments"] = comment_payload["items"]
-        meta["comment_count"] = comment_payload["count"]
+        meta["vote_reactions"] = parsed["reactions"]
+        return meta
 
-        local_images = self.download_images(post_id, meta["images"])
-        local_audio = self.download_audio(post_id, meta["audio"])
-
-        record = {
+    @staticmethod
+    def _build_record(post_id, url, meta, local_audio, local_images):
+        return {
             "postId": post_id,
             "title": meta.get("title"),
             "content": meta.get("content"),
@@ -175,55 +865,191 @@ class TuoiTreCrawler:
             "comments": meta.get("comments", []),
         }
 
-        data_path = self.output_dir / f"{post_id}.json"
-        with data_path.open("w", encoding="utf-8") as fp:
-            json.dump(record, fp, ensure_ascii=False, indent=2)
+    def _save_record(self, record, content_hash=None):
+        post_id = record["postId"]
+        url = record["source_url"]
+        category = record["category"]
 
-        self.processed_ids.add(post_id)
-        LOGGER.info("Saved %s", data_path)
+        def saved(done):
+            try:
+                data_path = done.result()
+            except Exception as exc:
+                self.state.mark_url(url, FAILED, category, post_id, error=str(exc))
+                return
+            self.state.mark_post(
+                post_id,
+                url,
+                category,
+                content_hash,
+                data_path,
+                len(record["comments"]),
+                len(record["audio_files"]) + len(record["image_files"]),
+            )
+            self.state.mark_url(url, DONE, category, post_id)
+            self.metrics.increment("posts")
+            self.metrics.increment("comments", len(record["comments"]))
+            LOGGER.info("Saved %s to %s", post_id, data_path)
 
+        written = self.sink.submit(record)
+        written.add_done_callback(saved)
         return ProcessedPost(
             post_id=post_id,
             url=url,
-            data_path=data_path,
+            data_path=written,
             category=record["category"],
             comment_count=len(record["comments"]),
         )
 
-    def fetch_comments(self, post_id, page_size=50):
-        comments = []
-        page = 1
-        while True:
-            params = {
-                "appKey": COMMENT_APP_KEY,
-                "objId": post_id,
-                "objType": 1,
-                "pageindex": page,
-                "pagesize": page_size,
-            }
-            response = self.safe_get(COMMENT_API, params=params)
-            if not response:
-                break
-            try:
-                payload = response.json()
-            except ValueError:
-                break
-            raw = payload.get("Data") or "[]"
+    def fetch_comments(self, post_id, page_size=None):
+        """Stream a post's comment pages into a :class:`CommentSpool` as they arrive."""
+        size = page_size or self.comment_page_size or COMMENT_PAGE_SIZE
+        spool = CommentSpool(self.comment_memory_budget)
+        planner = plan_comment_pages(
+            lambda batch: spool.extend(self._normalize_comments(batch)),
+            page_size=size,
+            auto=not (page_size or self.comment_page_size),
+            prefetch=self.comment_prefetch,
+        )
+        pages = self._run_comment_planner(post_id, planner)
+        self._count_spill(spool)
+        return {"items": spool, "count": len(spool), "pages": pages}
+
+    def _count_spill(self, spool):
+        if spool.rolled_over:
+            self.metrics.increment("comment_spills")
+
+    def fetch_new_comments(self, post_id, stored_comments):
+        """Return ``(comments, pages)`` from the newest pages down to the stored ones."""
+        known = {comment["commentId"] for comment in stored_comments}
+        since = max((c["date"] for c in stored_comments if c.get("date")), default=None)
+        batches = []
+        planner = plan_comment_refresh(
+            batches.append, known, since, page_size=self.comment_page_size or COMMENT_PAGE_SIZE
+        )
+        pages = self._run_comment_planner(post_id, planner)
+        return self._normalize_comments(merge_comment_pages(batches)), pages
+
+    def _run_comment_planner(self, post_id, planner):
+        with self.metrics.stage("comments"):
             try:
-                batch = json.loads(raw)
-            except ValueError:
-                batch = []
-            if not batch:
-                break
-            for comment in batch:
-                comments.append(normalize_comment(comment))
-            if len(batch) < page_size:
-                break
-            page += 1
-        return {"items": comments, "count": len(comments)}
+                request = next(planner)
+                while True:
+                    request = planner.send(self._fetch_comment_pages(post_id, request))
+            except StopIteration as done:
+                return done.value
+
+    def _normalize_comments(self, raw_comments):
+        with self.metrics.stage("parse.comments"):
+            if self._parse_pool_enabled() and len(raw_comments) >= PARSE_OFFLOAD_COMMENTS:
+                return self._parse_executor().submit(normalize_comments, raw_comments).result()
+            return normalize_comments(raw_comments)
+
+    def _parse_pool_enabled(self):
+        return self.parse_workers > 0
+
+    def _parse_executor(self):
+        # multiprocessing is imported only when --parse-workers asks for it.
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        with self._parse_pool_lock:
+            if self._parse_pool is None:
+                self._parse_pool = ProcessPoolExecutor(
+                    max_workers=self.parse_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._parse_pool
+
+    def close(self):
+        if self.media is not None:
+            self.media.close()
+        self.sink.close()
+        self.session.close()
+        for pool in (self._comment_pool, self._listing_pool, self._parse_pool):
+            if pool is not None:
+                pool.shutdown(wait=True)
+        self._comment_pool = None
+        self._listing_pool = None
+        self._parse_pool = None
+
+    def _fetch_comment_pages(self, post_id, request):
+        if len(request) <= 1 or self.comment_workers <= 1:
+            return [self._fetch_comment_page(post_id, page, size) for page, size in request]
+        pool = self._comment_executor()
+        futures = [
+            pool.submit(self._fetch_comment_page, post_id, page, size)
+            for page, size in request
+        ]
+        return [future.result() for future in futures]
+
+    def _fetch_comment_page(self, post_id, page, page_size):
+        response = self.safe_get(
+            self.comment_api, params=comment_params(post_id, page, page_size)
+        )
+        if not response:
+            return None, None
+        try:
+            payload = response.json()
+        except ValueError:
+            return None, None
+        return parse_comment_payload(payload)
+
+    def _comment_executor(self):
+        with self._comment_pool_lock:
+            if self._comment_pool is None:
+                self._comment_pool = ThreadPoolExecutor(
+                    max_workers=max(1, self.max_workers * self.comment_workers),
+                    thread_name_prefix="comment-page",
+                )
+            return self._comment_pool
 
     def download_images(self, post_id, urls):
+        return self._download_inline(post_id, self._image_targets(post_id, urls))
+
+    def download_audio(self, post_id, urls):
+        return self._download_inline(post_id, self._audio_targets(post_id, urls))
+
+    def _download_inline(self, post_id, targets):
         saved = []
+        for url, dest, relative in targets:
+            ok = self.write_binary(url, dest)
+            self.state.mark_media(url, dest, post_id, DONE if ok else FAILED)
+            if ok:
+                saved.append(relative)
+        return saved
+
+    def _queue_media(self, post_id, targets):
+        for url, dest, _ in targets:
+            self._submit_media(url, dest, post_id)
+        return [relative for _, _, relative in targets]
+
+    def _submit_media(self, url, dest, post_id):
+        self.state.mark_media(url, dest, post_id, PENDING)
+
+        def record(done):
+            blob = done.result()
+            self.state.mark_media(url, dest, post_id, DONE if blob else FAILED, blob)
+
+        self.media.submit(url, dest).add_done_callback(record)
+
+    def _retry_pending_media(self):
+        pending = self.state.pending_media()
+        if pending:
+            LOGGER.info("Retrying %s unfinished media downloads", len(pending))
+        for url, dest, post_id in pending:
+            if self.media is not None:
+                self._submit_media(url, dest, post_id)
+            else:
+                ok = self.write_binary(url, dest)
+                self.state.mark_media(url, dest, post_id, DONE if ok else FAILED)
+
+    def _known_blob(self, url):
+        if not self.resume:
+            return None
+        return self.state.media_blob(url)
+
+    def _image_targets(self, post_id, urls):
+        targets = []
         target_dir = self.image_dir / post_id
         target_dir.mkdir(parents=True, exist_ok=True)
         for url in urls:
@@ -231,57 +1057,96 @@ class TuoiTreCrawler:
             if not file_name:
                 continue
             dest = target_dir / file_name
-            if self.write_binary(url, dest):
-                try:
-                    saved.append(str(dest.relative_to(self.image_dir)))
-                except ValueError:
-                    saved.append(str(dest))
-        return saved
+            try:
+                relative = str(dest.relative_to(self.image_dir))
+            except ValueError:
+                relative = str(dest)
+            targets.append((url, dest, relative))
+        return targets
 
-    def download_audio(self, post_id, urls):
-        saved = []
+    def _audio_targets(self, post_id, urls):
+        targets = []
         for idx, url in enumerate(urls):
             ext = Path(filename_from_url(url) or "audio.mp3").suffix or ".mp3"
             name = f"{post_id}{'' if idx == 0 else f'_{idx+1}'}{ext}"
             dest = self.audio_dir / name
-            if self.write_binary(url, dest):
-                try:
-                    saved.append(str(dest.relative_to(self.audio_dir.parent)))
-                except ValueError:
-                    saved.append(str(dest))
-        return saved
+            try:
+                relative = str(dest.relative_to(self.audio_dir.parent))
+            except ValueError:
+                relative = str(dest)
+            targets.append((url, dest, relative))
+        return targets
 
     def write_binary(self, url, dest):
-        response = self.safe_get(url, stream=True)
-        if not response:
-            return False
-        dest.parent.mkdir(parents=True, exist_ok=True)
-        with dest.open("wb") as handle:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    handle.write(chunk)
+        dest = Path(dest)
+        with self.metrics.stage("media.write"):
+            if is_current(self.safe_head, url, dest):
+                self.metrics.increment("media_verified")
+                return True
+            partial = download(self.safe_get, url, dest.with_name(dest.name + PART_SUFFIX))
+            if partial is None:
+                return False
+            os.replace(partial.part, dest)
+        if partial.resumed:
+            self.metrics.increment("media_resumed")
+        self.metrics.add_bytes("media", partial.fetched)
         return True
 
-    def safe_get(self, url, **kwargs):
+    def safe_head(self, url, **kwargs):
+        return self.safe_get(url, method="HEAD", allow_redirects=True, **kwargs)
+
+    def safe_get(self, url, method="GET", **kwargs):
         try:
-            self._throttle()
-            response = self.session.get(url, timeout=30, **kwargs)
-            response.raise_for_status()
-            return response
+            return self.request(url, method, **kwargs)
         except requests.RequestException as exc:
             LOGGER.warning("Request failed for %s: %s", url, exc)
             return None
 
-    def fetch_html(self, url):
-        response = self.safe_get(url)
+    def request(self, url, method="GET", **kwargs):
+        """Like :meth:`safe_get`, but raise the ``requests`` error instead of logging it."""
+        kind = url_class(url)
+        gate = self.adaptive.gate(url) if self.adaptive else nullcontext()
+        started = None
+        try:
+            with gate:
+                self._throttle(url)
+                started = time.monotonic()
+                with self.metrics.stage(f"fetch.{kind}"):
+                    response = self.session.request(method, url, timeout=30, **kwargs)
+            self.metrics.count_request(url, response.status_code, response_retries(response))
+            self._observe(url, response, started)
+            response.raise_for_status()
+            if not kwargs.get("stream"):
+                self.metrics.add_bytes(kind, len(response.content))
+            return response
+        except requests.RequestException as exc:
+            status = getattr(exc.response, "status_code", None)
+            if status is None:
+                self.metrics.count_request(url, "error")
+                if self.adaptive is not None and started is not None:
+                    self.adaptive.observe(url, "error")
+            raise
+
+    def _observe(self, url, response, started):
+        if self.adaptive is None or getattr(response, "from_cache", False):
+            return
+        self.adaptive.observe(
+            url,
+            response.status_code,
+            time.monotonic() - started,
+            response.headers.get("Retry-After"),
+        )
+
+    def fetch_html(self, url, headers=None):
+        response = self.safe_get(url, headers=headers)
         if not response:
             return ""
         response.encoding = response.encoding or "utf-8"
         return response.text
 
-    def _throttle(self):
-        delay = max(0, self.delay + self.random.uniform(0, 0.3))
-        time.sleep(delay)
+    def _throttle(self, url):
+        waited = self.rate_limiter.acquire(url)
+        self.metrics.observe("throttle", waited)
 
     @staticmethod
     def _page_url(category_url, page):
@@ -292,35 +1157,52 @@ class TuoiTreCrawler:
             trimmed = trimmed[:-4]
         return f"{trimmed}/trang-{page}.htm"
 
+    def _listing_links(self, html):
+        with self.metrics.stage("parse.listing"):
+            if self._parse_pool_enabled():
+                entries = self._parse_executor().submit(
+                    parse_listing, html, self.parser_backend
+                ).result()
+            else:
+                entries = parse_listing(html, self.parser_backend)
+        return self._remember_listing_entries(entries)
+
     def _extract_category_links(self, soup):
-        selectors = [
-            ".box-category-item a.box-category-link-title",
-            "a[data-linktype=\"newsdetail\"]",
-            "a[data-role=\"audio-autoplay\"]",
-        ]
+        return self._remember_listing_entries(extract_listing_entries(soup))
+
+    def _remember_listing_entries(self, entries):
         links = []
-        for selector in selectors:
-            for anchor in soup.select(selector):
-                href = anchor.get("href")
-                if not href or href == "#":
-                    continue
-                full = absolutize(href)
-                data_file = anchor.get("data-file")
-                if data_file:
-                    audio_url = absolutize(data_file)
-                    self._remember_listing_audio(full, audio_url)
-                links.append(full)
+        for full, audio_url, signals in entries:
+            if audio_url:
+                self._remember_listing_audio(full, audio_url)
+            if signals["published"] or signals["comments"] is not None:
+                self._remember_signals(full, **signals)
+            links.append(full)
         return links
 
+    def _remember_signals(self, post_url, published=None, comments=None):
+        """Keep what discovery saw about an article for the priority frontier."""
+        if self.frontier == PRIORITY:
+            self.listing_signals[canonicalize_url(post_url)] = {
+                "published": published,
+                "comments": comments,
+            }
+
     @staticmethod
     def _category_slug(url):
         path = urlparse(url).path.strip("/")
         return path.split("/")[0] if path else "unknown"
 
     def _remember_listing_audio(self, post_url, audio_url):
-        entry = self.listing_audio_map[post_url]
+        entry = self.listing_audio_map[canonicalize_url(post_url)]
         if audio_url not in entry:
             entry.append(audio_url)
 
 
+def _since(counters, baseline):
+    """``counters`` minus the values they had at ``baseline``."""
+    baseline = baseline or {}
+    return {name: value - baseline.get(name, 0) for name, value in counters.items()}
+
+
 __all__ = ["TuoiTreCrawler", "ProcessedPost"]
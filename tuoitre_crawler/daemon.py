@@ -0,0 +1,315 @@
+"""Long-running crawl daemon with scheduled recrawls and a control socket.
+
+One ``TuoiTreCrawler`` serves every run, so its HTTP session and per-host
+connection pools, parse worker processes, crawl state database and claim
+registry stay warm between runs. The claim registry is the in-memory dedup
+index: articles claimed by an earlier run are skipped without a fetch, so a
+recrawl only pays for what is new on the listings.
+
+Each :class:`Job` is a set of category URLs with a per-category target, run
+every ``interval`` seconds (0 runs it only when triggered). Jobs run one at a
+time in the daemon's main thread.
+
+The control socket is a Unix socket path or a loopback ``HOST:PORT``; it has
+no authentication, so other hosts are refused. It takes one JSON object per
+line and answers with one:
+
+* ``{"command": "run", "job": "news"}`` queues a run now (every job without ``job``);
+* ``{"command": "status"}`` reports each job's last run and when the next is due;
+* ``{"command": "stop"}`` finishes the current run and exits.
+"""
+
+import datetime
+import ipaddress
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import threading
+import time
+
+from .constants import LOGGER_NAME
+
+LOGGER = logging.getLogger(LOGGER_NAME)
+
+DEFAULT_INTERVAL = 300
+CONTROL_COMMANDS = ("run", "status", "stop")
+
+
+class Job:
+    def __init__(self, name, categories, posts_per_category, interval=DEFAULT_INTERVAL):
+        self.name = name
+        self.categories = list(categories)
+        self.posts_per_category = posts_per_category
+        self.interval = interval
+        self.due = 0.0
+        self.runs = 0
+        self.last_started = None
+        self.last_seconds = None
+        self.last_summary = None
+        self.last_error = None
+
+    def describe(self, now):
+        return {
+            "categories": self.categories,
+            "posts_per_category": self.posts_per_category,
+            "interval": self.interval,
+            "runs": self.runs,
+            "last_started": self.last_started,
+            "last_seconds": self.last_seconds,
+            "last_summary": self.last_summary,
+            "last_error": self.last_error,
+            "next_run_in": round(max(0.0, self.due - now), 3) if self.interval else None,
+        }
+
+
+def load_jobs(path, posts_per_category, interval=DEFAULT_INTERVAL):
+    """Read ``{"name": {"categories": [...], "posts_per_category": N, "interval": S}}``.
+
+    ``posts_per_category`` and ``interval`` default to the given values.
+    """
+    with open(path, encoding="utf-8") as fp:
+        spec = json.load(fp)
+    if not isinstance(spec, dict) or not spec:
+        raise ValueError(f"{path} must map job names to job settings")
+    jobs = []
+    for name, settings in spec.items():
+        categories = settings.get("categories") if isinstance(settings, dict) else None
+        if not categories or not isinstance(categories, list):
+            raise ValueError(f"Job {name!r} needs a list of categories")
+        jobs.append(
+            Job(
+                name,
+                categories,
+                int(settings.get("posts_per_category", posts_per_category)),
+                float(settings.get("interval", interval)),
+            )
+        )
+    return jobs
+
+
+class CrawlDaemon:
+    """Run jobs on their schedule and on control-socket triggers until stopped."""
+
+    def __init__(self, crawler, jobs, control=None, clock=time.monotonic):
+        if not jobs:
+            raise ValueError("The daemon needs at least one job")
+        self.crawler = crawler
+        self.jobs = {job.name: job for job in jobs}
+        self.control = control
+        self._clock = clock
+        self._changed = threading.Condition()
+        self._queued = []
+        self._stopping = False
+        self.running = None
+        self.started = clock()
+
+    def trigger(self, name=None):
+        """Queue ``name`` (every job when ``None``) to run next; returns the names queued."""
+        with self._changed:
+            if name is not None and name not in self.jobs:
+                raise ValueError(f"Unknown job {name!r}")
+            names = [name] if name is not None else list(self.jobs)
+            for job_name in names:
+                if job_name not in self._queued:
+                    self._queued.append(job_name)
+            self._changed.notify_all()
+            return names
+
+    def stop(self):
+        with self._changed:
+            self._stopping = True
+            self._changed.notify_all()
+
+    def status(self):
+        with self._changed:
+            now = self._clock()
+            return {
+                "running": self.running,
+                "queued": list(self._queued),
+                "uptime_seconds": round(now - self.started, 3),
+                "jobs": {name: job.describe(now) for name, job in self.jobs.items()},
+            }
+
+    def handle(self, request):
+        """Answer one control request."""
+        command = request.get("command")
+        if command == "run":
+            return {"ok": True, "queued": self.trigger(request.get("job"))}
+        if command == "status":
+            return {"ok": True, **self.status()}
+        if command == "stop":
+            self.stop()
+            return {"ok": True, "stopping": True}
+        return {"ok": False, "error": f"Unknown command {command!r}"}
+
+    def serve_forever(self):
+        """Run jobs until :meth:`stop`; returns the final :meth:`status`."""
+        server = open_control_server(self.control, self) if self.control else None
+        restore = self._install_signal_handlers()
+        if server is not None:
+            threading.Thread(
+                target=server.serve_forever, name="daemon-control", daemon=True
+            ).start()
+            LOGGER.info("Control socket listening on %s", self.control)
+        try:
+            while True:
+                job = self._next_job()
+                if job is None:
+                    break
+                self._run(job)
+        finally:
+            restore()
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+                _remove_socket_file(self.control)
+        return self.status()
+
+    def _next_job(self):
+        with self._changed:
+            while not self._stopping:
+                if self._queued:
+                    return self.jobs[self._queued.pop(0)]
+                now = self._clock()
+                scheduled = [job for job in self.jobs.values() if job.interval]
+                due = min(scheduled, key=lambda job: job.due, default=None)
+                if due is not None and due.due <= now:
+                    return due
+                self._changed.wait(None if due is None else due.due - now)
+            return None
+
+    def _run(self, job):
+        with self._changed:
+            self.running = job.name
+        started = self._clock()
+        job.last_started = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        LOGGER.info("Running job %s (%s categories)", job.name, len(job.categories))
+        try:
+            job.last_summary = self.crawler.run(job.categories, job.posts_per_category)
+            job.last_error = None
+        except Exception as exc:
+            LOGGER.error("Job %s failed: %s", job.name, exc)
+            job.last_summary = None
+            job.last_error = str(exc)
+        finished = self._clock()
+        with self._changed:
+            self.running = None
+            job.runs += 1
+            job.last_seconds = round(finished - started, 3)
+            job.due = max(finished, started + job.interval)
+        if job.last_summary is not None:
+            LOGGER.info(
+                "Job %s saved %s posts in %.1fs",
+                job.name,
+                job.last_summary["total_posts"],
+                job.last_seconds,
+            )
+
+    def _install_signal_handlers(self):
+        """Stop after the current run on SIGTERM/SIGINT; returns a function restoring them."""
+        if threading.current_thread() is not threading.main_thread():
+            return lambda: None
+        previous = {}
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            previous[signum] = signal.signal(signum, lambda *_: self.stop())
+
+        def restore():
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+
+        return restore
+
+
+class _ControlHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                reply = self.server.crawl_daemon.handle(json.loads(line))
+            except (ValueError, AttributeError) as exc:
+                reply = {"ok": False, "error": str(exc)}
+            self.wfile.write((json.dumps(reply, ensure_ascii=False) + "\n").encode("utf-8"))
+
+
+class _UnixControlServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _TcpControlServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def _tcp_address(address):
+    host, sep, port = address.rpartition(":")
+    if sep and host and port.isdigit() and os.sep not in address:
+        return host, int(port)
+    return None
+
+
+def check_control_address(address):
+    """Raise ``ValueError`` unless a TCP control address only resolves to loopback."""
+    tcp = _tcp_address(address)
+    if tcp is None:
+        return
+    try:
+        resolved = {info[4][0] for info in socket.getaddrinfo(tcp[0], tcp[1])}
+    except socket.gaierror as exc:
+        raise ValueError(f"Cannot resolve control address {address}: {exc}") from exc
+    if not all(ipaddress.ip_address(ip.split("%")[0]).is_loopback for ip in resolved):
+        raise ValueError(
+            f"Control address {address} is not loopback; the control socket has no "
+            "authentication, so bind 127.0.0.1 or use a Unix socket path"
+        )
+
+
+def open_control_server(address, crawl_daemon):
+    """Bind the control socket: loopback ``HOST:PORT`` over TCP, else a Unix socket."""
+    tcp = _tcp_address(address)
+    if tcp is not None:
+        check_control_address(address)
+        server = _TcpControlServer(tcp, _ControlHandler)
+    else:
+        _remove_socket_file(address)
+        server = _UnixControlServer(address, _ControlHandler)
+        os.chmod(address, 0o600)
+    server.crawl_daemon = crawl_daemon
+    return server
+
+
+def _remove_socket_file(address):
+    if _tcp_address(address) is None and os.path.exists(address):
+        os.unlink(address)
+
+
+def send_command(address, command, timeout=30, **fields):
+    """Send one control request to a running daemon and return its reply."""
+    tcp = _tcp_address(address)
+    if tcp is not None:
+        connection = socket.create_connection(tcp, timeout=timeout)
+    else:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.settimeout(timeout)
+        connection.connect(address)
+    request = {"command": command, **{key: value for key, value in fields.items() if value}}
+    with connection, connection.makefile("rwb") as stream:
+        stream.write((json.dumps(request) + "\n").encode("utf-8"))
+        stream.flush()
+        line = stream.readline()
+    if not line:
+        raise ConnectionError(f"No reply from {address}")
+    return json.loads(line)
+
+
+__all__ = [
+    "DEFAULT_INTERVAL",
+    "CONTROL_COMMANDS",
+    "Job",
+    "CrawlDaemon",
+    "load_jobs",
+    "check_control_address",
+    "open_control_server",
+    "send_command",
+]
@@ -0,0 +1,93 @@
+"""Claim-on-start registry that keeps two workers off the same article."""
+
+import threading
+
+from .helpers import canonicalize_url
+
+
+class ClaimRegistry:
+    """Atomic claims on canonical article URLs and post IDs.
+
+    A worker claims the URL before fetching anything and the post ID as soon
+    as the article page yields one; whoever loses either claim drops the
+    work. Claims stay in place once a post is finished and are released
+    when processing raises or the page cannot be read, so the URL can be
+    tried again.
+
+    Each finished post records how many requests it took (article, comment
+    pages, media), which turns the duplicates that were dropped into a count
+    of fetches saved.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._urls = {}
+        self._posts = {}
+        self._duplicate_urls = []
+        self._duplicate_posts = []
+
+    def claim_url(self, url):
+        key = canonicalize_url(url)
+        with self._lock:
+            if key in self._urls:
+                self._duplicate_urls.append(key)
+                return False
+            self._urls[key] = None
+            return True
+
+    def claim_post(self, post_id, url=None):
+        with self._lock:
+            if post_id in self._posts:
+                self._duplicate_posts.append(post_id)
+                return False
+            self._posts[post_id] = None
+            if url is not None:
+                self._urls[canonicalize_url(url)] = post_id
+            return True
+
+    def remember(self, post_id):
+        """Record a post finished by an earlier run so it is not claimed again."""
+        with self._lock:
+            self._posts.setdefault(post_id, 0)
+
+    def finish(self, post_id, requests):
+        with self._lock:
+            self._posts[post_id] = requests
+
+    def release(self, url=None, post_id=None):
+        with self._lock:
+            if url is not None:
+                post_id = self._urls.pop(canonicalize_url(url), None) or post_id
+            if post_id is not None:
+                self._posts.pop(post_id, None)
+
+    def __contains__(self, post_id):
+        with self._lock:
+            return post_id in self._posts
+
+    def post_ids(self):
+        with self._lock:
+            return set(self._posts)
+
+    def reset_stats(self):
+        """Forget the duplicates counted so far; the claims themselves stay."""
+        with self._lock:
+            self._duplicate_urls = []
+            self._duplicate_posts = []
+
+    def stats(self):
+        with self._lock:
+            saved = 0
+            for key in self._duplicate_urls:
+                # Unknown cost (original still running or failed): one page fetch.
+                saved += self._posts.get(self._urls.get(key)) or 1
+            for post_id in self._duplicate_posts:
+                saved += max(0, (self._posts.get(post_id) or 1) - 1)
+            return {
+                "duplicate_urls": len(self._duplicate_urls),
+                "duplicate_posts": len(self._duplicate_posts),
+                "saved_fetches": saved,
+            }
+
+
+__all__ = ["ClaimRegistry"]
@@ -0,0 +1,243 @@
+"""Article URL discovery from listing pages, XML sitemaps and RSS/Atom feeds.
+
+A category URL picks its source by shape: ``*.xml`` and ``*.xml.gz`` are read
+as sitemaps or sitemap indexes, ``*.rss`` and ``/rss/`` URLs as feeds, and
+anything else is paged as ``trang-N.htm`` listing HTML.
+
+The XML parsers read incrementally with ``iterparse`` and drop each entry once
+it has been yielded, so a 50,000-URL sitemap is enumerated in constant memory
+without building a tree. ``plan_listing_pages`` is a sans-IO generator in the
+style of :func:`tuoitre_crawler.comments.plan_comment_pages`: it yields lists
+of page numbers, expects one list of canonical links (or ``None`` for a failed
+page) per number, and hands every new link to ``accept``.
+"""
+
+import datetime
+import gzip
+import io
+import logging
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from xml.etree.ElementTree import ParseError, iterparse
+
+from .constants import LOGGER_NAME
+
+LOGGER = logging.getLogger(LOGGER_NAME)
+
+LISTING = "listing"
+SITEMAP = "sitemap"
+FEED = "feed"
+
+SITEMAP_SUFFIXES = (".xml", ".xml.gz")
+FEED_SUFFIXES = (".rss", ".atom")
+DATE_TAGS = ("lastmod", "publication_date", "pubDate", "published", "updated", "date")
+
+
+def source_kind(url):
+    path = urlparse(url).path.lower()
+    if path.endswith(FEED_SUFFIXES) or "/rss/" in path:
+        return FEED
+    if path.endswith(SITEMAP_SUFFIXES):
+        return SITEMAP
+    return LISTING
+
+
+class DateRange:
+    """Inclusive ``since``/``until`` days; entries without a date always match."""
+
+    def __init__(self, since=None, until=None):
+        self.since = since
+        self.until = until
+
+    def __bool__(self):
+        return self.since is not None or self.until is not None
+
+    def __contains__(self, moment):
+        if moment is None:
+            return True
+        day = moment.date()
+        if self.since is not None and day < self.since:
+            return False
+        return self.until is None or day <= self.until
+
+    def may_contain(self, newest):
+        """Whether a child sitemap last modified at ``newest`` can hold matches."""
+        return newest is None or self.since is None or newest.date() >= self.since
+
+
+def parse_day(value):
+    """``argparse`` type for ``YYYY-MM-DD``."""
+    return datetime.date.fromisoformat(value)
+
+
+def parse_date(text):
+    if not text:
+        return None
+    text = text.strip()
+    try:
+        return datetime.datetime.fromisoformat(text.replace("Z", "+00:00"))
+    except ValueError:
+        pass
+    try:
+        return parsedate_to_datetime(text)
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def iter_sitemap(stream, dates=None, url=None):
+    """Yield ``(kind, url, modified)`` from a sitemap or sitemap index.
+
+    ``kind`` is ``"url"`` for an article and ``"sitemap"`` for a child sitemap
+    of an index. Articles outside ``dates`` are skipped, as are child sitemaps
+    last modified before ``dates.since``. ``url`` names the document in warnings.
+    """
+    dates = dates or DateRange()
+    for name, entry in _iter_entries(stream, ("url", "sitemap"), url):
+        location = _child_text(entry, ("loc",))
+        if not location:
+            continue
+        modified = parse_date(_child_text(entry, DATE_TAGS))
+        if name == "sitemap":
+            if dates.may_contain(modified):
+                yield "sitemap", location, modified
+        elif modified in dates:
+            yield "url", location, modified
+
+
+def iter_feed(stream, dates=None, url=None):
+    """Yield ``(url, published)`` for each RSS ``<item>`` or Atom ``<entry>`` in ``dates``."""
+    dates = dates or DateRange()
+    for name, entry in _iter_entries(stream, ("item", "entry"), url):
+        if name == "item":
+            location = _child_text(entry, ("link",))
+        else:
+            link = next(
+                (
+                    child
+                    for child in entry
+                    if _local(child.tag) == "link" and child.get("rel", "alternate") == "alternate"
+                ),
+                None,
+            )
+            location = link.get("href") if link is not None else None
+        if not location:
+            continue
+        published = parse_date(_child_text(entry, DATE_TAGS))
+        if published in dates:
+            yield location.strip(), published
+
+
+def open_xml(data, url):
+    """File-like over a fetched sitemap or feed body, gunzipping ``.gz`` files."""
+    stream = data if hasattr(data, "read") else io.BytesIO(data)
+    if urlparse(url).path.lower().endswith(".gz"):
+        return gzip.GzipFile(fileobj=stream)
+    return stream
+
+
+class ChunkReader(io.RawIOBase):
+    """Read-only stream over an iterator of byte chunks, e.g. ``iter_content``.
+
+    ``waited`` adds up the seconds spent waiting for the next chunk.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+        self.waited = 0.0
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while not self._buffer:
+            started = time.monotonic()
+            try:
+                self._buffer = next(self._chunks)
+            except StopIteration:
+                return 0
+            finally:
+                self.waited += time.monotonic() - started
+        size = min(len(target), len(self._buffer))
+        target[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def plan_listing_pages(accept, target, prefetch=1):
+    """Plan listing page fetches until ``target`` new links have been accepted.
+
+    Page 1 is fetched alone; after that up to ``prefetch`` pages are requested
+    at once, but never more than the links still needed suggest at the rate
+    seen so far. Paging stops at a missing page, an empty page, or a page that
+    only repeats links already seen (the site serves its last page for page
+    numbers past the end). Returns the number of pages used.
+    """
+    collected = set()
+    page = 1
+    window = 1
+    while len(collected) < target:
+        results = yield list(range(page, page + window))
+        for offset, links in enumerate(results):
+            if not links:
+                return page + offset
+            new = [link for link in dict.fromkeys(links) if link not in collected]
+            if not new:
+                return page + offset
+            for link in new:
+                collected.add(link)
+                accept(link)
+                if len(collected) >= target:
+                    return page + offset
+        page += window
+        per_page = len(collected) / (page - 1)
+        window = max(1, min(prefetch, -(-(target - len(collected)) // max(1, int(per_page)))))
+    return page - 1
+
+
+def _iter_entries(stream, names, url=None):
+    """Yield ``(local_name, element)`` for each finished entry, then discard it."""
+    parents = []
+    try:
+        for event, element in iterparse(stream, events=("start", "end")):
+            if event == "start":
+                parents.append(element)
+                continue
+            parents.pop()
+            name = _local(element.tag)
+            if name in names:
+                yield name, element
+                element.clear()
+                if parents:
+                    parents[-1].remove(element)
+    except ParseError as exc:
+        # A truncated or malformed document still yields the entries before the error.
+        LOGGER.warning("Stopped reading %s at malformed XML: %s", url or "XML document", exc)
+
+
+def _child_text(element, names):
+    for child in element.iter():
+        if child is not element and _local(child.tag) in names and child.text:
+            return child.text.strip()
+    return None
+
+
+def _local(tag):
+    return tag.rsplit("}", 1)[-1] if isinstance(tag, str) else ""
+
+
+__all__ = [
+    "LISTING",
+    "SITEMAP",
+    "FEED",
+    "DateRange",
+    "ChunkReader",
+    "source_kind",
+    "parse_day",
+    "parse_date",
+    "iter_sitemap",
+    "iter_feed",
+    "open_xml",
+    "plan_listing_pages",
+]
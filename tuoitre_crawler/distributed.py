@@ -0,0 +1,895 @@
+"""Shared work queue for crawling with many worker processes or machines.
+
+A coordinator seeds one listing task per category. Workers lease tasks with a
+visibility timeout: a listing task enqueues the articles on its page plus the
+next page, and an article task runs ``TuoiTreCrawler.process_single_post``.
+A task whose lease runs out before it is acknowledged goes back to the queue.
+Post IDs are claimed in the queue too, so an article reached under two URLs
+is processed by one worker at a time.
+
+Delivery is at-least-once: a task is run again when a worker dies or its
+connection drops before the acknowledgement lands, so the crawler's claims
+and the sinks' ``postId`` keys are what keep its output free of duplicates.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+from .constants import LOGGER_NAME
+from .discovery import LISTING as LISTING_PAGES
+from .discovery import source_kind
+from .helpers import canonicalize_url
+from .state import DONE, FAILED, PENDING
+
+LOGGER = logging.getLogger(LOGGER_NAME)
+
+LISTING = "listing"
+ARTICLE = "article"
+LEASED = "leased"
+
+# Articles are leased before listing pages so the queue stays shallow: the
+# next page is only fetched once the articles already found are taken.
+PRIORITIES = {ARTICLE: 0, LISTING: 1}
+
+# A listing page answering with one of these is past the last page.
+END_OF_LISTING_STATUSES = (404, 410)
+
+QUEUE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    url TEXT NOT NULL,
+    category TEXT,
+    payload TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    owner TEXT,
+    deadline REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS tasks_ready ON tasks (status, priority);
+CREATE TABLE IF NOT EXISTS claims (
+    post_id TEXT PRIMARY KEY,
+    task_id TEXT NOT NULL,
+    expires_at REAL
+);
+CREATE TABLE IF NOT EXISTS saved (
+    category TEXT PRIMARY KEY,
+    posts INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+class Task:
+    """A listing page or article URL plus what a worker needs to process it.
+
+    ``category`` is the category URL the task descends from. Both kinds carry
+    the per-category ``target`` of saved posts (0 for the whole history);
+    listing tasks also carry their ``page`` number, and article tasks the
+    audio links found next to them on the listing page.
+    """
+
+    def __init__(self, kind, url, category, page=None, target=0, audio=None, attempts=0):
+        self.kind = kind
+        self.url = url
+        self.category = category
+        self.page = page
+        self.target = target
+        self.audio = audio or []
+        self.attempts = attempts
+        self.id = task_id(kind, url)
+
+    @property
+    def payload(self):
+        return json.dumps({"page": self.page, "target": self.target, "audio": self.audio})
+
+    @classmethod
+    def from_fields(cls, kind, url, category, payload, attempts=0):
+        extra = json.loads(payload or "{}")
+        return cls(
+            kind,
+            url,
+            category,
+            page=extra.get("page"),
+            target=extra.get("target") or 0,
+            audio=extra.get("audio"),
+            attempts=int(attempts or 0),
+        )
+
+    def __repr__(self):
+        return f"Task({self.kind}, {self.url!r})"
+
+
+def task_id(kind, url):
+    return hashlib.sha1(f"{kind} {url}".encode("utf-8")).hexdigest()[:24]
+
+
+class SqliteWorkQueue:
+    """Work queue in a SQLite file shared by every process on one host.
+
+    Each process opens its own connection; leases and claims run inside
+    ``BEGIN IMMEDIATE`` transactions, so SQLite's file lock makes them
+    atomic across processes.
+    """
+
+    def __init__(self, path, visibility_timeout=300, max_attempts=3):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            str(self.path), timeout=60, isolation_level=None, check_same_thread=False
+        )
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(QUEUE_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def put(self, task):
+        with self._transaction() as conn:
+            added = conn.execute(
+                """
+                INSERT OR IGNORE INTO tasks (id, kind, url, category, payload, priority, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    task.id,
+                    task.kind,
+                    task.url,
+                    task.category,
+                    task.payload,
+                    PRIORITIES[task.kind],
+                    PENDING,
+                ),
+            ).rowcount
+        return bool(added)
+
+    def lease(self, owner, count=1):
+        now = time.time()
+        with self._transaction() as conn:
+            self._expire(conn, now)
+            rows = conn.execute(
+                """
+                SELECT id, kind, url, category, payload, attempts FROM tasks
+                WHERE status = ? ORDER BY priority, rowid LIMIT ?
+                """,
+                (PENDING, count),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE tasks SET status = ?, owner = ?, deadline = ? WHERE id = ?",
+                [(LEASED, owner, now + self.visibility_timeout, row["id"]) for row in rows],
+            )
+        return [
+            Task.from_fields(
+                row["kind"], row["url"], row["category"], row["payload"], row["attempts"]
+            )
+            for row in rows
+        ]
+
+    def extend(self, tasks, owner):
+        deadline = time.time() + self.visibility_timeout
+        with self._transaction() as conn:
+            for task in tasks:
+                conn.execute(
+                    "UPDATE tasks SET deadline = ? WHERE id = ? AND owner = ? AND status = ?",
+                    (deadline, task.id, owner, LEASED),
+                )
+                conn.execute(
+                    "UPDATE claims SET expires_at = ? WHERE task_id = ? AND expires_at IS NOT NULL",
+                    (deadline, task.id),
+                )
+
+    def ack(self, task, owner, saved=False):
+        """Mark ``task`` done; ``saved`` counts a post toward its category's target."""
+        with self._transaction() as conn:
+            acked = conn.execute(
+                """
+                UPDATE tasks SET status = ?, owner = NULL, deadline = NULL, error = NULL
+                WHERE id = ? AND owner = ? AND status = ?
+                """,
+                (DONE, task.id, owner, LEASED),
+            ).rowcount
+            if acked:
+                conn.execute("UPDATE claims SET expires_at = NULL WHERE task_id = ?", (task.id,))
+            if acked and saved:
+                conn.execute(
+                    """
+                    INSERT INTO saved (category, posts) VALUES (?, 1)
+                    ON CONFLICT(category) DO UPDATE SET posts = posts + 1
+                    """,
+                    (task.category,),
+                )
+        return bool(acked)
+
+    def fail(self, task, owner, error):
+        with self._transaction() as conn:
+            conn.execute(
+                """
+                UPDATE tasks SET
+                    status = CASE WHEN attempts + 1 >= ? THEN ? ELSE ? END,
+                    attempts = attempts + 1, owner = NULL, deadline = NULL, error = ?
+                WHERE id = ? AND owner = ? AND status = ?
+                """,
+                (self.max_attempts, FAILED, PENDING, str(error), task.id, owner, LEASED),
+            )
+            conn.execute("DELETE FROM claims WHERE task_id = ?", (task.id,))
+
+    def claim_post(self, post_id, task_id):
+        """Return True if ``task_id`` may process ``post_id``."""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT task_id, expires_at FROM claims WHERE post_id = ?", (post_id,)
+            ).fetchone()
+            if row is not None and row["task_id"] != task_id:
+                if row["expires_at"] is None or row["expires_at"] > now:
+                    return False
+            conn.execute(
+                "INSERT OR REPLACE INTO claims (post_id, task_id, expires_at) VALUES (?, ?, ?)",
+                (post_id, task_id, now + self.visibility_timeout),
+            )
+        return True
+
+    def saved(self, category):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT posts FROM saved WHERE category = ?", (category,)
+            ).fetchone()
+        return row["posts"] if row else 0
+
+    def counts(self):
+        with self._transaction() as conn:
+            self._expire(conn, time.time())
+            rows = conn.execute(
+                "SELECT status, COUNT(*) AS n FROM tasks GROUP BY status"
+            ).fetchall()
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        counts.update({row["status"]: row["n"] for row in rows})
+        return counts
+
+    def idle(self):
+        counts = self.counts()
+        return counts[PENDING] == 0 and counts[LEASED] == 0
+
+    def _expire(self, conn, now):
+        conn.execute(
+            """
+            UPDATE tasks SET
+                status = CASE WHEN attempts + 1 >= ? THEN ? ELSE ? END,
+                attempts = attempts + 1, owner = NULL, deadline = NULL,
+                error = 'lease expired'
+            WHERE status = ? AND deadline < ?
+            """,
+            (self.max_attempts, FAILED, PENDING, LEASED, now),
+        )
+
+    def _transaction(self):
+        return _Immediate(self._conn, self._lock)
+
+
+class _Immediate:
+    def __init__(self, conn, lock):
+        self.conn = conn
+        self.lock = lock
+
+    def __enter__(self):
+        self.lock.acquire()
+        try:
+            self.conn.execute("BEGIN IMMEDIATE")
+        except BaseException:
+            self.lock.release()
+            raise
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.lock.release()
+
+
+class RespError(Exception):
+    """Error reply from a Redis-protocol server."""
+
+
+# Commands that may be sent again after the connection dropped mid-reply.
+IDEMPOTENT_COMMANDS = frozenset(
+    ("GET", "HGET", "HGETALL", "LLEN", "LRANGE", "PING", "SCARD", "SMEMBERS", "ZSCORE")
+)
+
+
+class RespClient:
+    """Minimal thread-safe Redis (RESP2) client over one socket.
+
+    A command is sent again on a new connection only if it is a read or was
+    never sent; the server may already have applied a write whose reply was
+    lost, so such a failure is raised to the caller instead.
+    """
+
+    def __init__(self, host="127.0.0.1", port=6379, db=0, password=None, timeout=30):
+        self.address = (host, port)
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._sock = None
+        self._reader = None
+
+    def execute(self, *args):
+        with self._lock:
+            for attempt in (1, 2):
+                sent = False
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    sent = True
+                    return self._command(*args)
+                except (OSError, EOFError):
+                    self._disconnect()
+                    if attempt == 2 or (sent and str(args[0]).upper() not in IDEMPOTENT_COMMANDS):
+                        raise
+
+    def transaction(self, prepare, watch=()):
+        """Run the commands ``prepare`` returns in one ``MULTI``/``EXEC``.
+
+        ``watch`` keys are watched first; ``prepare(read)`` may run reads with
+        ``read(*args)`` (or ``read("WATCH", key)``) on the same connection and
+        returns a list of commands, or None to run nothing. Returns the
+        ``EXEC`` replies, or None when ``prepare`` declined or a watched key
+        changed before ``EXEC``.
+        """
+        with self._lock:
+            for attempt in (1, 2):
+                committing = False
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    if watch:
+                        self._command("WATCH", *watch)
+                    commands = prepare(self._command)
+                    if commands is None:
+                        self._command("UNWATCH")
+                        return None
+                    committing = True
+                    self._send_many([("MULTI",), *commands, ("EXEC",)])
+                    replies = [self._reply() for _ in range(len(commands) + 2)]
+                except (OSError, EOFError):
+                    self._disconnect()
+                    if attempt == 2 or committing:
+                        raise
+                    continue
+                for reply in replies:
+                    if isinstance(reply, RespError):
+                        raise reply
+                for reply in replies[-1] or ():
+                    if isinstance(reply, RespError):
+                        raise reply
+                return replies[-1]
+
+    def _command(self, *args):
+        self._send(args)
+        return self._read()
+
+    def _reply(self):
+        try:
+            return self._read()
+        except RespError as exc:
+            return exc
+
+    def close(self):
+        with self._lock:
+            self._disconnect()
+
+    def _connect(self):
+        self._sock = socket.create_connection(self.address, timeout=self.timeout)
+        self._reader = self._sock.makefile("rb")
+        if self.password:
+            self._send(("AUTH", self.password))
+            self._read()
+        if self.db:
+            self._send(("SELECT", self.db))
+            self._read()
+
+    def _disconnect(self):
+        if self._sock is not None:
+            try:
+                self._reader.close()
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = self._reader = None
+
+    def _send(self, args):
+        self._send_many([args])
+
+    def _send_many(self, commands):
+        parts = []
+        for args in commands:
+            parts.append(b"*%d\r\n" % len(args))
+            for arg in args:
+                data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+                parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self._sock.sendall(b"".join(parts))
+
+    def _read(self, nested=False):
+        line = self._reader.readline()
+        if not line:
+            raise EOFError("connection closed by server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode("utf-8")
+        if kind == b"-":
+            # Inside an array (EXEC replies) the rest must still be read.
+            error = RespError(rest.decode("utf-8"))
+            if nested:
+                return error
+            raise error
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            size = int(rest)
+            if size < 0:
+                return None
+            data = self._reader.read(size + 2)
+            return data[:-2].decode("utf-8")
+        if kind == b"*":
+            size = int(rest)
+            return None if size < 0 else [self._read(nested=True) for _ in range(size)]
+        raise RespError(f"unexpected reply {line!r}")
+
+
+class RedisWorkQueue:
+    """The same queue on a Redis-protocol server, for workers on many hosts.
+
+    Pending task IDs live in one list per priority and move atomically to a
+    processing list when leased (``RPOPLPUSH``); lease deadlines are a sorted
+    set. Every other change spanning several keys runs in one ``MULTI``/``EXEC``
+    that ``WATCH``-es the task hash, so a worker acknowledging a task and
+    another putting its expired lease back cannot both win. Post claims are
+    keys set with a TTL that is removed once the task is acknowledged.
+    Delivery is at-least-once (see the module docstring).
+    Only commands served by ``bench.redis_standin`` are used.
+    """
+
+    def __init__(self, client, prefix="tuoitre", visibility_timeout=300, max_attempts=3):
+        self.client = client
+        self.prefix = prefix
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+
+    def close(self):
+        self.client.close()
+
+    def put(self, task):
+        task_key = self._key("task", task.id)
+
+        def prepare(read):
+            if read("HGET", task_key, "kind") is not None:
+                return None
+            commands = [
+                (
+                    "HSET",
+                    task_key,
+                    "kind",
+                    task.kind,
+                    "url",
+                    task.url,
+                    "category",
+                    task.category or "",
+                    "payload",
+                    task.payload,
+                    "attempts",
+                    0,
+                ),
+                ("LPUSH", self._pending(task.kind), task.id),
+            ]
+            return commands
+
+        return self.client.transaction(prepare, watch=(task_key,)) is not None
+
+    def lease(self, owner, count=1):
+        self._expire()
+        deadline = time.time() + self.visibility_timeout
+        tasks = []
+        for kind in sorted(PRIORITIES, key=PRIORITIES.get):
+            while len(tasks) < count:
+                task_id = self._call("RPOPLPUSH", self._pending(kind), self._key("processing"))
+                if task_id is None:
+                    break
+                task_key = self._key("task", task_id)
+                replies = self.client.transaction(
+                    lambda read: [
+                        ("ZADD", self._key("deadlines"), deadline, task_id),
+                        ("HSET", task_key, "owner", owner, "deadline", deadline),
+                        ("HGETALL", task_key),
+                    ]
+                )
+                fields = dict(zip(replies[2][::2], replies[2][1::2]))
+                tasks.append(
+                    Task.from_fields(
+                        fields["kind"],
+                        fields["url"],
+                        fields.get("category"),
+                        fields.get("payload"),
+                        fields.get("attempts"),
+                    )
+                )
+        return tasks
+
+    def extend(self, tasks, owner):
+        deadline = time.time() + self.visibility_timeout
+        ttl = int(self.visibility_timeout * 1000)
+        for task in tasks:
+
+            def prepare(read, task=task):
+                commands = [
+                    ("ZADD", self._key("deadlines"), "XX", deadline, task.id),
+                    ("HSET", self._key("task", task.id), "deadline", deadline),
+                ]
+                for post_id in read("SMEMBERS", self._key("claims", task.id)) or []:
+                    commands.append(("PEXPIRE", self._key("claim", post_id), ttl))
+                return commands
+
+            self._if_owner(task.id, owner, prepare)
+
+    def ack(self, task, owner, saved=False):
+        def prepare(read):
+            commands = [
+                ("ZREM", self._key("deadlines"), task.id),
+                ("LREM", self._key("processing"), 1, task.id),
+                ("SADD", self._key(DONE), task.id),
+                ("HDEL", self._key("task", task.id), "owner", "deadline"),
+            ]
+            if saved:
+                commands.append(("INCR", self._key("saved", task.category)))
+            for post_id in read("SMEMBERS", self._key("claims", task.id)) or []:
+                commands.append(("PERSIST", self._key("claim", post_id)))
+            return commands
+
+        return self._if_owner(task.id, owner, prepare) is not None
+
+    def fail(self, task, owner, error):
+        self._if_owner(
+            task.id, owner, lambda read: self._requeue_commands(read, task.id, str(error))
+        )
+
+    def claim_post(self, post_id, task_id):
+        key = self._key("claim", post_id)
+        ttl = int(self.visibility_timeout * 1000)
+
+        def prepare(read):
+            if read("GET", key) not in (None, task_id):
+                return None
+            return [
+                ("SET", key, task_id, "PX", ttl),
+                ("SADD", self._key("claims", task_id), post_id),
+            ]
+
+        return self.client.transaction(prepare, watch=(key,)) is not None
+
+    def saved(self, category):
+        return int(self._call("GET", self._key("saved", category)) or 0)
+
+    def counts(self):
+        self._expire()
+        return {
+            PENDING: sum(self._call("LLEN", self._pending(kind)) for kind in PRIORITIES),
+            LEASED: self._call("LLEN", self._key("processing")),
+            DONE: self._call("SCARD", self._key(DONE)),
+            FAILED: self._call("SCARD", self._key(FAILED)),
+        }
+
+    def idle(self):
+        counts = self.counts()
+        return counts[PENDING] == 0 and counts[LEASED] == 0
+
+    def _if_owner(self, task_id, owner, prepare):
+        """Run ``prepare``'s commands only while ``owner`` holds the lease."""
+        task_key = self._key("task", task_id)
+
+        def guarded(read):
+            if read("HGET", task_key, "owner") != owner:
+                return None
+            return prepare(read)
+
+        return self.client.transaction(guarded, watch=(task_key,))
+
+    def _expire(self):
+        now = time.time()
+        for task_id in self._call("LRANGE", self._key("processing"), 0, -1) or []:
+
+            def prepare(read, task_id=task_id):
+                score = read("ZSCORE", self._key("deadlines"), task_id)
+                if score is None:
+                    # Popped by a worker that died before it recorded the lease.
+                    deadline = now + self.visibility_timeout
+                    return [("ZADD", self._key("deadlines"), "NX", deadline, task_id)]
+                if float(score) >= now:
+                    return None
+                return self._requeue_commands(read, task_id, "lease expired")
+
+            # Extending or acknowledging the lease writes the task hash, which
+            # aborts a requeue racing with it.
+            self.client.transaction(prepare, watch=(self._key("task", task_id),))
+
+    def _requeue_commands(self, read, task_id, error):
+        task_key = self._key("task", task_id)
+        attempts = int(read("HGET", task_key, "attempts") or 0) + 1
+        commands = [
+            ("ZREM", self._key("deadlines"), task_id),
+            ("HSET", task_key, "attempts", attempts, "error", error),
+            ("HDEL", task_key, "owner", "deadline"),
+            ("LREM", self._key("processing"), 1, task_id),
+        ]
+        if attempts >= self.max_attempts:
+            commands.append(("SADD", self._key(FAILED), task_id))
+        else:
+            commands.append(("LPUSH", self._pending(read("HGET", task_key, "kind")), task_id))
+        claims_key = self._key("claims", task_id)
+        for post_id in read("SMEMBERS", claims_key) or []:
+            key = self._key("claim", post_id)
+            read("WATCH", key)
+            if read("GET", key) == task_id:
+                commands.append(("DEL", key))
+        commands.append(("DEL", claims_key))
+        return commands
+
+    def _pending(self, kind):
+        return self._key("pending", PRIORITIES[kind])
+
+    def _key(self, *parts):
+        return ":".join([self.prefix, *map(str, parts)])
+
+    def _call(self, *args):
+        return self.client.execute(*args)
+
+
+def open_queue(spec, visibility_timeout=300, max_attempts=3):
+    """Open ``redis://host:port/db?prefix=name`` or a SQLite queue file path."""
+    parsed = urlparse(str(spec))
+    if parsed.scheme in ("redis", "resp"):
+        client = RespClient(
+            parsed.hostname or "127.0.0.1",
+            parsed.port or 6379,
+            db=int(parsed.path.strip("/") or 0),
+            password=parsed.password,
+        )
+        prefix = parse_qs(parsed.query).get("prefix", ["tuoitre"])[0]
+        return RedisWorkQueue(
+            client, prefix, visibility_timeout=visibility_timeout, max_attempts=max_attempts
+        )
+    path = parsed.path if parsed.scheme == "sqlite" else str(spec)
+    return SqliteWorkQueue(path, visibility_timeout=visibility_timeout, max_attempts=max_attempts)
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+def seed_categories(queue, categories, posts_per_category=0):
+    """Queue page 1 of every category; returns how many were new."""
+    return sum(
+        queue.put(Task(LISTING, url, url, page=1, target=posts_per_category))
+        for url in categories
+    )
+
+
+def wait_until_drained(queue, interval=10.0):
+    """Log queue counts every ``interval`` seconds until no work is left."""
+    while True:
+        counts = queue.counts()
+        LOGGER.info(
+            "Queue: %s pending, %s leased, %s done, %s failed",
+            counts[PENDING],
+            counts[LEASED],
+            counts[DONE],
+            counts[FAILED],
+        )
+        if counts[PENDING] == 0 and counts[LEASED] == 0:
+            return counts
+        time.sleep(interval)
+
+
+class DistributedWorker:
+    """Lease tasks from a shared queue and process them with a crawler.
+
+    Up to ``crawler.max_workers`` tasks run at once. Leases are extended
+    while tasks run, and tasks are acknowledged only after the crawler's
+    sink has flushed their records, so a worker that dies mid-batch leaves
+    its tasks to be leased again. A task whose page could not be fetched is
+    failed rather than acknowledged, so it is retried up to the queue's
+    ``max_attempts``. The crawler's ``claim_post`` hook is
+    pointed at the queue, which adds a global post ID claim on top of the
+    crawler's per-process :class:`~tuoitre_crawler.dedup.ClaimRegistry`.
+    """
+
+    def __init__(self, crawler, queue, worker_id=None, poll_interval=1.0, ack_interval=1.0):
+        self.crawler = crawler
+        self.queue = queue
+        self.worker_id = worker_id or default_worker_id()
+        self.poll_interval = poll_interval
+        self.ack_interval = ack_interval
+        self.stats = {"leased": 0, "acked": 0, "failed": 0, "lost": 0, "duplicates": 0}
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        crawler.claim_post = self._claim_post
+
+    def run(self, stop_when_idle=True):
+        crawler = self.crawler
+        summary = {
+            "total_posts": 0,
+            "total_comments": 0,
+            "categories": {},
+            "comment_rich_posts": 0,
+        }
+        slots = max(1, crawler.max_workers)
+        in_flight = {}
+        unacked = []
+        last_extend = last_ack = time.monotonic()
+        LOGGER.info("Worker %s started", self.worker_id)
+        with ThreadPoolExecutor(max_workers=slots) as executor:
+            try:
+                while True:
+                    if len(in_flight) < slots:
+                        for task in self.queue.lease(self.worker_id, slots - len(in_flight)):
+                            self.stats["leased"] += 1
+                            in_flight[executor.submit(self._process, task)] = task
+                    if not in_flight:
+                        if unacked:
+                            self._ack(unacked)
+                        if stop_when_idle and self.queue.idle():
+                            break
+                        time.sleep(self.poll_interval)
+                        continue
+                    done, _ = wait(
+                        in_flight, timeout=self.poll_interval, return_when=FIRST_COMPLETED
+                    )
+                    for future in done:
+                        self._finish(in_flight.pop(future), future, summary, unacked)
+                    now = time.monotonic()
+                    if in_flight and now - last_extend > self.queue.visibility_timeout / 3:
+                        self.queue.extend(list(in_flight.values()), self.worker_id)
+                        last_extend = now
+                    if unacked and now - last_ack > self.ack_interval:
+                        self._ack(unacked)
+                        last_ack = now
+            finally:
+                for future in list(in_flight):
+                    future.cancel()
+        crawler._finish_run(summary)
+        self._ack(unacked)
+        summary["worker"] = dict(self.stats, id=self.worker_id)
+        summary["queue"] = self.queue.counts()
+        return summary
+
+    def _finish(self, task, future, summary, unacked):
+        try:
+            processed = future.result()
+        except Exception as exc:
+            LOGGER.error("Task %s failed: %s", task, exc)
+            self.stats["failed"] += 1
+            self.queue.fail(task, self.worker_id, exc)
+            return
+        if processed:
+            self.crawler._tally(summary, processed)
+            categories = summary["categories"]
+            categories[processed.category] = categories.get(processed.category, 0) + 1
+        unacked.append((task, bool(processed)))
+
+    def _ack(self, tasks):
+        self.crawler.sink.flush()
+        for task, saved in tasks:
+            if self.queue.ack(task, self.worker_id, saved=saved):
+                self.stats["acked"] += 1
+            else:
+                LOGGER.warning("Lease on %s expired before it was acknowledged", task)
+                self.stats["lost"] += 1
+        tasks.clear()
+
+    def _process(self, task):
+        self._local.task = task
+        try:
+            if task.kind == LISTING:
+                return self._process_listing(task)
+            if self._target_reached(task):
+                return None
+            for audio_url in task.audio:
+                self.crawler._remember_listing_audio(task.url, audio_url)
+            processed = self.crawler.process_single_post(
+                task.url, self.crawler._category_slug(task.category)
+            )
+            if processed is None:
+                status, error = self.crawler.state.url_status(task.url)
+                if status == FAILED:
+                    raise RuntimeError(f"{task.url}: {error}")
+            return processed
+        finally:
+            self._local.task = None
+
+    def _process_listing(self, task):
+        crawler = self.crawler
+        if source_kind(task.url) != LISTING_PAGES:
+            # Sitemaps and feeds are enumerated in one task; they are cheap to read.
+            target = task.target or float("inf")
+            for url in crawler.iter_category_posts(task.url, target):
+                if self._target_reached(task):
+                    break
+                self.queue.put(Task(ARTICLE, url, task.category, target=task.target))
+            return None
+        import requests  # already loaded by the crawler; kept out of CLI start-up
+
+        try:
+            response = crawler.request(task.url)
+        except requests.HTTPError as exc:
+            if exc.response.status_code not in END_OF_LISTING_STATUSES:
+                raise
+            LOGGER.info("No more posts on %s", task.url)
+            return None
+        response.encoding = response.encoding or "utf-8"
+        links = crawler._listing_links(response.text)
+        if self._target_reached(task):
+            return None
+        for link in links:
+            url = canonicalize_url(link)
+            audio = crawler.listing_audio_map.pop(url, [])
+            self.queue.put(Task(ARTICLE, url, task.category, target=task.target, audio=audio))
+        if not links:
+            LOGGER.info("No more posts on %s", task.url)
+        else:
+            page = (task.page or 1) + 1
+            self.queue.put(
+                Task(
+                    LISTING,
+                    crawler._page_url(task.category, page),
+                    task.category,
+                    page=page,
+                    target=task.target,
+                )
+            )
+        return None
+
+    def _target_reached(self, task):
+        return bool(task.target) and self.queue.saved(task.category) >= task.target
+
+    def _claim_post(self, post_id):
+        task = getattr(self._local, "task", None)
+        if task is None:
+            return True
+        if self.queue.claim_post(post_id, task.id):
+            return True
+        with self._stats_lock:
+            self.stats["duplicates"] += 1
+        return False
+
+
+__all__ = [
+    "Task",
+    "SqliteWorkQueue",
+    "RedisWorkQueue",
+    "RespClient",
+    "RespError",
+    "DistributedWorker",
+    "open_queue",
+    "default_worker_id",
+    "seed_categories",
+    "wait_until_drained",
+    "LISTING",
+    "ARTICLE",
+]
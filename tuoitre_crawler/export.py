@@ -0,0 +1,381 @@
+"""Incremental columnar export of stored records for analytics.
+
+``export_records`` streams the records saved by any sink into two tables:
+``posts`` (one row per post, article reactions spread into ``reaction_*``
+columns) and ``comments`` (the ``comments[].replies[]`` tree flattened
+depth-first, with ``parent_id`` and ``depth``). Each run writes one new part
+per table, Parquet when ``pyarrow`` is installed and gzipped CSV otherwise,
+and records what it read in ``manifest.json`` so the next run only reads
+per-post files that changed, lines appended to JSONL shards and SQLite rows
+saved since. A post saved again after it was exported (``--refresh-comments``)
+reappears in a later part; the row with the highest ``export_run`` is current.
+"""
+
+import csv
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+from .constants import ARTICLE_REACTION_LABELS, COMMENT_REACTION_LABELS, LOGGER_NAME
+from .sinks import SHARD_PATTERN, SQLITE_FILENAME, _complete_lines, _open_shard_for_reading
+
+# Optional, and slow to import: loaded when an export resolves its format so
+# the CLI does not pay for it on crawl runs.
+pyarrow = None
+
+LOGGER = logging.getLogger(LOGGER_NAME)
+
+EXPORT_FORMATS = ("auto", "parquet", "csv")
+MANIFEST_FILENAME = "manifest.json"
+
+# Column kinds: "str" plain text, "int" integer, "dict" dictionary-encoded text.
+POST_COLUMNS = (
+    [
+        ("post_id", "str"),
+        ("title", "str"),
+        ("date", "str"),
+        ("category", "dict"),
+        ("authors", "dict"),
+        ("source_url", "str"),
+        ("content", "str"),
+        ("comment_count", "int"),
+        ("image_count", "int"),
+        ("audio_count", "int"),
+    ]
+    + [(f"reaction_{label}", "int") for label in ARTICLE_REACTION_LABELS.values()]
+    + [("export_run", "int")]
+)
+COMMENT_COLUMNS = (
+    [
+        ("post_id", "str"),
+        ("comment_id", "str"),
+        ("parent_id", "str"),
+        ("depth", "int"),
+        ("author", "dict"),
+        ("text", "str"),
+        ("date", "str"),
+        ("reply_count", "int"),
+    ]
+    + [(f"reaction_{label}", "int") for label in COMMENT_REACTION_LABELS.values()]
+    + [("export_run", "int")]
+)
+
+
+def resolve_export_format(name="auto"):
+    if name not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {name!r}")
+    _import_pyarrow()
+    if name == "parquet" and pyarrow is None:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+    if name == "auto":
+        return "parquet" if pyarrow is not None else "csv"
+    return name
+
+
+def _import_pyarrow():
+    global pyarrow
+    if pyarrow is None:
+        try:  # pragma: no cover - optional dependency
+            import pyarrow.parquet
+        except ImportError:  # pragma: no cover - optional dependency
+            return None
+    return pyarrow
+
+
+def export_records(source_dir, export_dir, export_format="auto", batch_rows=50_000):
+    """Export records saved under ``source_dir`` since the last run into ``export_dir``.
+
+    Returns a summary with the run number, the format, and how many posts
+    and comment rows were written.
+    """
+    source_dir = Path(source_dir)
+    export_dir = Path(export_dir)
+    export_dir.mkdir(parents=True, exist_ok=True)
+    manifest = _load_manifest(export_dir)
+    export_format = resolve_export_format(export_format)
+    if manifest.get("format", export_format) != export_format:
+        raise ValueError(
+            f"{export_dir} already holds a {manifest['format']} export; "
+            f"use a new directory for {export_format}"
+        )
+    run = manifest["runs"] + 1
+    seen = {"files": {}, "shards": {}, "sqlite_saved_at": manifest["sqlite_saved_at"]}
+    dictionaries = _Dictionaries(export_dir / "dictionaries") if export_format == "csv" else None
+    posts = _TableWriter(export_dir, "posts", run, POST_COLUMNS, export_format, dictionaries)
+    comments = _TableWriter(
+        export_dir, "comments", run, COMMENT_COLUMNS, export_format, dictionaries
+    )
+    summary = {"run": run, "format": export_format, "posts": 0, "comments": 0}
+    started = time.monotonic()
+    try:
+        for record in _iter_new_records(source_dir, manifest, seen):
+            posts.append(_post_row(record, run))
+            for row in _comment_rows(record, run):
+                comments.append(row)
+                summary["comments"] += 1
+            summary["posts"] += 1
+            for table in (posts, comments):
+                if table.pending >= batch_rows:
+                    table.flush()
+    except BaseException:
+        posts.abort()
+        comments.abort()
+        raise
+    posts.close()
+    comments.close()
+    if dictionaries is not None:
+        dictionaries.close()
+    manifest["format"] = export_format
+    manifest["files"].update(seen["files"])
+    manifest["shards"].update(seen["shards"])
+    manifest["sqlite_saved_at"] = seen["sqlite_saved_at"]
+    if summary["posts"]:
+        manifest["runs"] = run
+    summary["run"] = manifest["runs"]
+    _save_manifest(export_dir, manifest)
+    summary["seconds"] = round(time.monotonic() - started, 3)
+    LOGGER.info(
+        "Exported %s posts and %s comments (%s run %s)",
+        summary["posts"],
+        summary["comments"],
+        export_format,
+        summary["run"],
+    )
+    return summary
+
+
+def _iter_new_records(source_dir, manifest, seen):
+    """Yield records not covered by ``manifest``, noting what was read in ``seen``."""
+    for path in sorted(source_dir.glob("*.json")):
+        stat = path.stat()
+        marker = [stat.st_size, stat.st_mtime_ns]
+        if manifest["files"].get(path.name) == marker:
+            continue
+        with path.open("r", encoding="utf-8") as fp:
+            yield json.load(fp)
+        seen["files"][path.name] = marker
+    for path in sorted(source_dir.iterdir()):
+        if not SHARD_PATTERN.match(path.name):
+            continue
+        done = manifest["shards"].get(path.name, 0)
+        lines = 0
+        with _open_shard_for_reading(path) as fp:
+            for line in _complete_lines(fp):
+                lines += 1
+                if lines > done and line.strip():
+                    yield json.loads(line)
+        seen["shards"][path.name] = lines
+    db_path = source_dir / SQLITE_FILENAME
+    if db_path.exists():
+        conn = sqlite3.connect(str(db_path))
+        try:
+            rows = conn.execute(
+                "SELECT saved_at, record FROM posts WHERE saved_at > ? ORDER BY saved_at",
+                (manifest["sqlite_saved_at"],),
+            )
+            for saved_at, record in rows:
+                yield json.loads(record)
+                seen["sqlite_saved_at"] = max(seen["sqlite_saved_at"], saved_at)
+        finally:
+            conn.close()
+
+
+def _post_row(record, run):
+    reactions = record.get("vote_reactions") or {}
+    row = {
+        "post_id": record.get("postId"),
+        "title": record.get("title"),
+        "date": record.get("date"),
+        "category": record.get("category"),
+        "authors": "; ".join(record.get("authors") or []) or None,
+        "source_url": record.get("source_url"),
+        "content": record.get("content"),
+        "comment_count": len(record.get("comments") or []),
+        "image_count": len(record.get("image_files") or []),
+        "audio_count": len(record.get("audio_files") or []),
+        "export_run": run,
+    }
+    for label in ARTICLE_REACTION_LABELS.values():
+        row[f"reaction_{label}"] = reactions.get(label, 0)
+    return row
+
+
+def _comment_rows(record, run):
+    """Flatten the reply tree depth-first, parents before their replies."""
+    post_id = record.get("postId")
+    stack = [(comment, None, 0) for comment in reversed(record.get("comments") or [])]
+    while stack:
+        comment, parent_id, depth = stack.pop()
+        replies = comment.get("replies") or []
+        reactions = comment.get("vote_reactions") or {}
+        row = {
+            "post_id": post_id,
+            "comment_id": comment.get("commentId"),
+            "parent_id": parent_id,
+            "depth": depth,
+            "author": comment.get("author"),
+            "text": comment.get("text"),
+            "date": comment.get("date"),
+            "reply_count": len(replies),
+            "export_run": run,
+        }
+        for label in COMMENT_REACTION_LABELS.values():
+            row[f"reaction_{label}"] = reactions.get(label, 0)
+        yield row
+        stack.extend((reply, row["comment_id"], depth + 1) for reply in reversed(replies))
+
+
+class _TableWriter:
+    """Buffer rows column-wise and write them as one part file per run.
+
+    Parts are written under a temporary name and renamed on ``close`` so an
+    interrupted export leaves no half-written part behind.
+    """
+
+    def __init__(self, export_dir, name, run, columns, export_format, dictionaries):
+        self.columns = columns
+        self.format = export_format
+        self.dictionaries = dictionaries
+        suffix = ".parquet" if export_format == "parquet" else ".csv.gz"
+        directory = export_dir / name
+        directory.mkdir(parents=True, exist_ok=True)
+        self.path = directory / f"part-{run:05d}{suffix}"
+        self.tmp_path = self.path.with_name(self.path.name + ".tmp")
+        self.buffers = {column: [] for column, _ in columns}
+        self.rows = 0
+        self._writer = None
+        self._fp = None
+
+    @property
+    def pending(self):
+        return len(self.buffers[self.columns[0][0]])
+
+    def append(self, row):
+        for column, _ in self.columns:
+            self.buffers[column].append(row.get(column))
+
+    def flush(self):
+        if not self.pending:
+            return
+        if self.format == "parquet":
+            self._flush_parquet()
+        else:
+            self._flush_csv()
+        self.rows += self.pending
+        for values in self.buffers.values():
+            values.clear()
+
+    def close(self):
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+        if self._fp is not None:
+            self._fp.close()
+        if self.rows:
+            os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        for handle in (self._writer, self._fp):
+            if handle is not None:
+                handle.close()
+        if self.tmp_path.exists():
+            self.tmp_path.unlink()
+
+    def _flush_parquet(self):
+        arrays = []
+        for column, kind in self.columns:
+            values = self.buffers[column]
+            if kind == "int":
+                arrays.append(pyarrow.array(values, type=pyarrow.int64()))
+            elif kind == "dict":
+                arrays.append(pyarrow.array(values, type=pyarrow.string()).dictionary_encode())
+            else:
+                arrays.append(pyarrow.array(values, type=pyarrow.string()))
+        table = pyarrow.Table.from_arrays(arrays, names=[column for column, _ in self.columns])
+        if self._writer is None:
+            self._writer = pyarrow.parquet.ParquetWriter(
+                str(self.tmp_path), table.schema, compression="zstd"
+            )
+        self._writer.write_table(table)
+
+    def _flush_csv(self):
+        if self._fp is None:
+            self._fp = gzip.open(self.tmp_path, "wt", encoding="utf-8", newline="")
+            self._csv = csv.writer(self._fp)
+            self._csv.writerow(
+                f"{column}_id" if kind == "dict" else column for column, kind in self.columns
+            )
+        columns = []
+        for column, kind in self.columns:
+            values = self.buffers[column]
+            if kind == "dict":
+                values = [self.dictionaries.code(column, value) for value in values]
+            columns.append(values)
+        self._csv.writerows(zip(*columns))
+
+
+class _Dictionaries:
+    """Append-only ``<column>.csv`` code tables for the dictionary-encoded CSV columns."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._codes = {}
+        self._files = {}
+
+    def code(self, column, value):
+        if value is None:
+            return ""
+        codes = self._load(column)
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(codes)
+            self._files[column][1].writerow((code, value))
+        return code
+
+    def close(self):
+        for fp, _ in self._files.values():
+            fp.close()
+
+    def _load(self, column):
+        codes = self._codes.get(column)
+        if codes is not None:
+            return codes
+        path = self.directory / f"{column}.csv"
+        codes = {}
+        if path.exists():
+            with path.open("r", encoding="utf-8", newline="") as fp:
+                for code, value in csv.reader(fp):
+                    codes[value] = int(code)
+        fp = path.open("a", encoding="utf-8", newline="")
+        self._files[column] = (fp, csv.writer(fp))
+        self._codes[column] = codes
+        return codes
+
+
+def _load_manifest(export_dir):
+    manifest = {"runs": 0, "files": {}, "shards": {}, "sqlite_saved_at": 0.0}
+    path = export_dir / MANIFEST_FILENAME
+    if path.exists():
+        manifest.update(json.loads(path.read_text(encoding="utf-8")))
+    return manifest
+
+
+def _save_manifest(export_dir, manifest):
+    path = export_dir / MANIFEST_FILENAME
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+__all__ = [
+    "export_records",
+    "resolve_export_format",
+    "EXPORT_FORMATS",
+    "POST_COLUMNS",
+    "COMMENT_COLUMNS",
+]
@@ -0,0 +1,595 @@
+"""Compiled extraction plans that read a page in one streaming pass.
+
+An :class:`ExtractionPlan` is built once from named :class:`Rule` objects,
+each holding a CSS-like selector and what to keep for the elements it
+matches (attributes, text, ``.string``, the first descendant of a tag).
+Every selector is compiled into compound steps indexed by tag, class and
+attribute name, so one pass over the parser's start/end/data events is enough
+to evaluate all of them. No tree is built.
+
+The events are the ones BeautifulSoup's tree builders consume: lxml's parser
+target interface, or ``html.parser`` callbacks normalized with BeautifulSoup's
+rules for entities, void elements, unmatched end tags and string merging. The
+plan therefore sees the same element nesting and the same strings as a soup
+built with that backend would. The ``html.parser`` events come from a subclass
+of BeautifulSoup's private parser class; :func:`plan_supported` checks on first
+use that it still exists and still agrees with a soup, and callers fall back to
+building a soup when it does not.
+
+Selectors support tag names, ``.class``, ``[attr]`` and ``[attr="value"]``
+compounds joined by descendant combinators, and comma-separated lists.
+"""
+
+import functools
+import logging
+import re
+
+from .constants import LOGGER_NAME
+
+LOGGER = logging.getLogger(LOGGER_NAME)
+
+# BeautifulSoup's HTMLTreeBuilder defaults, copied so the lxml path runs
+# without importing bs4.
+VOID_ELEMENTS = frozenset(
+    (
+        "area",
+        "base",
+        "basefont",
+        "bgsound",
+        "br",
+        "col",
+        "command",
+        "embed",
+        "frame",
+        "hr",
+        "image",
+        "img",
+        "input",
+        "isindex",
+        "keygen",
+        "link",
+        "menuitem",
+        "meta",
+        "nextid",
+        "param",
+        "source",
+        "spacer",
+        "track",
+        "wbr",
+    )
+)
+STRING_CONTAINERS = frozenset(("rp", "rt", "script", "style", "template"))
+PRESERVE_WHITESPACE = frozenset(("pre", "textarea"))
+ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+
+# String kinds: "" is ordinary text, a container name marks text inside a
+# <script>/<style>/... element, the rest are the special strings of a soup.
+MAIN_TEXT = frozenset(("", "cdata"))
+
+_COMPOUND = re.compile(
+    r"""([a-zA-Z][\w-]*)?((?:\.[\w-]+|\[[\w:-]+(?:=(?:"[^"]*"|'[^']*'|[\w-]+))?\])*)$"""
+)
+_PART = re.compile(r"""\.([\w-]+)|\[([\w:-]+)(?:(=)(?:"([^"]*)"|'([^']*)'|([\w-]+)))?\]""")
+_NO_CLASSES = frozenset()
+
+_BEFORE_ROOT, _IN_ROOT, _AFTER_ROOT = range(3)
+
+
+class Compound:
+    """One ``tag.class[attr="value"]`` step of a selector."""
+
+    __slots__ = ("tag", "classes", "attrs")
+
+    def __init__(self, text):
+        match = _COMPOUND.match(text)
+        if not text or match is None:
+            raise ValueError(f"Unsupported selector step {text!r}")
+        self.tag = match.group(1).lower() if match.group(1) else None
+        classes = []
+        attrs = []
+        for part in _PART.finditer(match.group(2)):
+            class_name, attr, has_value, double, single, bare = part.groups()
+            if class_name:
+                classes.append(class_name)
+            else:
+                value = (double or single or bare or "") if has_value else None
+                attrs.append((attr.lower(), value))
+        self.classes = frozenset(classes)
+        self.attrs = tuple(attrs)
+
+    @property
+    def key(self):
+        """The index bucket this step is filed under."""
+        if self.tag is not None:
+            return self.tag
+        if self.classes:
+            return "." + min(self.classes)
+        if self.attrs:
+            return "[" + self.attrs[0][0]
+        return "*"
+
+    def matches(self, name, attrs, classes):
+        if self.tag is not None and self.tag != name:
+            return False
+        if self.classes and not self.classes <= classes:
+            return False
+        for attr, value in self.attrs:
+            actual = attrs.get(attr)
+            if actual is None or (value is not None and actual != value):
+                return False
+        return True
+
+
+def compile_selector(text):
+    """Split a selector list into chains of :class:`Compound`, outermost first."""
+    chains = []
+    for alternative in text.split(","):
+        steps = alternative.split()
+        if not steps:
+            raise ValueError(f"Empty selector in {text!r}")
+        chains.append(tuple(Compound(step) for step in steps))
+    return chains
+
+
+class Rule:
+    """What to keep for each element a selector matches.
+
+    Every match keeps its attributes. ``text`` is the separator of the
+    element's ``get_text`` (``None`` to skip text), with ``strip`` as in
+    BeautifulSoup. ``first`` stops after one match, ``scoped`` restricts
+    matches to the plan's root element (the whole page when it has none),
+    ``child`` keeps the attributes of the first descendant with that tag and
+    ``string`` keeps the element's ``.string``.
+    """
+
+    def __init__(
+        self, selector, text=None, strip=False, first=False, scoped=False, child=None, string=False
+    ):
+        self.selector = selector
+        self.chains = compile_selector(selector)
+        self.text = text
+        self.strip = strip
+        self.first = first
+        self.scoped = scoped
+        self.child = child
+        self.string = string
+
+
+class Match:
+    """One matched element.
+
+    ``position`` numbers elements in document order and ``end`` is the number
+    of the element's last descendant, so ``a.position < b.position <= a.end``
+    when ``b`` is inside ``a``.
+    """
+
+    __slots__ = (
+        "attrs",
+        "in_root",
+        "position",
+        "end",
+        "parts",
+        "kinds",
+        "strip",
+        "child",
+        "node",
+        "text",
+        "string",
+    )
+
+    def __init__(self, attrs, in_root, position):
+        self.attrs = attrs
+        self.in_root = in_root
+        self.position = position
+        self.end = position
+        self.parts = None
+        self.child = None
+        self.node = None
+        self.text = None
+        self.string = None
+
+
+class ExtractionPlan:
+    """Rules compiled into one index of selector steps.
+
+    ``run`` returns, for each rule name, the list of :class:`Match` objects
+    in document order.
+    """
+
+    def __init__(self, rules, root=None):
+        self.rules = list(rules.items())
+        self.chains = []
+        for index, (_, rule) in enumerate(self.rules):
+            self.chains.extend((index, chain) for chain in rule.chains)
+        if root:
+            self.chains.extend((None, chain) for chain in compile_selector(root))
+        self.index = {}
+        for chain_id, (_, chain) in enumerate(self.chains):
+            for level, step in enumerate(chain):
+                self.index.setdefault(step.key, []).append((chain_id, level, step))
+        self.children = {rule.child for _, rule in self.rules if rule.child}
+
+    def run(self, html, backend="html.parser"):
+        if html[:1] == "﻿":
+            html = html[1:]
+        run = _PlanRun(self)
+        if backend == "lxml":
+            etree = _lxml_etree()
+            if etree is None:
+                raise RuntimeError("The lxml backend needs lxml installed")
+            parser = etree.HTMLParser(target=_LxmlTarget(run), recover=True)
+            parser.feed(html)
+            parser.close()
+        else:
+            if not plan_supported(backend):
+                raise RuntimeError("This bs4 release's html.parser builder is not supported")
+            parser = _soup_event_parser_class()(run)
+            parser.feed(html)
+            parser.close()
+        return run.finish()
+
+
+class _Frame:
+    __slots__ = (
+        "name",
+        "steps",
+        "matches",
+        "texts",
+        "watchers",
+        "container",
+        "preserve",
+        "node",
+        "root",
+    )
+
+    def __init__(self, name):
+        self.name = name
+        self.steps = None
+        self.matches = None
+        self.texts = 0
+        self.watchers = 0
+        self.container = name in STRING_CONTAINERS
+        self.preserve = name in PRESERVE_WHITESPACE
+        self.node = None
+        self.root = False
+
+
+class _PlanRun:
+    """The state of one plan over one document: open elements and partial matches."""
+
+    def __init__(self, plan):
+        self.plan = plan
+        self.results = [[] for _ in plan.rules]
+        self.progress = [[0] * len(chain) for _, chain in plan.chains]
+        self.stack = []
+        self.open_names = {}
+        self.pending = []
+        self.texts = []
+        self.watchers = []
+        self.containers = []
+        self.preserving = 0
+        self.elements = 0
+        self.root = _BEFORE_ROOT
+        self.contains_replacement_characters = False
+
+    def start(self, name, attrs):
+        self.flush()
+        self.elements += 1
+        plan = self.plan
+        if self.watchers and name in plan.children:
+            for match, tag in self.watchers:
+                if tag == name and match.child is None:
+                    match.child = attrs
+        classes = frozenset(attrs["class"].split()) if "class" in attrs else _NO_CLASSES
+        candidates = plan.index.get(name, ())
+        if "*" in plan.index:
+            candidates = [*candidates, *plan.index["*"]]
+        for class_name in classes:
+            if "." + class_name in plan.index:
+                candidates = [*candidates, *plan.index["." + class_name]]
+        for attr in attrs:
+            if "[" + attr in plan.index:
+                candidates = [*candidates, *plan.index["[" + attr]]
+        frame = _Frame(name)
+        steps = []
+        matched = []
+        progress = self.progress
+        for chain_id, level, step in candidates:
+            if level and not progress[chain_id][level - 1]:
+                continue
+            if step.matches(name, attrs, classes):
+                steps.append((chain_id, level))
+                rule_index = plan.chains[chain_id][0]
+                if level == len(plan.chains[chain_id][1]) - 1 and rule_index not in matched:
+                    matched.append(rule_index)
+        in_root = self.root == _IN_ROOT
+        parent = self.stack[-1].node if self.stack else None
+        if parent is not None:
+            frame.node = []
+            parent.append(frame.node)
+        for rule_index in matched:
+            if rule_index is None:
+                if self.root == _BEFORE_ROOT:
+                    frame.root = True
+                continue
+            self._add_match(rule_index, frame, attrs, in_root)
+        if steps:
+            for chain_id, level in steps:
+                progress[chain_id][level] += 1
+            frame.steps = steps
+        if frame.root:
+            self.root = _IN_ROOT
+        if frame.container:
+            self.containers.append(name)
+        if frame.preserve:
+            self.preserving += 1
+        self.stack.append(frame)
+        self.open_names[name] = self.open_names.get(name, 0) + 1
+
+    def _add_match(self, rule_index, frame, attrs, in_root):
+        name, rule = self.plan.rules[rule_index]
+        results = self.results[rule_index]
+        if (rule.first and results) or (rule.scoped and self.root == _AFTER_ROOT and not in_root):
+            return
+        match = Match(attrs, in_root, self.elements)
+        results.append(match)
+        if frame.matches is None:
+            frame.matches = []
+        frame.matches.append(match)
+        if rule.text is not None:
+            match.parts = []
+            match.kinds = frozenset((frame.name,)) if frame.container else MAIN_TEXT
+            match.strip = rule.strip
+            self.texts.append(match)
+            frame.texts += 1
+        if rule.child:
+            self.watchers.append((match, rule.child))
+            frame.watchers += 1
+        if rule.string:
+            if frame.node is None:
+                frame.node = []
+            match.node = frame.node
+
+    def end(self, name):
+        self.flush()
+        if not self.open_names.get(name):
+            return
+        while self.stack:
+            frame = self._pop()
+            if frame.name == name:
+                return
+
+    def _pop(self):
+        frame = self.stack.pop()
+        self.open_names[frame.name] -= 1
+        if frame.matches:
+            for match in frame.matches:
+                match.end = self.elements
+        if frame.steps:
+            progress = self.progress
+            for chain_id, level in frame.steps:
+                progress[chain_id][level] -= 1
+        if frame.texts:
+            del self.texts[-frame.texts :]
+        if frame.watchers:
+            del self.watchers[-frame.watchers :]
+        if frame.container:
+            self.containers.pop()
+        if frame.preserve:
+            self.preserving -= 1
+        if frame.root:
+            self.root = _AFTER_ROOT
+        return frame
+
+    def data(self, text):
+        self.pending.append(text)
+
+    def special(self, text, kind):
+        """A comment, doctype, CDATA block or the like: its own string of ``kind``."""
+        self.flush()
+        self.pending.append(text)
+        self.flush(kind)
+
+    def flush(self, kind=None):
+        if not self.pending:
+            return
+        text = "".join(self.pending)
+        self.pending.clear()
+        if not self.preserving and not text.strip(ASCII_SPACES):
+            text = "\n" if "\n" in text else " "
+        if kind is None:
+            kind = self.containers[-1] if self.containers else ""
+        if self.stack and self.stack[-1].node is not None:
+            self.stack[-1].node.append(text)
+        if self.texts:
+            stripped = None
+            for match in self.texts:
+                if kind not in match.kinds:
+                    continue
+                if not match.strip:
+                    match.parts.append(text)
+                    continue
+                if stripped is None:
+                    stripped = text.strip()
+                if stripped:
+                    match.parts.append(stripped)
+
+    def finish(self):
+        self.flush()
+        while self.stack:
+            self._pop()
+        output = {}
+        for (name, rule), matches in zip(self.plan.rules, self.results):
+            if rule.scoped and self.root != _BEFORE_ROOT:
+                matches = [match for match in matches if match.in_root]
+            for match in matches:
+                if match.parts is not None:
+                    match.text = rule.text.join(match.parts)
+                    match.parts = None
+                if match.node is not None:
+                    match.string = _string_of(match.node)
+                    match.node = None
+            output[name] = matches
+        return output
+
+
+def _string_of(node):
+    """``Tag.string``: the only child string, looking through single-child tags."""
+    while len(node) == 1:
+        child = node[0]
+        if isinstance(child, str):
+            return child
+        node = child
+    return None
+
+
+# Entities, void and self-closed tags, an unmatched end tag and a comment:
+# what _SoupEvents relies on BeautifulSoup's parser class for.
+_PROBE = (
+    '<div id="a&amp;b"><p>x &amp; y&#39;s&nbsp;z &copy; &#x41;<br>w<img src="i"/>'
+    "</span><!-- c --></p><script>1 < 2</script></div>"
+)
+
+
+def plan_supported(backend):
+    """Whether :meth:`ExtractionPlan.run` can read pages with ``backend``."""
+    if backend == "lxml":
+        return _lxml_etree() is not None
+    return _soup_event_parser_class() is not None
+
+
+@functools.lru_cache(maxsize=None)
+def _lxml_etree():
+    # Imported on first use so that loading the package (and the CLI) stays cheap.
+    try:
+        from lxml import etree
+    except ImportError:  # pragma: no cover - optional dependency
+        return None
+    return etree
+
+
+@functools.lru_cache(maxsize=None)
+def _soup_event_parser_class():
+    try:
+        from bs4 import BeautifulSoup
+        from bs4.builder._htmlparser import BeautifulSoupHTMLParser
+
+        parser_class = type("SoupEventParser", (_SoupEvents, BeautifulSoupHTMLParser), {})
+        recorder = _EventRecorder()
+        parser = parser_class(recorder)
+        parser.feed(_PROBE)
+        parser.close()
+        soup = BeautifulSoup(_PROBE, "html.parser")
+        expected = (
+            [(tag.name, tag.attrs) for tag in soup.find_all(True)],
+            "".join(soup.find_all(string=True)),
+        )
+    except Exception as exc:
+        LOGGER.warning("Extraction plans are off for html.parser (%s); building soups", exc)
+        return None
+    if (recorder.tags, "".join(recorder.strings)) != expected:
+        LOGGER.warning("Extraction plans are off for html.parser: bs4's events changed")
+        return None
+    return parser_class
+
+
+class _EventRecorder:
+    """Stand-in plan run for the probe: records start tags and strings."""
+
+    def __init__(self):
+        self.tags = []
+        self.strings = []
+
+    def start(self, tag, attrs):
+        self.tags.append((tag, attrs))
+
+    def end(self, tag):
+        pass
+
+    def data(self, text):
+        self.strings.append(text)
+
+    def special(self, text, kind):
+        self.strings.append(text)
+
+
+class _SoupEvents:
+    """``html.parser`` events normalized the way BeautifulSoup's builder does.
+
+    Mixed into BeautifulSoup's own parser class, imported on first use, whose
+    handlers resolve character and entity references; everything else is
+    forwarded to the plan run.
+    """
+
+    def __init__(self, run):
+        from html.parser import HTMLParser
+
+        HTMLParser.__init__(self, convert_charrefs=False)
+        self.run = run
+        self.soup = run
+        self.already_closed_empty_element = []
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs, handle_empty_element=False)
+        self.handle_endtag(tag, check_already_closed=False)
+
+    def handle_starttag(self, tag, attrs, handle_empty_element=True):
+        self.run.start(tag, {key: "" if value is None else value for key, value in attrs})
+        if handle_empty_element and tag in VOID_ELEMENTS:
+            self.handle_endtag(tag, check_already_closed=False)
+            self.already_closed_empty_element.append(tag)
+
+    def handle_endtag(self, tag, check_already_closed=True):
+        if check_already_closed and tag in self.already_closed_empty_element:
+            self.already_closed_empty_element.remove(tag)
+        else:
+            self.run.end(tag)
+
+    def handle_data(self, data):
+        self.run.data(data)
+
+    def handle_comment(self, data):
+        self.run.special(data, "comment")
+
+    def handle_decl(self, decl):
+        self.run.special(decl[len("DOCTYPE ") :], "doctype")
+
+    def unknown_decl(self, data):
+        if data.upper().startswith("CDATA["):
+            self.run.special(data[len("CDATA[") :], "cdata")
+        else:
+            self.run.special(data, "declaration")
+
+    def handle_pi(self, data):
+        self.run.special(data, "pi")
+
+
+class _LxmlTarget:
+    """lxml parser target forwarding events the way BeautifulSoup's lxml builder does."""
+
+    def __init__(self, run):
+        self.run = run
+
+    def start(self, tag, attrib, nsmap=None):
+        self.run.start(tag, dict(attrib))
+
+    def end(self, tag):
+        self.run.end(tag)
+
+    def data(self, content):
+        self.run.data(content)
+
+    def comment(self, text):
+        self.run.special(text, "comment")
+
+    def doctype(self, name, pubid, system):
+        self.run.special(name or "", "doctype")
+
+    def pi(self, target, data):
+        self.run.special(f"{target} {data}", "pi")
+
+    def close(self):
+        return None
+
+
+__all__ = ["ExtractionPlan", "Rule", "Match", "Compound", "compile_selector", "plan_supported"]
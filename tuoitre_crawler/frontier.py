@@ -0,0 +1,310 @@
+"""Priority frontier deciding which discovered article to fetch next.
+
+Discovery adds candidates per category together with what the listing, feed
+or sitemap said about them. Each candidate gets a fixed score from three
+signals:
+
+* recency: the publish time from the listing, sitemap or feed, or else the
+  timestamp tuoitre post IDs begin with, halving every ``half_life`` seconds;
+* position: the candidate's rank in its category, first listing page first;
+* comments: the comment count shown on the listing, saturating at
+  ``comment_target``.
+
+Every category keeps its own heap. ``take`` serves the category whose best
+candidate plus its quota deficit (weighted by ``quota``) is highest or, when
+``fair``, the category furthest from its quota. A category is no longer served
+once its saved and in-flight posts reach the target, and opens again if an
+in-flight post is not saved. A :class:`CrawlBudget` stops the handing out of
+work; posts already in flight finish, so a run can overshoot a request budget
+by the requests of those posts.
+"""
+
+import datetime
+import heapq
+import itertools
+import math
+import re
+import threading
+import time
+
+from .discovery import parse_date
+
+FIFO = "fifo"
+PRIORITY = "priority"
+FRONTIER_MODES = (FIFO, PRIORITY)
+
+DEFAULT_WEIGHTS = {"quota": 4.0, "recency": 2.0, "position": 1.0, "comments": 3.0}
+RECENCY_HALF_LIFE = 24 * 3600
+# Candidates per listing page, the unit the position signal decays over.
+POSITION_SCALE = 20
+SITE_TIMEZONE = datetime.timezone(datetime.timedelta(hours=7))
+POST_ID_TIME = re.compile(r"(\d{14})\d*\D*$")
+
+
+def published_at(value=None, url=None):
+    """Epoch seconds for a listing or feed date, else for the post ID in ``url``.
+
+    ``value`` may be a string or a datetime; naive times are site-local. Post
+    IDs such as ``20240528093512345`` start with their publish time.
+    """
+    moment = parse_date(value) if isinstance(value, str) else value
+    if moment is None and url:
+        match = POST_ID_TIME.search(url)
+        if match:
+            try:
+                moment = datetime.datetime.strptime(match.group(1), "%Y%m%d%H%M%S")
+            except ValueError:
+                moment = None
+    if moment is None:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=SITE_TIMEZONE)
+    return moment.timestamp()
+
+
+class CrawlBudget:
+    """Request and wall-clock limits for one run (0 disables a limit).
+
+    ``requests`` returns the number of requests made so far; the clock starts
+    when :meth:`start` is called.
+    """
+
+    def __init__(self, max_requests=0, max_seconds=0, requests=None, clock=time.monotonic):
+        self.max_requests = max_requests
+        self.max_seconds = max_seconds
+        self._requests = requests or (lambda: 0)
+        self._clock = clock
+        self._first_request = 0
+        self.started = clock()
+
+    def __bool__(self):
+        return bool(self.max_requests or self.max_seconds)
+
+    def start(self):
+        self._first_request = self._requests()
+        self.started = self._clock()
+        return self
+
+    def used(self):
+        return self._requests() - self._first_request
+
+    def elapsed(self):
+        return self._clock() - self.started
+
+    def exhausted(self):
+        if self.max_requests and self.used() >= self.max_requests:
+            return True
+        return bool(self.max_seconds) and self.elapsed() >= self.max_seconds
+
+    def snapshot(self):
+        return {
+            "requests": self.used(),
+            "max_requests": self.max_requests,
+            "seconds": round(self.elapsed(), 3),
+            "max_seconds": self.max_seconds,
+            "exhausted": self.exhausted(),
+        }
+
+
+class Candidate:
+    __slots__ = ("url", "category", "slug", "position", "published", "comments", "score")
+
+    def __init__(self, url, category, slug, position, published, comments):
+        self.url = url
+        self.category = category
+        self.slug = slug
+        self.position = position
+        self.published = published
+        self.comments = comments
+        self.score = 0.0
+
+
+class _Category:
+    def __init__(self, slug, target):
+        self.slug = slug
+        self.target = max(1, target)
+        self.heap = []
+        self.added = 0
+        self.dispatched = 0
+        self.in_flight = 0
+        self.saved = 0
+        self.closed = False
+
+    @property
+    def claimed(self):
+        return self.saved + self.in_flight
+
+    def open(self):
+        return bool(self.heap) and self.claimed < self.target
+
+    def finished(self):
+        return self.saved >= self.target or (self.closed and not self.heap)
+
+
+class Frontier:
+    """Thread-safe priority queue of article URLs across categories."""
+
+    def __init__(
+        self,
+        target,
+        weights=None,
+        fair=False,
+        budget=None,
+        comment_target=20,
+        half_life=RECENCY_HALF_LIFE,
+        clock=time.time,
+    ):
+        self.target = target
+        self.weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        self.fair = fair
+        self.budget = budget
+        self.comment_target = max(1, comment_target)
+        self.half_life = half_life
+        self._clock = clock
+        self._changed = threading.Condition()
+        self._categories = {}
+        self._urls = set()
+        self._order = itertools.count()
+        self._stopped = False
+        self.stats = {"candidates": 0, "duplicates": 0, "dispatched": 0, "saved": 0, "dropped": 0}
+
+    def add_category(self, key, slug, target=None):
+        with self._changed:
+            self._categories[key] = _Category(slug, self.target if target is None else target)
+
+    def add(self, key, url, published=None, comments=None, slug=None):
+        """Queue ``url`` for category ``key``; returns False for a URL already queued."""
+        with self._changed:
+            if url in self._urls:
+                self.stats["duplicates"] += 1
+                return False
+            self._urls.add(url)
+            category = self._categories[key]
+            candidate = Candidate(
+                url,
+                key,
+                slug or category.slug,
+                category.added,
+                published_at(published, url),
+                comments,
+            )
+            candidate.score = self.score(candidate)
+            category.added += 1
+            heapq.heappush(category.heap, (-candidate.score, next(self._order), candidate))
+            self.stats["candidates"] += 1
+            self._changed.notify()
+            return True
+
+    def score(self, candidate):
+        weights = self.weights
+        score = weights["position"] / (1 + candidate.position / POSITION_SCALE)
+        if candidate.published is not None:
+            age = max(0.0, self._clock() - candidate.published)
+            score += weights["recency"] * 0.5 ** (age / self.half_life)
+        if candidate.comments:
+            saturation = math.log1p(candidate.comments) / math.log1p(self.comment_target)
+            score += weights["comments"] * min(1.0, saturation)
+        return score
+
+    def wants(self, key):
+        """Whether discovery for ``key`` is still useful."""
+        with self._changed:
+            if self.budget and self.budget.exhausted():
+                return False
+            return self._categories[key].saved < self._categories[key].target
+
+    def close(self, key):
+        """No more candidates will be added for ``key``."""
+        with self._changed:
+            self._categories[key].closed = True
+            self._changed.notify_all()
+
+    def take(self):
+        """Block until a candidate is due; ``None`` once there is no more work."""
+        with self._changed:
+            while True:
+                if self._stopped or (self.budget and self.budget.exhausted()):
+                    self._changed.notify_all()
+                    return None
+                category = self._pick()
+                if category is not None:
+                    _, _, candidate = heapq.heappop(category.heap)
+                    category.in_flight += 1
+                    category.dispatched += 1
+                    self.stats["dispatched"] += 1
+                    return candidate
+                if self._finished():
+                    self._changed.notify_all()
+                    return None
+                # Time out now and then so a time budget can end an idle wait.
+                self._changed.wait(timeout=1.0)
+
+    def stop(self):
+        """Make every ``take`` return ``None`` from now on."""
+        with self._changed:
+            self._stopped = True
+            self._changed.notify_all()
+
+    def done(self, candidate, saved):
+        with self._changed:
+            category = self._categories[candidate.category]
+            category.in_flight -= 1
+            if saved:
+                category.saved += 1
+                self.stats["saved"] += 1
+            else:
+                self.stats["dropped"] += 1
+            self._changed.notify_all()
+
+    def queued(self):
+        with self._changed:
+            return sum(len(category.heap) for category in self._categories.values())
+
+    def snapshot(self):
+        with self._changed:
+            return {
+                **self.stats,
+                "unused": sum(len(category.heap) for category in self._categories.values()),
+                "categories": {
+                    key: {
+                        "candidates": category.added,
+                        "dispatched": category.dispatched,
+                        "saved": category.saved,
+                        "target": category.target,
+                    }
+                    for key, category in self._categories.items()
+                },
+            }
+
+    def _pick(self):
+        best = None
+        best_key = None
+        for category in self._categories.values():
+            if not category.open():
+                continue
+            progress = category.claimed / category.target
+            top = -category.heap[0][0]
+            if self.fair:
+                key = (-progress, top)
+            else:
+                key = (top + self.weights["quota"] * (1 - progress),)
+            if best_key is None or key > best_key:
+                best, best_key = category, key
+        return best
+
+    def _finished(self):
+        if any(category.in_flight for category in self._categories.values()):
+            return False
+        return all(category.finished() for category in self._categories.values())
+
+
+__all__ = [
+    "FIFO",
+    "PRIORITY",
+    "FRONTIER_MODES",
+    "DEFAULT_WEIGHTS",
+    "CrawlBudget",
+    "Candidate",
+    "Frontier",
+    "published_at",
+]
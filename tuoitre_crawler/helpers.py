@@ -1,8 +1,12 @@
 from pathlib import Path
-from urllib.parse import urljoin, urlparse
+from urllib.parse import parse_qsl, urlencode, urljoin, urlparse, urlunparse
 
 from .constants import BASE_DOMAIN
 
+# Query parameters that only track where a click came from.
+TRACKING_PARAMS = {"fbclid", "gclid", "zarsrc", "gidzl", "_gl", "ref", "autoplay"}
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
 
 def filename_from_url(url):
     path = urlparse(url).path
@@ -14,4 +18,25 @@ def absolutize(url):
     return urljoin(BASE_DOMAIN, url)
 
 
-__all__ = ["filename_from_url", "absolutize"]
+def canonicalize_url(url):
+    """Absolute URL with tracking parameters, fragments and host variants removed.
+
+    Two links to the same article (a listing link, its audio-autoplay twin,
+    a shared link with ``utm_*`` parameters) map to the same string.
+    """
+    parsed = urlparse(absolutize(url.strip()))
+    scheme = parsed.scheme.lower()
+    host = (parsed.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if parsed.port and parsed.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parsed.port}"
+    query = sorted(
+        (name, value)
+        for name, value in parse_qsl(parsed.query, keep_blank_values=True)
+        if name.lower() not in TRACKING_PARAMS and not name.lower().startswith("utm_")
+    )
+    return urlunparse((scheme, host, parsed.path or "/", "", urlencode(query), ""))
+
+
+__all__ = ["filename_from_url", "absolutize", "canonicalize_url"]
@@ -4,20 +4,83 @@ import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util import Retry
 
+from .cache import CachingAdapter
+from .connections import Http2Adapter, instrument_adapter
 from .constants import USER_AGENTS
 
 
-def build_session():
+class ObservedRetry(Retry):
+    """``Retry`` that reports every retried attempt to ``observer``.
+
+    ``observer(host, status, retry_after)`` is called before urllib3 backs
+    off, with ``status`` set to ``"error"`` for connection failures.
+    """
+
+    def __init__(self, *args, observer=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.observer = observer
+
+    def new(self, **kwargs):
+        retry = super().new(**kwargs)
+        retry.observer = self.observer
+        return retry
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        if self.observer is not None:
+            host = getattr(_pool, "host", None)
+            if response is not None:
+                self.observer(host, response.status, response.headers.get("Retry-After"))
+            else:
+                self.observer(host, "error", None)
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+
+def build_session(
+    cache=None,
+    retry_observer=None,
+    pool_sizes=None,
+    default_pool_size=10,
+    stats=None,
+    http2=False,
+):
+    """Session with retries, one connection pool per host and optional HTTP/2.
+
+    ``pool_sizes`` maps a host (``host[:port]``) to the number of connections kept alive for it
+    and should match the number of threads that can hit that host at once;
+    each listed host gets its own adapter so one busy host cannot evict
+    another's connections. Every other host (the media CDNs) shares an
+    adapter holding ``default_pool_size`` connections per host. ``stats`` is
+    a :class:`~tuoitre_crawler.connections.ConnectionStats` that receives
+    request, connection and connect-time counts. With ``http2`` all hosts go
+    through a single multiplexing ``httpx`` client instead.
+    """
     session = requests.Session()
-    retry = Retry(
-        total=5,
-        backoff_factor=0.6,
-        status_forcelist=[429, 500, 502, 503, 504],
-        allowed_methods=("GET", "HEAD"),
-    )
-    adapter = HTTPAdapter(max_retries=retry)
-    session.mount("https://", adapter)
-    session.mount("http://", adapter)
+    if http2:
+        transport = Http2Adapter(
+            max_connections=sum((pool_sizes or {}).values()) + default_pool_size,
+            observer=retry_observer,
+            stats=stats,
+        )
+        adapter = CachingAdapter(cache, transport=transport) if cache is not None else transport
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+    else:
+        retry = ObservedRetry(
+            total=5,
+            backoff_factor=0.6,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=("GET", "HEAD"),
+            observer=retry_observer,
+        )
+        default = _pooled_adapter(
+            cache, retry, stats, pool_connections=16, pool_maxsize=default_pool_size
+        )
+        session.mount("https://", default)
+        session.mount("http://", default)
+        for host, size in (pool_sizes or {}).items():
+            adapter = _pooled_adapter(cache, retry, stats, pool_connections=1, pool_maxsize=size)
+            session.mount(f"https://{host}/", adapter)
+            session.mount(f"http://{host}/", adapter)
     session.headers.update(
         {
             "User-Agent": random.choice(USER_AGENTS),
@@ -28,4 +91,22 @@ def build_session():
     return session
 
 
-__all__ = ["build_session"]
+def _pooled_adapter(cache, retry, stats, pool_connections, pool_maxsize):
+    pool_maxsize = max(1, int(pool_maxsize))
+    if cache is not None:
+        adapter = CachingAdapter(
+            cache,
+            max_retries=retry,
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+        )
+    else:
+        adapter = HTTPAdapter(
+            max_retries=retry, pool_connections=pool_connections, pool_maxsize=pool_maxsize
+        )
+    if stats is not None:
+        instrument_adapter(adapter, stats)
+    return adapter
+
+
+__all__ = ["build_session", "ObservedRetry"]
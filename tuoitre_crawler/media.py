@@ -0,0 +1,517 @@
+"""Background media download stage with URL dedup and a content-addressed store.
+
+Every media write goes through :class:`PartialDownload`: bytes land in a
+``.part`` file that is renamed into place only once its length and any
+digest header check out, and a part left by a dropped connection or a
+killed run is resumed with a ``Range`` request instead of starting over.
+"""
+
+import base64
+import binascii
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from pathlib import Path
+
+from .constants import LOGGER_NAME
+from .helpers import filename_from_url
+from .ratelimit import TokenBucket
+
+try:  # pragma: no cover - platform dependent
+    import fcntl
+except ImportError:  # pragma: no cover - platform dependent
+    fcntl = None
+
+LOGGER = logging.getLogger(LOGGER_NAME)
+
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 1024 * 1024
+DEFAULT_CHUNK_SIZE = 256 * 1024
+PART_SUFFIX = ".part"
+MEDIA_HEADERS = {"Accept-Encoding": "identity"}
+
+
+class MediaDownloader:
+    """Download media on a dedicated pool, once per URL.
+
+    Each URL is fetched a single time per downloader into ``store_dir`` under
+    its SHA-256 digest; every destination that references it is then
+    hard-linked (or copied, across filesystems) to that blob. ``fetch`` is a
+    ``safe_get``-style callable returning a streamed response or ``None``.
+    ``byte_rate`` caps download throughput in bytes per second (0 disables).
+    ``lookup`` may map a URL to a blob fetched by an earlier run. ``head``, a
+    ``safe_get``-style HEAD callable, lets a destination that already holds a
+    file of the advertised length be adopted into the store without
+    downloading it again. Futures returned by ``submit`` resolve to the blob
+    path, or ``None`` on failure. Download times and bytes are reported to
+    ``metrics`` when given.
+    """
+
+    def __init__(
+        self,
+        fetch,
+        store_dir,
+        workers=4,
+        byte_rate=0,
+        lookup=None,
+        metrics=None,
+        head=None,
+    ):
+        self.fetch = fetch
+        self.head = head
+        self.lookup = lookup
+        self.metrics = metrics
+        self.store_dir = Path(store_dir)
+        self.byte_rate = byte_rate
+        self.byte_limiter = TokenBucket(byte_rate, burst=max(byte_rate, MAX_CHUNK_SIZE))
+        self._pool = ThreadPoolExecutor(
+            max_workers=max(1, workers), thread_name_prefix="media"
+        )
+        self._lock = threading.Lock()
+        self._blobs = {}
+        self._pending = set()
+        self.stats = {
+            "requested": 0,
+            "downloaded": 0,
+            "deduplicated": 0,
+            "reused": 0,
+            "verified": 0,
+            "resumed": 0,
+            "failed": 0,
+        }
+
+    def submit(self, url, dest):
+        result = Future()
+        blob = self._blob_future(url, dest)
+
+        def finish(done):
+            path = None
+            try:
+                path = done.result()
+                ok = path is not None and self._link(path, dest)
+            except Exception as exc:  # pragma: no cover - logging path
+                LOGGER.warning("Media download failed for %s: %s", url, exc)
+                ok = False
+            if not ok:
+                with self._lock:
+                    self.stats["failed"] += 1
+            result.set_result(path if ok else None)
+            with self._lock:
+                self._pending.discard(result)
+
+        with self._lock:
+            self._pending.add(result)
+        blob.add_done_callback(finish)
+        return result
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def drain(self):
+        while True:
+            with self._lock:
+                pending = list(self._pending)
+            if not pending:
+                return
+            wait(pending)
+
+    def close(self):
+        self.drain()
+        self._pool.shutdown(wait=True)
+
+    def _blob_future(self, url, dest):
+        with self._lock:
+            self.stats["requested"] += 1
+            future = self._blobs.get(url)
+            if future is not None and not _failed(future):
+                self.stats["deduplicated"] += 1
+                return future
+            future = self._pool.submit(self._fetch_blob, url, dest)
+            self._blobs[url] = future
+            return future
+
+    def _fetch_blob(self, url, dest):
+        known = self.lookup(url) if self.lookup is not None else None
+        if known and Path(known).exists():
+            with self._lock:
+                self.stats["reused"] += 1
+            return Path(known)
+        if self.head is not None and is_current(self.head, url, dest):
+            blob = self._store(Path(dest), url, _file_digest(dest), adopt=True)
+            with self._lock:
+                self.stats["verified"] += 1
+            return blob
+        started = time.monotonic()
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        part = self.store_dir / "tmp" / f"{key}{PART_SUFFIX}"
+        partial = download(self.fetch, url, part, self.byte_limiter, self.byte_rate)
+        if partial is None:
+            return None
+        blob = self._store(partial.part, url, partial.sha256)
+        if self.metrics is not None:
+            self.metrics.observe("media.download", time.monotonic() - started)
+            self.metrics.add_bytes("media", partial.fetched)
+        with self._lock:
+            self.stats["downloaded"] += 1
+            self.stats["resumed"] += partial.resumed
+        return blob
+
+    def _store(self, path, url, digest, adopt=False):
+        """Move (or, with ``adopt``, link) a verified file to its content address."""
+        suffix = Path(filename_from_url(url) or "").suffix
+        blob = self.store_dir / digest[:2] / f"{digest}{suffix}"
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        if blob.exists():
+            if not adopt:
+                path.unlink()
+        elif adopt:
+            try:
+                os.link(path, blob)
+            except OSError:
+                shutil.copyfile(path, blob)
+        else:
+            os.replace(path, blob)
+        return blob
+
+    @staticmethod
+    def _link(blob, dest):
+        dest = Path(dest)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        if dest.exists():
+            if os.path.samefile(blob, dest):
+                return True
+            dest.unlink()
+        try:
+            os.link(blob, dest)
+        except OSError:
+            shutil.copyfile(blob, dest)
+        return True
+
+
+class PartialDownload:
+    """A resumable download of ``url`` into the file ``part``.
+
+    The response's validator (a strong ETag or Last-Modified), its length and
+    any digests it announced are kept next to the part in ``<part>.json``,
+    so a later attempt can ask for just the missing bytes with
+    ``Range``/``If-Range``. A server that ignores the range, or whose file
+    changed since, answers 200 and the part is rewritten from the start.
+    ``finish`` compares the byte count with the announced length and the
+    ``Digest``/``Repr-Digest``/``Content-MD5`` headers, then exposes the
+    SHA-256 of the whole file as ``sha256``.
+    """
+
+    def __init__(self, url, part):
+        self.url = url
+        self.part = Path(part)
+        self.meta_path = self.part.with_name(self.part.name + ".json")
+        self.offset = 0
+        self.size = 0
+        self.length = None
+        self.validator = None
+        self.expected = {}
+        self.resumed = False
+        self.sha256 = None
+        self._hashes = {}
+        self._handle = None
+        meta = self._load_meta()
+        if meta.get("url") == url and meta.get("validator") and self.part.exists():
+            self.offset = self.part.stat().st_size
+            self.validator = meta["validator"]
+            self.length = meta.get("length")
+            self.expected = meta.get("expected", {})
+
+    @property
+    def fetched(self):
+        """Bytes received by this attempt, excluding a resumed prefix."""
+        return self.size - self.offset if self.resumed else self.size
+
+    @property
+    def complete(self):
+        """Whether an earlier attempt already received every byte."""
+        return bool(self.offset) and self.offset == self.length
+
+    def request_headers(self):
+        headers = dict(MEDIA_HEADERS)
+        if self.offset:
+            headers["Range"] = f"bytes={self.offset}-"
+            headers["If-Range"] = self.validator
+        return headers
+
+    def start(self, status, headers, byte_rate=0):
+        """Open the part for a response body and return the read size to use.
+
+        Raises ``BlockingIOError`` if another process is writing the same part
+        and ``ValueError`` for a partial body that does not continue it.
+        """
+        self.part.parent.mkdir(parents=True, exist_ok=True)
+        first, total = (None, None)
+        if status == 206:
+            first, total = _content_range(headers.get("Content-Range"))
+            if not self.offset or first != self.offset:
+                raise ValueError(f"Unexpected Content-Range {headers.get('Content-Range')!r}")
+        self.resumed = status == 206
+        if self.resumed:
+            self.length = total if total is not None else self.length
+        else:
+            self.offset = 0
+            self.length = _int_header(headers.get("Content-Length"))
+            self.expected = _announced_digests(headers, whole_body=status == 200)
+            self.validator = _validator(headers)
+        handle = self.part.open("ab")
+        if fcntl is not None:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                handle.close()
+                raise BlockingIOError(f"{self.part} is being written by another process")
+        if not self.resumed:
+            handle.truncate(0)
+        self._handle = handle
+        self._hashes = {name: hashlib.new(name) for name in {"sha256", *self.expected}}
+        self.size = 0
+        if self.resumed:
+            self._hash_existing()
+        self._save_meta()
+        remaining = self.length - self.size if self.length is not None else None
+        return chunk_size_for(remaining, byte_rate)
+
+    def write(self, chunk):
+        self._handle.write(chunk)
+        for digest in self._hashes.values():
+            digest.update(chunk)
+        self.size += len(chunk)
+
+    def finish(self):
+        """Close the part; True if it holds the whole, intact file.
+
+        A short part is kept for the next attempt; a long or corrupt one is
+        deleted.
+        """
+        if self._handle is None:
+            # Only called for a part that already arrived whole on a previous run.
+            self._hashes = {name: hashlib.new(name) for name in {"sha256", *self.expected}}
+            self.size = 0
+            self._hash_existing()
+        else:
+            self._handle.close()
+            self._handle = None
+        if self.length is not None and self.size < self.length:
+            LOGGER.warning(
+                "Media body for %s ended after %s of %s bytes", self.url, self.size, self.length
+            )
+            return False
+        problem = None
+        if self.length is not None and self.size != self.length:
+            problem = f"{self.size} bytes instead of {self.length}"
+        for name, expected in self.expected.items():
+            if self._hashes[name].hexdigest() != expected:
+                problem = f"{name} mismatch"
+        if problem:
+            LOGGER.warning("Discarding media from %s: %s", self.url, problem)
+            self.discard()
+            return False
+        self.sha256 = self._hashes["sha256"].hexdigest()
+        if self.meta_path.exists():
+            self.meta_path.unlink()
+        return True
+
+    def abort(self):
+        """Close the part after a broken transfer, keeping it if it can be resumed."""
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+        if not self.validator:
+            self.discard()
+
+    def discard(self):
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+        for path in (self.part, self.meta_path):
+            if path.exists():
+                path.unlink()
+
+    def _hash_existing(self):
+        with self.part.open("rb") as handle:
+            for block in iter(lambda: handle.read(MAX_CHUNK_SIZE), b""):
+                for digest in self._hashes.values():
+                    digest.update(block)
+                self.size += len(block)
+
+    def _load_meta(self):
+        try:
+            return json.loads(self.meta_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def _save_meta(self):
+        meta = {
+            "url": self.url,
+            "validator": self.validator,
+            "length": self.length,
+            "expected": self.expected,
+        }
+        self.meta_path.write_text(json.dumps(meta), encoding="utf-8")
+
+
+def download(fetch, url, part, byte_limiter=None, byte_rate=0):
+    """Fetch ``url`` into ``part`` with ``fetch``, a ``safe_get``-style callable.
+
+    Returns the finished :class:`PartialDownload`, or ``None`` if the file is
+    not complete yet; a part that can be resumed is left behind for the next
+    attempt. If another process holds the part, this attempt writes to its
+    own part and cannot be resumed.
+    """
+    partial = PartialDownload(url, part)
+    if partial.complete:
+        return partial if partial.finish() else None
+    response = fetch(url, stream=True, headers=partial.request_headers())
+    if not response:
+        return None
+    private = False
+    try:
+        try:
+            chunk_size = partial.start(response.status_code, response.headers, byte_rate)
+        except BlockingIOError:
+            private = True
+            own_part = partial.part.with_name(f"{partial.part.name}.{os.getpid()}")
+            partial = PartialDownload(url, own_part)
+            partial.offset = 0
+            if response.status_code == 206:
+                # The body continues the other process's part; fetch the whole file.
+                response.close()
+                response = fetch(url, stream=True, headers=partial.request_headers())
+                if not response:
+                    return None
+            chunk_size = partial.start(response.status_code, response.headers, byte_rate)
+    except ValueError as exc:
+        response.close()
+        LOGGER.warning("Dropping partial media for %s: %s", url, exc)
+        partial.discard()
+        return None
+    with response:
+        try:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                if not chunk:
+                    continue
+                if byte_limiter is not None:
+                    byte_limiter.acquire(len(chunk))
+                partial.write(chunk)
+        except Exception as exc:
+            LOGGER.warning(
+                "Media transfer for %s broke off after %s bytes: %s", url, partial.size, exc
+            )
+            if private:
+                partial.discard()
+            else:
+                partial.abort()
+            return None
+        except BaseException:
+            partial.abort()
+            raise
+    if partial.finish():
+        return partial
+    if private:
+        partial.discard()
+    return None
+
+
+def is_current(head, url, dest):
+    """Whether ``dest`` already holds the file a HEAD request for ``url`` describes."""
+    dest = Path(dest)
+    if not dest.exists():
+        return False
+    response = head(url, headers=MEDIA_HEADERS)
+    if not response:
+        return False
+    length = _int_header(response.headers.get("Content-Length"))
+    return length is not None and length == dest.stat().st_size
+
+
+def chunk_size_for(length, byte_rate=0):
+    """Read size for a body of ``length`` bytes: about 16 reads, 64 KB to 1 MB.
+
+    Under a byte rate cap a read never exceeds one second's allowance, so the
+    limiter paces the stream smoothly.
+    """
+    if length is None:
+        size = DEFAULT_CHUNK_SIZE
+    else:
+        size = min(MAX_CHUNK_SIZE, max(MIN_CHUNK_SIZE, length // 16))
+    if byte_rate > 0:
+        size = min(size, max(8192, int(byte_rate)))
+    return size
+
+
+def _content_range(value):
+    """``(first_byte, total)`` from ``bytes first-last/total``; ``total`` may be None."""
+    if not value or not value.startswith("bytes "):
+        return None, None
+    span, _, total = value[6:].partition("/")
+    first, _, _ = span.partition("-")
+    return _int_header(first), _int_header(total)
+
+
+def _int_header(value):
+    value = (value or "").strip()
+    return int(value) if value.isdigit() else None
+
+
+def _validator(headers):
+    etag = headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return headers.get("Last-Modified")
+
+
+def _announced_digests(headers, whole_body):
+    """Hex digests of the full file announced by the response, keyed by hashlib name."""
+    digests = {}
+    for header in ("Digest", "Repr-Digest"):
+        for item in (headers.get(header) or "").split(","):
+            name, _, value = item.strip().partition("=")
+            name = {"sha-256": "sha256", "md5": "md5"}.get(name.lower())
+            if name:
+                digests[name] = _b64_hex(value.strip(":"))
+    if whole_body and headers.get("Content-MD5"):
+        digests["md5"] = _b64_hex(headers["Content-MD5"])
+    return {name: value for name, value in digests.items() if value}
+
+
+def _b64_hex(value):
+    try:
+        return base64.b64decode(value, validate=True).hex()
+    except (binascii.Error, ValueError):
+        return None
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(MAX_CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _failed(future):
+    if not future.done():
+        return False
+    return future.exception() is not None or future.result() is None
+
+
+__all__ = [
+    "MediaDownloader",
+    "PartialDownload",
+    "download",
+    "is_current",
+    "chunk_size_for",
+    "PART_SUFFIX",
+    "MEDIA_HEADERS",
+]
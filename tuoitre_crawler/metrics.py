@@ -0,0 +1,323 @@
+"""Per-stage latency histograms, request counters and run reports."""
+
+import bisect
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import urlparse
+
+from .constants import LOGGER_NAME
+
+LOGGER = logging.getLogger(LOGGER_NAME)
+
+# Upper bounds in seconds, growing by sqrt(2) from 0.5 ms to roughly 3 minutes.
+LATENCY_BUCKETS = tuple(round(0.0005 * 2 ** (step / 2), 6) for step in range(38))
+
+PERCENTILES = (50, 95, 99)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram with interpolated percentiles.
+
+    Memory stays constant however many observations arrive, and the buckets
+    map directly onto a Prometheus ``histogram``. Percentiles are estimated by
+    linear interpolation inside the bucket that holds the requested rank.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, pct):
+        if not self.count:
+            return 0.0
+        rank = pct / 100 * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if not bucket_count or seen + bucket_count < rank:
+                seen += bucket_count
+                continue
+            lower = self.buckets[index - 1] if index else 0.0
+            upper = self.buckets[index] if index < len(self.buckets) else self.max
+            fraction = (rank - seen) / bucket_count
+            return min(self.max, lower + (upper - lower) * fraction)
+        return self.max
+
+    def summary(self):
+        result = {
+            "count": self.count,
+            "sum": round(self.total, 6),
+            "mean": round(self.total / self.count, 6) if self.count else 0.0,
+            "max": round(self.max, 6),
+        }
+        for pct in PERCENTILES:
+            result[f"p{pct}"] = round(self.percentile(pct), 6)
+        return result
+
+
+class CrawlMetrics:
+    """Thread-safe counters, gauges and stage histograms for one crawler.
+
+    Stages are free-form names such as ``fetch.article`` or ``parse.listing``.
+    Gauges are callables sampled whenever a snapshot is taken, which is how
+    queue depths are reported without the queues knowing about metrics.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.started = clock()
+        self.stages = {}
+        self.requests = {}
+        self.retries = {}
+        self.bytes = {}
+        self.counters = {}
+        self._gauges = {}
+        self._gauge_peaks = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = self._clock()
+        try:
+            yield
+        finally:
+            self.observe(name, self._clock() - start)
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self.stages.get(name)
+            if histogram is None:
+                histogram = self.stages[name] = Histogram()
+            histogram.observe(seconds)
+
+    def count_request(self, url, status, retries=0):
+        host = _host(url)
+        with self._lock:
+            key = (host, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            if retries:
+                self.retries[host] = self.retries.get(host, 0) + retries
+
+    def requests_total(self):
+        with self._lock:
+            return sum(self.requests.values())
+
+    def add_bytes(self, kind, amount):
+        if amount:
+            with self._lock:
+                self.bytes[kind] = self.bytes.get(kind, 0) + amount
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def gauge(self, name, read):
+        with self._lock:
+            self._gauges[name] = read
+
+    def queue_depths(self):
+        with self._lock:
+            gauges = list(self._gauges.items())
+        depths = {}
+        for name, read in gauges:
+            try:
+                depths[name] = int(read())
+            except Exception:  # pragma: no cover - gauge owner went away
+                continue
+        with self._lock:
+            for name, value in depths.items():
+                self._gauge_peaks[name] = max(self._gauge_peaks.get(name, 0), value)
+        return depths
+
+    def snapshot(self):
+        depths = self.queue_depths()
+        with self._lock:
+            elapsed = self._clock() - self.started
+            requests_total = sum(self.requests.values())
+            by_host = {}
+            for (host, status), count in sorted(self.requests.items()):
+                by_host.setdefault(host, {})[status] = count
+            return {
+                "elapsed_seconds": round(elapsed, 3),
+                "requests": {
+                    "total": requests_total,
+                    "per_second": round(requests_total / elapsed, 3) if elapsed > 0 else 0.0,
+                    "by_host": by_host,
+                },
+                "retries": dict(sorted(self.retries.items())),
+                "bytes": dict(sorted(self.bytes.items())),
+                "counters": dict(sorted(self.counters.items())),
+                "queues": {
+                    name: {"depth": depth, "peak": self._gauge_peaks.get(name, depth)}
+                    for name, depth in sorted(depths.items())
+                },
+                "stages": {
+                    name: histogram.summary()
+                    for name, histogram in sorted(self.stages.items())
+                },
+            }
+
+    def progress_line(self):
+        report = self.snapshot()
+        requests = report["requests"]
+        errors = sum(
+            count
+            for statuses in requests["by_host"].values()
+            for status, count in statuses.items()
+            if not status.startswith("2") and status != "304"
+        )
+        parts = [
+            f"posts={report['counters'].get('posts', 0)}",
+            f"requests={requests['total']} ({requests['per_second']:.1f}/s)",
+            f"errors={errors}",
+            f"retries={sum(report['retries'].values())}",
+            f"bytes={_human_bytes(sum(report['bytes'].values()))}",
+        ]
+        if report["queues"]:
+            parts.append(
+                "queues="
+                + ",".join(f"{name}:{value['depth']}" for name, value in report["queues"].items())
+            )
+        slowest = sorted(
+            report["stages"].items(), key=lambda item: item[1]["p95"], reverse=True
+        )[:3]
+        if slowest:
+            parts.append(
+                "p95 " + " ".join(f"{name}={stats['p95']:.3f}s" for name, stats in slowest)
+            )
+        return " ".join(parts)
+
+    def prometheus_text(self, prefix="tuoitre"):
+        depths = self.queue_depths()
+        lines = []
+        with self._lock:
+            lines.append(f"# TYPE {prefix}_stage_seconds histogram")
+            for name, histogram in sorted(self.stages.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(
+                        f'{prefix}_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}'
+                    )
+                lines.append(
+                    f'{prefix}_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {histogram.count}'
+                )
+                lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {histogram.total}')
+                lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {histogram.count}')
+            lines.append(f"# TYPE {prefix}_requests_total counter")
+            for (host, status), count in sorted(self.requests.items()):
+                lines.append(
+                    f'{prefix}_requests_total{{host="{host}",status="{status}"}} {count}'
+                )
+            lines.append(f"# TYPE {prefix}_retries_total counter")
+            for host, count in sorted(self.retries.items()):
+                lines.append(f'{prefix}_retries_total{{host="{host}"}} {count}')
+            lines.append(f"# TYPE {prefix}_bytes_total counter")
+            for kind, count in sorted(self.bytes.items()):
+                lines.append(f'{prefix}_bytes_total{{kind="{kind}"}} {count}')
+            for name, count in sorted(self.counters.items()):
+                lines.append(f"# TYPE {prefix}_{name}_total counter")
+                lines.append(f"{prefix}_{name}_total {count}")
+        lines.append(f"# TYPE {prefix}_queue_depth gauge")
+        for name, depth in sorted(depths.items()):
+            lines.append(f'{prefix}_queue_depth{{queue="{name}"}} {depth}')
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, path):
+        _write_atomic(path, json.dumps(self.snapshot(), ensure_ascii=False, indent=2))
+
+    def write_prometheus(self, path):
+        _write_atomic(path, self.prometheus_text())
+
+
+class MetricsReporter:
+    """Background thread that logs a progress line and refreshes a Prometheus file.
+
+    Either output may be disabled: ``log_progress`` controls the log line and
+    ``prometheus_path`` the textfile (suitable for node_exporter's textfile
+    collector). ``stop`` writes both one final time.
+    """
+
+    def __init__(self, metrics, interval=10.0, log_progress=True, prometheus_path=None):
+        self.metrics = metrics
+        self.interval = max(0.1, interval)
+        self.log_progress = log_progress
+        self.prometheus_path = prometheus_path
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self._emit()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._emit()
+
+    def _emit(self):
+        try:
+            if self.log_progress:
+                LOGGER.info("Progress: %s", self.metrics.progress_line())
+            if self.prometheus_path:
+                self.metrics.write_prometheus(self.prometheus_path)
+        except Exception as exc:  # pragma: no cover - logging path
+            LOGGER.warning("Failed to report metrics: %s", exc)
+
+
+def response_retries(response):
+    """Number of retries urllib3 made before ``response`` was returned."""
+    raw = getattr(response, "raw", None)
+    retries = getattr(raw, "retries", None)
+    history = getattr(retries, "history", None)
+    return len(history) if history else 0
+
+
+def _write_atomic(path, text):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    with os.fdopen(fd, "w", encoding="utf-8") as handle:
+        handle.write(text)
+    os.replace(tmp_name, path)
+
+
+def _host(url):
+    return (urlparse(url).hostname or "").lower()
+
+
+def _human_bytes(amount):
+    if amount < 1024:
+        return f"{amount}B"
+    for unit in ("KB", "MB", "GB"):
+        amount /= 1024
+        if amount < 1024 or unit == "GB":
+            return f"{amount:.1f}{unit}"
+
+
+__all__ = [
+    "CrawlMetrics",
+    "Histogram",
+    "MetricsReporter",
+    "response_retries",
+    "LATENCY_BUCKETS",
+]
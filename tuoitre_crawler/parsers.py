@@ -1,10 +1,62 @@
+import importlib.util
+import logging
 import re
 
-from bs4 import BeautifulSoup
-
-from .constants import ARTICLE_REACTION_LABELS, COMMENT_REACTION_LABELS
+from .constants import (
+    ARTICLE_REACTION_LABELS,
+    COMMENT_REACTION_LABELS,
+    LOGGER_NAME,
+    PARSER_BACKENDS,
+)
+from .extract import ExtractionPlan, Rule, plan_supported
 from .helpers import absolutize
 
+LOGGER = logging.getLogger(LOGGER_NAME)
+
+DEFAULT_BACKEND = "html.parser"
+
+
+def available_backends():
+    return [
+        name
+        for name, module in PARSER_BACKENDS.items()
+        if module is None or importlib.util.find_spec(module) is not None
+    ]
+
+
+def resolve_backend(name="auto"):
+    """Map a ``--parser`` choice to an installed backend.
+
+    ``auto`` is :data:`DEFAULT_BACKEND`: lxml repairs malformed markup
+    differently from ``html.parser``, so it is only used when asked for by
+    name, after :func:`check_backends` agrees on the pages being crawled.
+    """
+    if name in (None, "auto"):
+        return DEFAULT_BACKEND
+    if name not in PARSER_BACKENDS:
+        choices = ", ".join(sorted(PARSER_BACKENDS))
+        raise ValueError(f"Unknown parser backend {name!r}; choose from {choices}")
+    if name not in available_backends():
+        LOGGER.warning("Parser backend %s is not installed; using %s", name, DEFAULT_BACKEND)
+        return DEFAULT_BACKEND
+    return name
+
+
+META_ITEM_ID = re.compile(r"<meta\b[^>]*\bproperty\s*=\s*[\"']dable:item_id[\"'][^>]*>", re.I)
+CONTENT_ATTR = re.compile(r"\bcontent\s*=\s*(?:\"([^\"]*)\"|'([^']*)')", re.I)
+HEAD_END = re.compile(r"</head\s*>", re.I)
+SCRIPT_BLOCK = re.compile(r"<script\b[^>]*>(.*?)</script\s*>", re.I | re.S)
+ARTICLE_ID = re.compile(r"articleId'?:\s*'?(\d{10,})")
+URL_DIGITS = re.compile(r"(\d{8,})")
+
+
+def make_soup(html, backend=DEFAULT_BACKEND):
+    # Imported here: articles and listings are read by the extraction plans,
+    # so most runs never build a soup.
+    from bs4 import BeautifulSoup
+
+    return BeautifulSoup(html, backend)
+
 
 def normalize_comment(raw):
     reactions = {}
@@ -29,14 +81,47 @@ def extract_post_id(soup, url):
     meta = soup.find("meta", {"property": "dable:item_id"})
     if meta and meta.get("content"):
         return meta["content"].strip()
-    script_text = soup.decode()
-    match = re.search(r"articleId'?:\s*'?(\d{10,})", script_text)
-    if match:
-        return match.group(1)
-    digits = re.findall(r"(\d{8,})", url)
+    for script in soup.find_all("script"):
+        match = ARTICLE_ID.search(script.get_text())
+        if match:
+            return match.group(1)
+    return _post_id_from_url(url)
+
+
+def extract_post_id_from_html(html, url=None):
+    """Find the post id in raw HTML without building a tree.
+
+    Looks for the ``dable:item_id`` meta tag in the document head, then for an
+    ``articleId`` inside script blocks. Falls back to the digits in ``url``
+    when one is given; otherwise returns ``None`` so the caller can retry with
+    :func:`extract_post_id` on the parsed soup.
+    """
+    if isinstance(html, bytes):
+        html = html.decode("utf-8", errors="replace")
+    head_end = HEAD_END.search(html)
+    head = html[: head_end.start()] if head_end else html
+    for tag in META_ITEM_ID.finditer(head):
+        content = CONTENT_ATTR.search(tag.group(0))
+        value = content and (content.group(1) or content.group(2) or "").strip()
+        if value:
+            return value
+    for block in SCRIPT_BLOCK.finditer(html):
+        match = ARTICLE_ID.search(block.group(1))
+        if match:
+            return match.group(1)
+    return _post_id_from_url(url) if url else None
+
+
+def _post_id_from_url(url):
+    digits = URL_DIGITS.findall(url)
     return digits[-1] if digits else None
 
 
+TEXT_TAGS = ["p", "li", "blockquote", "h2", "h3"]
+AUDIO_WIDGETS = '[data-type="audio"], [data-component="audio"]'
+REACTION_SPANS = ".formreactdetail .reactinfo span[data-viewreactid]"
+
+
 def extract_metadata(soup):
     title = (soup.find("meta", {"property": "og:title"}) or {}).get("content")
     authors = [name.get_text(strip=True) for name in soup.select(".detail-author .name")]
@@ -62,47 +147,348 @@ def extract_article_content(soup):
     content_root = soup.find(attrs={"data-role": "content"})
     if not content_root:
         content_root = soup
-    text_parts = []
-    for tag in content_root.find_all(["p", "li", "blockquote", "h2", "h3"]):
-        text = tag.get_text(" ", strip=True)
-        if text:
-            text_parts.append(text)
-    images = []
-    for img in content_root.find_all("img"):
-        src = img.get("data-src") or img.get("src")
+    return _content(
+        [tag.get_text(" ", strip=True) for tag in content_root.find_all(TEXT_TAGS)],
+        [img.attrs for img in content_root.find_all("img")],
+        [
+            (audio.attrs, audio.find("source").attrs if audio.find("source") else None)
+            for audio in content_root.find_all("audio")
+        ],
+        [candidate.attrs for candidate in content_root.select(AUDIO_WIDGETS)],
+    )
+
+
+def _content(texts, images, audios, widgets):
+    text_parts = [text for text in texts if text]
+    image_urls = []
+    for attrs in images:
+        src = attrs.get("data-src") or attrs.get("src")
         if not src:
             continue
         if src.startswith("data:"):
             continue
-        images.append(absolutize(src))
+        image_urls.append(absolutize(src))
     audio_urls = []
-    for audio in content_root.find_all("audio"):
-        src = audio.get("src")
-        if not src and audio.find("source"):
-            src = audio.find("source").get("src")
+    for attrs, source in audios:
+        src = attrs.get("src")
+        if not src and source is not None:
+            src = source.get("src")
         if src:
             audio_urls.append(absolutize(src))
-    for candidate in content_root.select('[data-type="audio"], [data-component="audio"]'):
-        src = candidate.get("data-src") or candidate.get("data-url")
+    for attrs in widgets:
+        src = attrs.get("data-src") or attrs.get("data-url")
         if src:
             audio_urls.append(absolutize(src))
-    return {"text": "\n\n".join(text_parts).strip(), "images": images, "audio": audio_urls}
+    return {"text": "\n\n".join(text_parts).strip(), "images": image_urls, "audio": audio_urls}
 
 
 def extract_article_reactions(soup):
+    return _reactions(
+        (span.get("data-viewreactid"), span.get_text(strip=True))
+        for span in soup.select(REACTION_SPANS)
+    )
+
+
+def _reactions(spans):
     reactions = {}
-    for span in soup.select(".formreactdetail .reactinfo span[data-viewreactid]"):
-        reaction_id = span.get("data-viewreactid")
+    for reaction_id, counter in spans:
         label = ARTICLE_REACTION_LABELS.get(reaction_id, f"reaction_{reaction_id}")
-        counter = span.get_text(strip=True)
         value = int(re.sub(r"[^0-9]", "", counter) or 0)
         reactions[label] = value
     return reactions
 
 
+LISTING_SELECTORS = (
+    ".box-category-item a.box-category-link-title",
+    "a[data-linktype=\"newsdetail\"]",
+    "a[data-role=\"audio-autoplay\"]",
+)
+
+
+# What a listing item shows about its article, read by the priority frontier.
+LISTING_ITEM = "box-category-item"
+LISTING_TIME = ".time-ago[title], time[datetime]"
+LISTING_COMMENTS = ".box-category-comment"
+
+
+def extract_listing_entries(soup):
+    """Return ``(article_url, audio_url_or_None, signals)`` entries from a listing page.
+
+    ``signals`` holds the ``published`` time and ``comments`` count shown in
+    the link's listing item, each ``None`` when the item does not show it.
+    """
+    return _listing_entries(
+        [(anchor.attrs, _item_signals(anchor)) for anchor in soup.select(selector)]
+        for selector in LISTING_SELECTORS
+    )
+
+
+def _item_signals(anchor):
+    item = anchor.find_parent(class_=LISTING_ITEM)
+    if item is None:
+        return _listing_signals(None, None)
+    time_tag = item.select_one(LISTING_TIME)
+    counter = item.select_one(LISTING_COMMENTS)
+    return _listing_signals(
+        time_tag.attrs if time_tag else None, counter.get_text(strip=True) if counter else None
+    )
+
+
+def _listing_signals(time_attrs, counter):
+    published = (time_attrs.get("title") or time_attrs.get("datetime")) if time_attrs else None
+    digits = re.sub(r"[^0-9]", "", counter or "")
+    return {"published": published or None, "comments": int(digits) if digits else None}
+
+
+def _listing_entries(anchor_groups):
+    entries = []
+    for anchors in anchor_groups:
+        for attrs, signals in anchors:
+            href = attrs.get("href")
+            if not href or href == "#":
+                continue
+            data_file = attrs.get("data-file")
+            entries.append(
+                (absolutize(href), absolutize(data_file) if data_file else None, signals)
+            )
+    return entries
+
+
+# The extractors above, compiled into plans that run during parsing. They
+# collect the same elements without building a soup and rescanning it once per
+# extractor; compare_plan checks the two stay in agreement.
+ARTICLE_PLAN = ExtractionPlan(
+    {
+        "item_id": Rule('meta[property="dable:item_id"]', first=True),
+        "scripts": Rule("script", text=""),
+        "title": Rule('meta[property="og:title"]', first=True),
+        "authors": Rule(".detail-author .name", text="", strip=True),
+        "author": Rule('meta[property="article:author"]', first=True),
+        "date": Rule('meta[property="article:published_time"]', first=True),
+        "category": Rule('meta[property="article:section"]', first=True),
+        "page_title": Rule("title", first=True, string=True),
+        "text": Rule(", ".join(TEXT_TAGS), text=" ", strip=True, scoped=True),
+        "images": Rule("img", scoped=True),
+        "audio": Rule("audio", scoped=True, child="source"),
+        "audio_widgets": Rule(AUDIO_WIDGETS, scoped=True),
+        "reactions": Rule(REACTION_SPANS, text="", strip=True),
+    },
+    root='[data-role="content"]',
+)
+LISTING_PLAN = ExtractionPlan(
+    {
+        **{selector: Rule(selector) for selector in LISTING_SELECTORS},
+        "items": Rule("." + LISTING_ITEM),
+        "times": Rule(LISTING_TIME),
+        "comments": Rule(LISTING_COMMENTS, text="", strip=True),
+    }
+)
+
+
+def parse_listing(html, backend=DEFAULT_BACKEND):
+    if isinstance(html, bytes) or not plan_supported(backend):
+        return _parse_listing_soup(html, backend)
+    found = LISTING_PLAN.run(html, backend)
+    return _listing_entries(
+        [(match.attrs, _plan_item_signals(found, match)) for match in found[selector]]
+        for selector in LISTING_SELECTORS
+    )
+
+
+def _plan_item_signals(found, anchor):
+    item = None
+    for match in found["items"]:
+        if match.position >= anchor.position:
+            break
+        if match.end >= anchor.position:
+            item = match
+    if item is None:
+        return _listing_signals(None, None)
+    time_tag = _first_within(found["times"], item)
+    counter = _first_within(found["comments"], item)
+    return _listing_signals(
+        time_tag.attrs if time_tag else None, counter.text if counter else None
+    )
+
+
+def _first_within(matches, item):
+    for match in matches:
+        if item.position < match.position <= item.end:
+            return match
+    return None
+
+
+def _parse_listing_soup(html, backend=DEFAULT_BACKEND):
+    soup = make_soup(html, backend)
+    try:
+        return extract_listing_entries(soup)
+    finally:
+        soup.decompose()
+
+
+def parse_article(html, url, backend=DEFAULT_BACKEND):
+    """Parse an article page into plain, picklable data.
+
+    This is the unit of work shipped to parse worker processes, so it takes
+    and returns only builtin types. Text is run through :data:`ARTICLE_PLAN`
+    in a single pass of the parser; bytes, which need BeautifulSoup's encoding
+    detection, are parsed into a soup and read by the extractors instead, as
+    is everything when :func:`~tuoitre_crawler.extract.plan_supported` says
+    the installed bs4 cannot drive the plan.
+    """
+    if isinstance(html, bytes) or not plan_supported(backend):
+        return _parse_article_soup(html, url, backend)
+    found = ARTICLE_PLAN.run(html, backend)
+    return {
+        "post_id": _plan_post_id(found, url),
+        "metadata": _plan_metadata(found),
+        "page_title": _plan_page_title(found),
+        "content": _content(
+            [match.text for match in found["text"]],
+            [match.attrs for match in found["images"]],
+            [(match.attrs, match.child) for match in found["audio"]],
+            [match.attrs for match in found["audio_widgets"]],
+        ),
+        "reactions": _reactions(
+            (match.attrs.get("data-viewreactid"), match.text) for match in found["reactions"]
+        ),
+    }
+
+
+def _parse_article_soup(html, url, backend=DEFAULT_BACKEND):
+    # The tree is decomposed before returning: its parent/child links form
+    # reference cycles that would otherwise keep it alive until the next full
+    # garbage collection.
+    soup = make_soup(html, backend)
+    try:
+        title = soup.title
+        return {
+            "post_id": extract_post_id(soup, url),
+            "metadata": extract_metadata(soup),
+            "page_title": title.string.strip() if title and title.string else "",
+            "content": extract_article_content(soup),
+            "reactions": extract_article_reactions(soup),
+        }
+    finally:
+        soup.decompose()
+
+
+def _plan_content(found, name):
+    return found[name][0].attrs.get("content") if found[name] else None
+
+
+def _plan_post_id(found, url):
+    item_id = _plan_content(found, "item_id")
+    if item_id:
+        return item_id.strip()
+    for script in found["scripts"]:
+        match = ARTICLE_ID.search(script.text)
+        if match:
+            return match.group(1)
+    return _post_id_from_url(url)
+
+
+def _plan_metadata(found):
+    authors = [match.text for match in found["authors"]]
+    if not authors and _plan_content(found, "author"):
+        authors = [_plan_content(found, "author")]
+    return {
+        "title": _plan_content(found, "title"),
+        "authors": authors,
+        "date": _plan_content(found, "date") or None,
+        "category": _plan_content(found, "category") or None,
+    }
+
+
+def _plan_page_title(found):
+    title = found["page_title"][0].string if found["page_title"] else None
+    return title.strip() if title else ""
+
+
+def normalize_comments(raw_comments):
+    return [normalize_comment(raw) for raw in raw_comments]
+
+
+def compare_backends(html, url, backends=None):
+    """Run every extractor under each backend and report fields that differ.
+
+    Returns a mapping of ``"<extractor>"`` to ``{backend: value}`` for each
+    extractor whose output is not identical across ``backends``.
+    """
+    backends = backends or available_backends()
+    outputs = {}
+    for backend in backends:
+        soup = make_soup(html, backend)
+        outputs[backend] = {
+            "post_id": extract_post_id(soup, url),
+            "metadata": extract_metadata(soup),
+            "content": extract_article_content(soup),
+            "reactions": extract_article_reactions(soup),
+            "title": soup.title.string.strip() if soup.title and soup.title.string else "",
+        }
+    mismatches = {}
+    reference = outputs[backends[0]]
+    for field in reference:
+        values = {backend: outputs[backend][field] for backend in backends}
+        if any(value != reference[field] for value in values.values()):
+            mismatches[field] = values
+    return mismatches
+
+
+def check_backends(articles, listings=(), backends=None):
+    """Compare backends over a corpus of ``(url, html)`` article and listing pages.
+
+    Articles go through :func:`compare_backends` and listings through the
+    listing extractor. Returns ``{url: {field: {backend: value}}}`` for every
+    page where the backends disagree; an empty result means they give
+    identical output on the whole corpus.
+    """
+    backends = backends or available_backends()
+    mismatches = {}
+    for url, html in articles:
+        differences = compare_backends(html, url, backends)
+        if differences:
+            mismatches[url] = differences
+    for url, html in listings:
+        entries = {backend: _parse_listing_soup(html, backend) for backend in backends}
+        if any(value != entries[backends[0]] for value in entries.values()):
+            mismatches[url] = {"entries": entries}
+    return mismatches
+
+
+def compare_plan(html, url, backend=DEFAULT_BACKEND):
+    """Report fields where :func:`parse_article` differs from the soup extractors.
+
+    Returns ``{field: {"plan": value, "soup": value}}`` for each mismatch.
+    """
+    plan = parse_article(html, url, backend)
+    soup = _parse_article_soup(html, url, backend)
+    return {
+        field: {"plan": plan[field], "soup": soup[field]}
+        for field in soup
+        if plan[field] != soup[field]
+    }
+
+
 __all__ = [
+    "DEFAULT_BACKEND",
+    "PARSER_BACKENDS",
+    "available_backends",
+    "resolve_backend",
+    "make_soup",
+    "compare_backends",
+    "check_backends",
+    "compare_plan",
+    "ARTICLE_PLAN",
+    "LISTING_PLAN",
+    "LISTING_SELECTORS",
+    "extract_listing_entries",
+    "parse_listing",
+    "parse_article",
+    "normalize_comments",
     "normalize_comment",
     "extract_post_id",
+    "extract_post_id_from_html",
     "extract_metadata",
     "extract_article_content",
     "extract_article_reactions",
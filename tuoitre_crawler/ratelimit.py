@@ -0,0 +1,112 @@
+"""Token-bucket rate limiting shared by every worker of a crawl."""
+
+import threading
+import time
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at ``rate`` tokens per second.
+
+    ``reserve`` deducts tokens immediately (the balance may go negative) and
+    returns how long the caller has to wait before it may proceed, which keeps
+    callers in FIFO order and lets both threads and coroutines share a bucket.
+    A non-positive ``rate`` disables limiting. ``pause`` holds every caller
+    back for a while regardless of the balance, e.g. to honour ``Retry-After``.
+    """
+
+    def __init__(self, rate, burst=1, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.rate = float(rate or 0)
+        self.capacity = max(1.0, float(burst))
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._paused_until = 0.0
+
+    def reserve(self, tokens=1.0):
+        with self._lock:
+            paused = max(0.0, self._paused_until - self._clock())
+            if self.rate <= 0:
+                return paused
+            self._refill()
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return paused
+            return max(paused, -self._tokens / self.rate)
+
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+    def acquire(self, tokens=1.0):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def set_rate(self, rate, burst=None):
+        with self._lock:
+            self._refill()
+            self.rate = float(rate or 0)
+            if burst is not None:
+                self.capacity = max(1.0, float(burst))
+                self._tokens = min(self._tokens, self.capacity)
+
+    def _refill(self):
+        now = self._clock()
+        elapsed = now - self._updated
+        self._updated = now
+        if elapsed > 0 and self.rate > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+
+
+class HostRateLimiter:
+    """One token bucket per host with optional per-host overrides.
+
+    ``overrides`` maps a host name to a ``(rate, burst)`` pair (``burst`` may
+    be ``None`` to keep the default). Every other host (tuoitre.vn,
+    id.tuoitre.vn, each CDN host) gets its own bucket with the default
+    ``rate``/``burst``.
+    """
+
+    def __init__(self, rate, burst=1, overrides=None):
+        self.rate = rate
+        self.burst = burst
+        self.overrides = dict(overrides or {})
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, url):
+        host = _host(url)
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                rate, burst = self.overrides.get(host, (self.rate, None))
+                bucket = TokenBucket(rate, self.burst if burst is None else burst)
+                self._buckets[host] = bucket
+            return bucket
+
+    def reserve(self, url, tokens=1.0):
+        return self.bucket(url).reserve(tokens)
+
+    def acquire(self, url, tokens=1.0):
+        return self.bucket(url).acquire(tokens)
+
+
+def parse_host_rate(value):
+    """Parse a ``host=rate[:burst]`` CLI override."""
+    host, sep, spec = value.partition("=")
+    if not sep or not host:
+        raise ValueError(f"Expected host=rate[:burst], got {value!r}")
+    rate, _, burst = spec.partition(":")
+    return host.strip().lower(), (float(rate), float(burst) if burst else None)
+
+
+def _host(url):
+    if "://" not in url:
+        return url.lower()
+    return (urlparse(url).hostname or "").lower()
+
+
+__all__ = ["TokenBucket", "HostRateLimiter", "parse_host_rate"]
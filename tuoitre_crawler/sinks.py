@@ -0,0 +1,496 @@
+"""Output sinks for post records and the background writer that feeds them."""
+
+import gzip
+import io
+import json
+import logging
+import queue
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+
+from .constants import COMMENT_MEMORY_BUDGET, LOGGER_NAME
+
+try:  # pragma: no cover - optional dependency
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+LOGGER = logging.getLogger(LOGGER_NAME)
+
+OUTPUT_FORMATS = ("json", "jsonl", "sqlite")
+COMPRESSIONS = {None: "", "gzip": ".gz", "zstd": ".zst"}
+
+SHARD_PREFIX = "posts"
+SHARD_PATTERN = re.compile(r"^posts-(\d{5})\.jsonl(\.gz|\.zst)?$")
+SQLITE_FILENAME = "posts.sqlite3"
+POST_ID_PREFIX = re.compile(r'^\{"postId": "([^"\\]*)"')
+
+# What reading a compressed shard raises where its last frame was cut short.
+TRUNCATED_SHARD_ERRORS = (EOFError, OSError) + ((zstandard.ZstdError,) if zstandard else ())
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    post_id TEXT PRIMARY KEY,
+    source_url TEXT,
+    category TEXT,
+    saved_at REAL NOT NULL,
+    record TEXT NOT NULL
+);
+"""
+
+
+class CommentSpool:
+    """A post's normalized comments as JSON lines in a ``SpooledTemporaryFile``.
+
+    Comment pages are added as they arrive, deduplicated by ``commentId``.
+    Up to ``max_memory`` bytes stay in memory and anything beyond rolls over to
+    an anonymous temporary file, so the memory a worker holds for one post
+    stays bounded however long the thread is. Sinks stream the spool into the
+    record with :func:`record_json_chunks`; the writer closes it afterwards.
+    """
+
+    def __init__(self, max_memory=COMMENT_MEMORY_BUDGET):
+        self._file = tempfile.SpooledTemporaryFile(max_size=max_memory, mode="w+b")
+        self._ids = set()
+        self._count = 0
+        self.closed = False
+
+    def extend(self, comments):
+        self._file.seek(0, io.SEEK_END)
+        for comment in comments:
+            if comment["commentId"] in self._ids:
+                continue
+            self._ids.add(comment["commentId"])
+            self._file.write(json.dumps(comment, ensure_ascii=False).encode("utf-8") + b"\n")
+            self._count += 1
+
+    @property
+    def rolled_over(self):
+        return not self.closed and self._file._rolled
+
+    def lines(self):
+        """Yield each comment's compact JSON text in the order it was added."""
+        self._file.seek(0)
+        for line in self._file:
+            yield line.decode("utf-8").rstrip("\n")
+
+    def __iter__(self):
+        for line in self.lines():
+            yield json.loads(line)
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self._file.close()
+            self._ids = set()
+
+
+def record_json_chunks(record, indent=None):
+    """Yield ``json.dumps(record, ensure_ascii=False, indent=indent)`` in pieces.
+
+    A :class:`CommentSpool` value is written one comment at a time instead of
+    being materialized; every other value is serialized whole. The text is
+    identical to dumping the record with the spool replaced by a list.
+    """
+    pad = "" if indent is None else "\n" + " " * indent
+    separator = ", " if indent is None else ","
+    yield "{"
+    for index, (key, value) in enumerate(record.items()):
+        yield (separator if index else "") + pad + json.dumps(key, ensure_ascii=False) + ": "
+        if isinstance(value, CommentSpool):
+            yield from _spool_chunks(value, indent, pad, separator)
+        else:
+            yield json.dumps(value, ensure_ascii=False, indent=indent).replace("\n", pad)
+    yield (pad[:1] if record else "") + "}"
+
+
+def _spool_chunks(spool, indent, pad, separator):
+    if not len(spool):
+        yield "[]"
+        return
+    inner = pad + " " * (indent or 0)
+    yield "["
+    for index, line in enumerate(spool.lines()):
+        if indent is not None:
+            line = json.dumps(json.loads(line), ensure_ascii=False, indent=indent)
+        yield (separator if index else "") + inner + line.replace("\n", inner)
+    yield pad + "]"
+
+
+def close_spools(record):
+    for value in record.values():
+        if isinstance(value, CommentSpool):
+            value.close()
+
+
+class PerFileSink:
+    """One indented ``<postId>.json`` file per record (the original layout)."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def write_batch(self, records):
+        paths = []
+        for record in records:
+            path = self.directory / f"{record['postId']}.json"
+            with path.open("w", encoding="utf-8") as fp:
+                for chunk in record_json_chunks(record, indent=2):
+                    fp.write(chunk)
+            paths.append(path)
+        return paths
+
+    def close(self):
+        pass
+
+
+class JsonlSink:
+    """Append-only ``posts-NNNNN.jsonl`` shards rotated by size.
+
+    A shard is closed once ``max_bytes`` of uncompressed JSON has been written
+    to it; records are streamed, so the last one may run past the limit.
+    ``compression`` may be ``"gzip"`` or ``"zstd"`` (needs the ``zstandard``
+    package); both formats allow appending to an existing shard, so a later
+    run continues the newest one, after decompressing it once to learn how
+    much JSON it already holds. Every batch is flushed through the
+    compressor before ``write_batch`` returns, and ``write_batch`` returns
+    the shard each record went to.
+    """
+
+    def __init__(self, directory, max_bytes=256 * 1024**2, compression=None):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression {compression!r}")
+        if compression == "zstd" and zstandard is None:
+            raise RuntimeError("zstd output requires zstandard (pip install zstandard)")
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.compression = compression
+        self._index = self._last_index()
+        self._raw = None
+        self._stream = None
+        self._written = 0
+
+    def write_batch(self, records):
+        paths = []
+        for record in records:
+            if self._stream is not None and self._written >= self.max_bytes:
+                self._close_shard()
+                self._index += 1
+            if self._stream is None:
+                self._open_shard()
+            for chunk in record_json_chunks(record):
+                data = chunk.encode("utf-8")
+                self._stream.write(data)
+                self._written += len(data)
+            self._stream.write(b"\n")
+            self._written += 1
+            paths.append(self._shard_path(self._index))
+        if self._stream is not None:
+            self._flush()
+        return paths
+
+    def close(self):
+        self._close_shard()
+
+    def _open_shard(self):
+        path = self._shard_path(self._index)
+        self._raw = path.open("ab")
+        self._written = self._raw.tell()
+        if self._written and self.compression is not None:
+            self._written = _uncompressed_size(path)
+        if self.compression == "gzip":
+            self._stream = gzip.GzipFile(fileobj=self._raw, mode="ab")
+        elif self.compression == "zstd":
+            self._stream = zstandard.ZstdCompressor().stream_writer(
+                self._raw, closefd=False
+            )
+        else:
+            self._stream = self._raw
+
+    def _flush(self):
+        if self.compression == "zstd":
+            self._stream.flush(zstandard.FLUSH_FRAME)
+        else:
+            self._stream.flush()
+        self._raw.flush()
+
+    def _close_shard(self):
+        if self._stream is None:
+            return
+        if self._stream is not self._raw:
+            self._stream.close()
+        self._raw.close()
+        self._stream = None
+        self._raw = None
+
+    def _last_index(self):
+        indices = [
+            int(match.group(1))
+            for match in (SHARD_PATTERN.match(path.name) for path in self.directory.iterdir())
+            if match and (match.group(2) or "") == COMPRESSIONS[self.compression]
+        ]
+        return max(indices, default=0)
+
+    def _shard_path(self, index):
+        suffix = COMPRESSIONS[self.compression]
+        return self.directory / f"{SHARD_PREFIX}-{index:05d}.jsonl{suffix}"
+
+
+class SqliteSink:
+    """Records stored as JSON text in a ``posts`` table keyed by ``postId``."""
+
+    def __init__(self, directory, filename=SQLITE_FILENAME):
+        self.path = Path(directory) / filename
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+
+    def write_batch(self, records):
+        now = time.time()
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO posts VALUES (?, ?, ?, ?, ?)",
+                [
+                    (
+                        record["postId"],
+                        record.get("source_url"),
+                        record.get("category"),
+                        now,
+                        "".join(record_json_chunks(record)),
+                    )
+                    for record in records
+                ],
+            )
+        return [self.path] * len(records)
+
+    def close(self):
+        self._conn.close()
+
+
+class SinkWriter:
+    """Feed a sink from a single background thread in batches.
+
+    ``submit`` enqueues a record and returns a future that resolves to the
+    location the sink's ``write_batch`` reports once its batch is on disk. The queue is bounded
+    by ``max_pending`` so a slow disk applies back-pressure instead of growing
+    memory. A batch is written when ``batch_size`` records are waiting or
+    ``flush_interval`` seconds after its first record arrived. Batch write
+    times are observed as the ``output.write`` stage of ``metrics``.
+    """
+
+    def __init__(
+        self, sink, batch_size=64, flush_interval=1.0, max_pending=1024, metrics=None
+    ):
+        self.sink = sink
+        self.metrics = metrics
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max(1, max_pending))
+        self._closed = False
+        self.stats = {"written": 0, "batches": 0, "failed": 0}
+        self._thread = threading.Thread(target=self._run, name="sink-writer", daemon=True)
+        self._thread.start()
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def submit(self, record):
+        if self._closed:
+            raise RuntimeError("SinkWriter is closed")
+        future = Future()
+        self._queue.put((record, future))
+        return future
+
+    def flush(self):
+        marker = Future()
+        self._queue.put((None, marker))
+        marker.result()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        self.sink.close()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size and batch[-1][0] is not None:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._write(batch)
+            if stop:
+                return
+
+    def _write(self, batch):
+        records = [(record, future) for record, future in batch if record is not None]
+        if records:
+            started = time.monotonic()
+            try:
+                locations = self.sink.write_batch([record for record, _ in records])
+            except Exception as exc:  # pragma: no cover - logging path
+                LOGGER.error("Failed to write %s records: %s", len(records), exc)
+                self.stats["failed"] += len(records)
+                for _, future in records:
+                    future.set_exception(exc)
+            else:
+                if self.metrics is not None:
+                    self.metrics.observe("output.write", time.monotonic() - started)
+                self.stats["written"] += len(records)
+                self.stats["batches"] += 1
+                for (_, future), location in zip(records, locations):
+                    future.set_result(location)
+        for record, future in batch:
+            if record is None:
+                future.set_result(None)
+            else:
+                close_spools(record)
+
+
+def open_sink(output_format, directory, compression=None, shard_bytes=None):
+    if output_format == "json":
+        return PerFileSink(directory)
+    if output_format == "jsonl":
+        kwargs = {"max_bytes": shard_bytes} if shard_bytes else {}
+        return JsonlSink(directory, compression=compression, **kwargs)
+    if output_format == "sqlite":
+        return SqliteSink(directory)
+    raise ValueError(f"Unknown output format {output_format!r}")
+
+
+def iter_stored_records(directory, latest=False):
+    """Yield every record saved under ``directory`` by any sink.
+
+    JSONL shards are append-only, so a post saved again appears once per save.
+    ``latest=True`` yields only its last copy, at the cost of reading the
+    shards twice. A shard is read up to its last complete line, and a line
+    that is not valid JSON is skipped with a warning.
+    """
+    directory = Path(directory)
+    for path in sorted(directory.glob("*.json")):
+        with path.open("r", encoding="utf-8") as fp:
+            yield json.load(fp)
+    shards = [path for path in sorted(directory.iterdir()) if SHARD_PATTERN.match(path.name)]
+    newest = _newest_lines(shards) if latest else None
+    for path in shards:
+        with _open_shard_for_reading(path) as fp:
+            for number, line in enumerate(_complete_lines(fp)):
+                record = _decode_line(line, path, number)
+                if record is None:
+                    continue
+                if newest is None or newest.get(record.get("postId")) == (path, number):
+                    yield record
+    db_path = directory / SQLITE_FILENAME
+    if db_path.exists():
+        conn = sqlite3.connect(str(db_path))
+        try:
+            for (record,) in conn.execute("SELECT record FROM posts ORDER BY rowid"):
+                yield json.loads(record)
+        finally:
+            conn.close()
+
+
+def _newest_lines(shards):
+    newest = {}
+    for path in shards:
+        with _open_shard_for_reading(path) as fp:
+            for number, line in enumerate(_complete_lines(fp)):
+                match = POST_ID_PREFIX.match(line)
+                if match:
+                    newest[match.group(1)] = (path, number)
+                    continue
+                record = _decode_line(line, path, number, warn=False)
+                if record is not None:
+                    newest[record.get("postId")] = (path, number)
+    return newest
+
+
+def _decode_line(line, path, number, warn=True):
+    if not line.strip():
+        return None
+    try:
+        return json.loads(line)
+    except ValueError as exc:
+        if warn:
+            LOGGER.warning("Skipping unreadable line %s of %s: %s", number + 1, path, exc)
+        return None
+
+
+def _complete_lines(fp):
+    """Lines of a shard up to its last complete record.
+
+    A shard still being written may end mid-record or, when compressed, before
+    the end of its last frame; the rest is picked up by the next reader.
+    """
+    try:
+        for line in fp:
+            if not line.endswith("\n"):
+                return
+            yield line
+    except (*TRUNCATED_SHARD_ERRORS, UnicodeDecodeError):
+        return
+
+
+def _uncompressed_size(path):
+    """Bytes of JSON in a compressed shard, up to any frame cut short by a crash."""
+    size = 0
+    with _open_shard_for_reading(path, binary=True) as fp:
+        try:
+            for chunk in iter(lambda: fp.read(65536), b""):
+                size += len(chunk)
+        except TRUNCATED_SHARD_ERRORS as exc:
+            LOGGER.warning("Shard %s ends in an incomplete frame: %s", path, exc)
+    return size
+
+
+def _open_shard_for_reading(path, binary=False):
+    if path.suffix == ".gz":
+        return gzip.open(path, "rb") if binary else gzip.open(path, "rt", encoding="utf-8")
+    if path.suffix == ".zst":
+        if zstandard is None:
+            raise RuntimeError("Reading zstd shards requires zstandard")
+        reader = zstandard.ZstdDecompressor().stream_reader(
+            path.open("rb"), read_across_frames=True, closefd=True
+        )
+        return reader if binary else io.TextIOWrapper(reader, encoding="utf-8")
+    return path.open("rb") if binary else path.open("r", encoding="utf-8")
+
+
+__all__ = [
+    "CommentSpool",
+    "record_json_chunks",
+    "PerFileSink",
+    "JsonlSink",
+    "SqliteSink",
+    "SinkWriter",
+    "open_sink",
+    "iter_stored_records",
+    "OUTPUT_FORMATS",
+]
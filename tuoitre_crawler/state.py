@@ -0,0 +1,186 @@
+"""SQLite-backed crawl state used to skip finished work across runs."""
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+STATE_FILENAME = "crawl_state.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT PRIMARY KEY,
+    category TEXT,
+    post_id TEXT,
+    status TEXT NOT NULL,
+    fetched_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS posts (
+    post_id TEXT PRIMARY KEY,
+    url TEXT,
+    category TEXT,
+    status TEXT NOT NULL,
+    fetched_at REAL,
+    content_hash TEXT,
+    data_path TEXT,
+    comment_count INTEGER,
+    media_total INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS media (
+    url TEXT NOT NULL,
+    dest TEXT NOT NULL,
+    post_id TEXT,
+    status TEXT NOT NULL,
+    blob TEXT,
+    fetched_at REAL,
+    PRIMARY KEY (url, dest)
+);
+CREATE INDEX IF NOT EXISTS urls_status ON urls (status);
+CREATE INDEX IF NOT EXISTS media_status ON media (status);
+"""
+
+DONE = "done"
+FAILED = "failed"
+PENDING = "pending"
+DUPLICATE = "duplicate"
+
+
+class CrawlState:
+    """Per-URL, per-post and per-media status shared by all workers.
+
+    A single connection is shared across threads behind a lock; the database
+    runs in WAL mode so an interrupted crawl leaves a consistent file behind.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def mark_url(self, url, status, category=None, post_id=None, error=None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO urls (url, category, post_id, status, fetched_at, attempts, error)
+                VALUES (?, ?, ?, ?, ?, 1, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    category = COALESCE(excluded.category, urls.category),
+                    post_id = COALESCE(excluded.post_id, urls.post_id),
+                    status = excluded.status,
+                    fetched_at = excluded.fetched_at,
+                    attempts = urls.attempts + 1,
+                    error = excluded.error
+                """,
+                (url, category, post_id, status, time.time(), error),
+            )
+
+    def mark_post(
+        self, post_id, url, category, content_hash, data_path, comment_count, media_total
+    ):
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO posts
+                    (post_id, url, category, status, fetched_at, content_hash,
+                     data_path, comment_count, media_total)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(post_id) DO UPDATE SET
+                    url = excluded.url,
+                    category = excluded.category,
+                    status = excluded.status,
+                    fetched_at = excluded.fetched_at,
+                    content_hash = COALESCE(excluded.content_hash, posts.content_hash),
+                    data_path = excluded.data_path,
+                    comment_count = excluded.comment_count,
+                    media_total = excluded.media_total
+                """,
+                (
+                    post_id,
+                    url,
+                    category,
+                    DONE,
+                    time.time(),
+                    content_hash,
+                    str(data_path),
+                    comment_count,
+                    media_total,
+                ),
+            )
+
+    def mark_media(self, url, dest, post_id, status, blob=None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO media (url, dest, post_id, status, blob, fetched_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(url, dest) DO UPDATE SET
+                    post_id = excluded.post_id,
+                    status = excluded.status,
+                    blob = COALESCE(excluded.blob, media.blob),
+                    fetched_at = excluded.fetched_at
+                """,
+                (url, str(dest), post_id, status, str(blob) if blob else None, time.time()),
+            )
+
+    def finished_post(self, url=None, post_id=None):
+        """Return the stored post row for ``url`` or ``post_id`` if it is complete."""
+        with self._lock:
+            if post_id is None:
+                row = self._conn.execute(
+                    "SELECT post_id FROM urls WHERE url = ? AND status IN (?, ?)",
+                    (url, DONE, DUPLICATE),
+                ).fetchone()
+                if row is None or row["post_id"] is None:
+                    return None
+                post_id = row["post_id"]
+            row = self._conn.execute(
+                "SELECT * FROM posts WHERE post_id = ? AND status = ?", (post_id, DONE)
+            ).fetchone()
+        if row is None or not row["data_path"] or not Path(row["data_path"]).exists():
+            return None
+        return dict(row)
+
+    def url_status(self, url):
+        """Return ``(status, error)`` last recorded for ``url``, or ``(None, None)``."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, error FROM urls WHERE url = ?", (url,)
+            ).fetchone()
+        return (row["status"], row["error"]) if row else (None, None)
+
+    def failed_urls(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT url, category FROM urls WHERE status = ?", (FAILED,)
+            ).fetchall()
+        return [(row["url"], row["category"]) for row in rows]
+
+    def pending_media(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT url, dest, post_id FROM media WHERE status != ?", (DONE,)
+            ).fetchall()
+        return [(row["url"], Path(row["dest"]), row["post_id"]) for row in rows]
+
+    def media_blob(self, url):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT blob FROM media WHERE url = ? AND blob IS NOT NULL LIMIT 1",
+                (url,),
+            ).fetchone()
+        return row["blob"] if row else None
+
+
+__all__ = ["CrawlState", "STATE_FILENAME", "DONE", "FAILED", "PENDING", "DUPLICATE"]